@@ -0,0 +1,131 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Benchmarks of the hot paths of the evaluation (and dataset preparation) on synthetic data."""
+
+import contextlib
+import io
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+
+import trajectory_evaluation.associate as associate
+import trajectory_evaluation.evaluate_ate as evaluate_ate
+from trajectory_evaluation.evaluate import evaluate_run, Dataset
+from interpolate_imu_file import interpolate_imu_file
+from create_python_evaluation_file import load_result_yamls
+from benchmarks.synthetic import SIZES, write_groundtruth_folder, write_result_file, write_run_folder, \
+    write_imu_and_times, write_results_tree
+
+
+def measure(function, repeat):
+    """Run the function repeat times and return the times of all repetitions in seconds and the peak memory in bytes.
+    The memory is measured in an additional run, as tracemalloc slows down the execution."""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return times, peak_memory
+
+
+def get_trajectory_benchmarks(folder: Path, size_name):
+    """Create the data for all benchmarks with one sequence size.
+    :return: dict from benchmark name to function to benchmark.
+    """
+    size = SIZES[size_name]
+    folder.mkdir(parents=True, exist_ok=True)
+    sequence_names = ['seq{}'.format(i) for i in range(3)]
+    groundtruth_folder = folder / 'groundtruth'
+    write_groundtruth_folder(groundtruth_folder, sequence_names, size)
+    gt_file = groundtruth_folder / 'gtFiles' / 'seq0.txt'
+    result_file = folder / 'result.txt'
+    write_result_file(result_file, size)
+    run_folder = folder / 'run'
+    write_run_folder(run_folder, sequence_names, 3, size)
+    imu_file, times_file = write_imu_and_times(folder / 'imu', size)
+
+    gt_list = associate.read_file_list(gt_file)
+    result_list = associate.read_file_list(result_file)
+    matches, _ = associate.associate_fast(gt_list, result_list, 0.05, True)
+    gt_xyz = np.matrix([[float(value) for value in gt_list[a][0:3]] for a, b in matches]).transpose()
+    result_xyz = np.matrix([[float(value) for value in result_list[b][0:3]] for a, b in matches]).transpose()
+
+    return {
+        'read_file_list[{}]'.format(size_name): lambda: associate.read_file_list(gt_file),
+        'associate_fast[{}]'.format(size_name): lambda: associate.associate_fast(gt_list, result_list, 0.05, True),
+        'align[{}]'.format(size_name): lambda: evaluate_ate.align(result_xyz, gt_xyz, 1.02),
+        'compute_ate_fast[{}]'.format(size_name): lambda: evaluate_ate.compute_ate_fast(gt_list, result_file, 1.02,
+                                                                                        0.05, True),
+        'evaluate_run[{}]'.format(size_name): lambda: evaluate_run(run_folder, Dataset.euroc, 3,
+                                                                   always_reevaluate=True,
+                                                                   groundtruth_folder=groundtruth_folder),
+        'interpolate_imu_file[{}]'.format(size_name): lambda: interpolate_imu_file(imu_file, times_file,
+                                                                                   folder / 'imu' / 'imu_interp.txt'),
+    }
+
+
+def get_results_tree_benchmarks(folder: Path, num_runs):
+    results_folder = folder / 'results_{}'.format(num_runs)
+    write_results_tree(results_folder, num_runs)
+    return {'load_result_yamls[{}]'.format(num_runs): lambda: load_result_yamls(results_folder)}
+
+
+def run_benchmarks(folder: Path, sizes, num_runs_list, repeat, name_filter=None):
+    """Run all benchmarks.
+    :param folder: Folder where the synthetic data is written to.
+    :param sizes: Names of the sequence sizes (see SIZES) to run the trajectory benchmarks with.
+    :param num_runs_list: Numbers of results folders to run the results tree benchmarks with.
+    :param repeat: Number of times each benchmark is run (the minimum time is reported).
+    :param name_filter: If not None only benchmarks which contain this string are run.
+    :return: dict from benchmark name to dict with time (minimum in seconds), times (of all repetitions) and
+    peak_memory (bytes).
+    """
+    benchmarks = {}
+    for size_name in sizes:
+        print('Generating data for size {}'.format(size_name))
+        benchmarks.update(get_trajectory_benchmarks(folder / size_name, size_name))
+    for num_runs in num_runs_list:
+        print('Generating {} results folders'.format(num_runs))
+        benchmarks.update(get_results_tree_benchmarks(folder, num_runs))
+
+    results = {}
+    for name, function in benchmarks.items():
+        if not name_filter is None and not name_filter in name:
+            continue
+        times, peak_memory = measure(function, repeat)
+        run_time = min(times)
+        results[name] = {'time': run_time, 'times': times, 'peak_memory': peak_memory}
+        print('{:40} {:10.4f} s {:10.1f} MB'.format(name, run_time, peak_memory / 1e6))
+    return results
@@ -0,0 +1,157 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Generators for synthetic trajectories, IMU data and results folders with the same formats as the real datasets."""
+
+from pathlib import Path
+import numpy as np
+from ruamel.yaml import YAML
+from trajectory_evaluation.evaluate import GROUNDTRUTH_MANIFEST
+
+
+class SequenceSize:
+    """Size of a synthetic sequence."""
+
+    def __init__(self, duration, frame_rate, groundtruth_rate, imu_rate):
+        """
+        :param duration: duration of the sequence in seconds.
+        :param frame_rate: rate of the images (and the estimated trajectory).
+        :param groundtruth_rate: rate of the groundtruth.
+        :param imu_rate: rate of the IMU data.
+        """
+        self.duration = duration
+        self.frame_rate = frame_rate
+        self.groundtruth_rate = groundtruth_rate
+        self.imu_rate = imu_rate
+
+
+# From the size of an average EuRoC sequence up to the longest 4Seasons sequence (city).
+SIZES = {
+    'euroc': SequenceSize(130, 20, 200, 200),
+    'tumvi': SequenceSize(600, 20, 120, 200),
+    '4seasons_city': SequenceSize(1000, 30, 30, 2000),
+}
+START_TIME = 1403636579.0  # Timestamps are in the same range as for the real datasets.
+
+
+def get_times(duration, rate):
+    return START_TIME + np.arange(int(duration * rate)) / rate
+
+
+def get_positions(times):
+    """Smooth synthetic trajectory."""
+    relative_times = times - START_TIME
+    return np.stack([10 * np.sin(0.05 * relative_times), 5 * np.sin(0.11 * relative_times + 1.0),
+                     np.sin(0.3 * relative_times)], axis=1)
+
+
+def write_trajectory(filename, times, positions):
+    """Write trajectory with identity rotations in the format timestamp x y z qx qy qz qw."""
+    data = np.concatenate([times[:, None], positions, np.zeros((len(times), 3)), np.ones((len(times), 1))], axis=1)
+    np.savetxt(filename, data, fmt=['%.9f'] + ['%.9f'] * 3 + ['%d'] * 4)
+
+
+def write_times_file(filename, times):
+    with open(filename, 'w') as times_file:
+        times_file.write('# filename timestamp[s]\n')
+        times_file.writelines('{} {:.9f}\n'.format(int(round(timestamp * 1e9)), timestamp) for timestamp in times)
+
+
+def write_groundtruth_folder(folder: Path, sequence_names, size: SequenceSize):
+    """Write groundtruth files and a manifest which can be passed to evaluate_run as groundtruth_folder."""
+    (folder / 'gtFiles').mkdir(parents=True, exist_ok=True)
+    (folder / 'timesFiles').mkdir(parents=True, exist_ok=True)
+    gt_times = get_times(size.duration, size.groundtruth_rate)
+    for name in sequence_names:
+        write_trajectory(folder / 'gtFiles' / '{}.txt'.format(name), gt_times, get_positions(gt_times))
+        write_times_file(folder / 'timesFiles' / '{}.txt'.format(name), get_times(size.duration, size.frame_rate))
+    manifest = {'time_threshold': 0.8,
+                'sequences': [{'folder': name, 'start_time': 0, 'end_time': None} for name in sequence_names]}
+    with open(folder / GROUNDTRUTH_MANIFEST, 'w') as manifest_file:
+        YAML().dump(manifest, manifest_file)
+
+
+def write_result_file(filename, size: SequenceSize, seed=0, scale=1.02):
+    """Write an estimated trajectory (groundtruth plus noise with a wrong scale)."""
+    random = np.random.default_rng(seed)
+    times = get_times(size.duration, size.frame_rate)
+    positions = (get_positions(times) + random.normal(scale=0.05, size=(len(times), 3))) / scale
+    write_trajectory(filename, times, positions)
+
+
+def write_run_folder(run_folder: Path, sequence_names, num_iter, size: SequenceSize):
+    """Write a run folder in the format created by run_dmvio.py, which can be evaluated with evaluate_run."""
+    (run_folder / 'results').mkdir(parents=True, exist_ok=True)
+    (run_folder / 'setup').mkdir(exist_ok=True)
+    for i, name in enumerate(sequence_names):
+        for iter in range(num_iter):
+            run_name = '{}_{}'.format(name, iter)
+            write_result_file(run_folder / 'results' / '{}.txt'.format(run_name), size, seed=i * num_iter + iter)
+            (run_folder / run_name).mkdir(exist_ok=True)
+            with open(run_folder / run_name / 'scalesdso.txt', 'w') as scale_file:
+                scale_file.write('{:.9f} 1.02\n'.format(START_TIME + size.duration))
+
+
+def write_imu_and_times(folder: Path, size: SequenceSize):
+    """Write imu.txt (nanosecond timestamps) and times.txt as used by interpolate_imu_file.
+    :return: paths of the IMU and times files.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    imu_times = get_times(size.duration, size.imu_rate)
+    imu_timestamps = np.round((imu_times - START_TIME) * 1e9).astype(np.int64) + int(START_TIME * 1e9)
+    measurements = np.random.default_rng(0).normal(size=(len(imu_times), 6))
+    with open(folder / 'imu.txt', 'w') as imu_file:
+        imu_file.writelines('{} {:.9f} {:.9f} {:.9f} {:.9f} {:.9f} {:.9f}\n'.format(timestamp, *measurement) for
+                            timestamp, measurement in zip(imu_timestamps, measurements))
+    frame_times = get_times(size.duration, size.frame_rate)
+    with open(folder / 'times.txt', 'w') as times_file:
+        times_file.writelines('{} {:.9f}\n'.format(int(START_TIME * 1e9) + int(round((timestamp - START_TIME) * 1e9)),
+                                                   timestamp) for timestamp in frame_times)
+    return folder / 'imu.txt', folder / 'times.txt'
+
+
+def write_results_tree(folder: Path, num_runs):
+    """Write results folders with setup.yaml files as created by run_dmvio.py (without actual results)."""
+    yaml = YAML()
+    for i in range(num_runs):
+        setup_folder = folder / 'dmvioresult-euroc-{:05d}'.format(i) / 'setup'
+        setup_folder.mkdir(parents=True, exist_ok=True)
+        setup = {'name': 'dmvioresult', 'dataset': 'euroc', 'build_type': 'RelWithDebInfo', 'num_iter': 10,
+                 'only_seq': None, 'results_name': 'dmvioresult-euroc-{:05d}'.format(i), 'config_name': 'benchmark',
+                 'realtime': False, 'temporary': False, 'noimu': False, 'quiet': True, 'output_type': 'null',
+                 'withgui': False, 'custom_dmvio_args': '', 'dmvio_settings': 'euroc.yaml', 'gdb': False,
+                 'git_hash': '{:040x}'.format(i), 'commit_message': 'Benchmark commit {}'.format(i),
+                 'diff_empty': True, 'eval_tool_command': 'run_dmvio.py --dataset=euroc'}
+        for command_index in range(110):
+            setup['command_{}'.format(command_index)] = 'dmvio_dataset files=./data calib=./camera.txt mode=1 ' \
+                                                        'preset=0 nogui=1 useimu=1 quiet=1'
+            setup['cwd{}'.format(command_index)] = '/path/to/euroc/MH_01_easy/mav0/cam0'
+        with open(setup_folder / 'setup.yaml', 'w') as setup_file:
+            yaml.dump(setup, setup_file)
+        if i % 10 != 0:
+            (setup_folder / 'Finished.txt').write_text('Finished\n')
@@ -0,0 +1,203 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+import shutil
+import sys
+import numpy as np
+from pathlib import Path
+from ruamel.yaml import YAML
+from utils.config_utils import read_config, add_dataset_variant
+from utils.preflight import parse_dataset_args, SequencePaths
+from trajectory_evaluation.evaluate import get_dataset, get_groundtruth_data, GROUNDTRUTH_MANIFEST
+
+# IMU and groundtruth data is kept for this many seconds before the first and after the last frame.
+MARGIN_SECONDS = 1.0
+
+
+def get_timestamp(line):
+    """Timestamp in seconds of a line in an IMU / groundtruth / times file (which can store seconds or nanoseconds)."""
+    timestamp = float(line.replace(',', ' ').split()[0])
+    return timestamp * 1e-9 if timestamp > 1e12 else timestamp
+
+
+def write_lines_in_time_window(input_file, output_file, start_time, end_time, column=0):
+    """Copy all lines of the file within the time window (and all comments)."""
+    with open(input_file) as infile:
+        lines = infile.readlines()
+    with open(output_file, 'w') as outfile:
+        outfile.writelines(line for line in lines if line.startswith('#') or line.strip() == '' or
+                           start_time <= get_timestamp(' '.join(line.split()[column:])) <= end_time)
+
+
+def get_trajectory_length(groundtruth_file, start_time, end_time):
+    """Length (in meters) of the groundtruth trajectory within the time window (entries without position are
+    skipped)."""
+    positions = []
+    with open(groundtruth_file) as infile:
+        for line in infile:
+            if line.startswith('#') or line.strip() == '':
+                continue
+            values = line.replace(',', ' ').split()
+            if start_time <= get_timestamp(line) <= end_time:
+                positions.append([float(value) for value in values[1:4]])
+    positions = np.array(positions).reshape(-1, 3)
+    positions = positions[np.isfinite(positions).all(axis=1)]
+    return float(np.linalg.norm(np.diff(positions, axis=0), axis=1).sum())
+
+
+def link(source: Path, target: Path):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.is_symlink() or target.exists():
+        target.unlink()
+    target.symlink_to(source.resolve())
+
+
+def create_mini_sequence(paths: SequencePaths, sequence_folder: Path, target_sequence_folder: Path, start, num_frames):
+    """Create a trimmed copy of the sequence with symlinked images and sliced times and IMU files.
+    :return: first and last timestamp of the trimmed sequence.
+    """
+
+    def get_target(path: Path):
+        return target_sequence_folder / Path(os.path.normpath(path)).relative_to(sequence_folder)
+
+    image_folder = get_target(paths.images)
+    if image_folder.exists():
+        shutil.rmtree(image_folder)
+    image_folder.mkdir(parents=True)
+    images = sorted(entry.name for entry in os.scandir(paths.images) if entry.is_file())[start:start + num_frames]
+    for image in images:
+        (image_folder / image).symlink_to((paths.images / image).resolve())
+
+    # The times file has one line per image (in the same order).
+    with open(paths.times) as times_file:
+        times_lines = [line for line in times_file if not line.startswith('#') and line.strip() != '']
+    times_lines = times_lines[start:start + len(images)]
+    with open(get_target(paths.times), 'w') as times_file:
+        times_file.writelines(times_lines)
+    start_time = get_timestamp(times_lines[0].split()[1])
+    end_time = get_timestamp(times_lines[-1].split()[1])
+
+    if paths.imu.exists():
+        write_lines_in_time_window(paths.imu, get_target(paths.imu), start_time - MARGIN_SECONDS,
+                                   end_time + MARGIN_SECONDS)
+    # Files outside of the sequence folder (e.g. calibration files in DM-VIO) are referenced with absolute paths.
+    for path in paths.other_files.values():
+        if sequence_folder in Path(os.path.normpath(path)).parents and path.exists():
+            link(path, get_target(path))
+    return start_time, end_time
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Create a mini dataset with trimmed copies of the sequences of a dataset (images are symlinked) '
+                    'together with the matching groundtruth, for quick smoke tests of the full pipeline. The dataset '
+                    'is added to the configs, e.g. as euroc_mini.')
+    parser.add_argument('--dataset', type=str, default='euroc', help='Dataset to create the mini dataset from.')
+    parser.add_argument('--folder', type=str, required=True, help='Folder where the mini dataset will be created.')
+    parser.add_argument('--sequences', type=int, nargs='+', default=None,
+                        help='Indices of the sequences to use (default: all).')
+    parser.add_argument('--num_frames', type=int, default=300, help='Number of frames of each trimmed sequence.')
+    parser.add_argument('--name', type=str, default=None, help='Name of the new dataset (default: <dataset>_mini).')
+    parser.add_argument('--config', type=str, default=None,
+                        help='Config to use (if not specified the config in defaultconfig.txt is used).')
+    args = parser.parse_args()
+
+    yaml = YAML()
+    config, config_name, general_config, all_configs = read_config(args.config, yaml)
+    if config is None:
+        print('Error: There is no default config for this machine yet. Have you called create_config.py yet?')
+        sys.exit(1)
+    dataset = args.dataset
+    if not dataset in config or not 'dataset_path' in config[dataset]:
+        print('Error: No dataset_path for {} in the config {}.'.format(dataset, config_name))
+        sys.exit(1)
+    dataset_config = general_config[dataset]
+    dataset_path = Path(config[dataset]['dataset_path'])
+    target_folder = Path(args.folder).resolve()
+    name = dataset + '_mini' if args.name is None else args.name
+
+    folders = dataset_config['folder_names']
+    indices = range(len(folders)) if args.sequences is None else args.sequences
+    start_times = dataset_config['start_times'] if 'start_times' in dataset_config else [0] * len(folders)
+    dataset_args = parse_dataset_args(dataset_config['dataset_args'])
+    res_prefix = dataset_config['res_prefix']
+
+    groundtruth_sequences, time_threshold = get_groundtruth_data(get_dataset(dataset))
+    groundtruth_sequences = {sequence.folder: sequence for sequence in groundtruth_sequences}
+    groundtruth_folder = target_folder / 'groundtruth'
+    (groundtruth_folder / 'gtFiles').mkdir(parents=True, exist_ok=True)
+    (groundtruth_folder / 'timesFiles').mkdir(parents=True, exist_ok=True)
+
+    manifest_sequences = []
+    for i in indices:
+        folder = folders[i]
+        print('Creating mini sequence for {}'.format(folder))
+        paths = SequencePaths(dataset_path / folder / dataset_config['afterpath'], dataset_args)
+        num_frames = args.num_frames
+        if 'end_times' in dataset_config:
+            num_frames = min(num_frames, dataset_config['end_times'][i] - start_times[i] + 1)
+        start_time, end_time = create_mini_sequence(paths, dataset_path / folder, target_folder / folder,
+                                                    start_times[i], num_frames)
+
+        # Groundtruth for the trimmed sequence.
+        groundtruth = groundtruth_sequences[res_prefix + folder]
+        gt_name = '{}.txt'.format(res_prefix + folder)
+        write_lines_in_time_window(groundtruth.times_file, groundtruth_folder / 'timesFiles' / gt_name, start_time,
+                                   end_time, column=1)
+        write_lines_in_time_window(groundtruth.groundtruth_file, groundtruth_folder / 'gtFiles' / gt_name,
+                                   start_time - MARGIN_SECONDS, end_time + MARGIN_SECONDS)
+        # Stored so that drift can be normalized by the length of the trimmed trajectory (see plot_utils).
+        trajectory_length = get_trajectory_length(groundtruth.groundtruth_file, start_time, end_time)
+        manifest_sequences.append({'folder': res_prefix + folder, 'start_time': 0, 'end_time': None,
+                                   'trajectory_length': trajectory_length})
+
+    manifest = {'dataset': dataset, 'num_frames': args.num_frames, 'time_threshold': time_threshold,
+                'sequences': manifest_sequences}
+    with open(groundtruth_folder / GROUNDTRUTH_MANIFEST, 'w') as manifest_file:
+        YAML().dump(manifest, manifest_file)
+
+    # Add the mini dataset to the configs.
+    add_dataset_variant(config, general_config, dataset, name, dataset_config['dataset_args'])
+    mini_config = general_config[name]
+    mini_config['folder_names'] = [folders[i] for i in indices]
+    mini_config['start_times'] = [0] * len(indices)
+    if 'end_times' in mini_config:
+        del mini_config['end_times']
+    mini_config['default_iter'] = 1
+    # Paths are machine-specific, so they are stored in the machine config (which run_dmvio.py merges in).
+    config[name]['dataset_path'] = str(target_folder)
+    config[name]['groundtruth_folder'] = str(groundtruth_folder)
+    print('Saving updated config, run with --dataset={} to use the mini dataset.'.format(name))
+    with open('configs.yaml', 'w') as config_file:
+        yaml.dump(all_configs, config_file)
+
+
+if __name__ == '__main__':
+    main()
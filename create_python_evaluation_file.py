@@ -27,13 +27,15 @@
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import argparse
+import re
 from utils.config_utils import read_config, read_all_configs
-import subprocess
 from pathlib import Path
 from ruamel.yaml import YAML
 from datetime import datetime
 import sys
 from tqdm import tqdm
+import utils.profiling as profiling
+from utils.result_sync import pull_results
 
 
 class ResultsSorter:
@@ -60,7 +62,7 @@ class ResultsSorter:
             raise ValueError("Key does not exist.")
 
 
-def create_evaluation_file(config_name, outfile, no_download, sorter, filters):
+def create_evaluation_file(config_name, outfile, no_download, sorter, filters, full_download=False):
     """ Create a python evaluation file with all results from the results_folder defined in the config with the passed
     name.
     :param config_name: Name of the configuration (in configs.yaml) to use.
@@ -69,6 +71,8 @@ def create_evaluation_file(config_name, outfile, no_download, sorter, filters):
     set in the config).
     :param sorter: Used to sort the results before writing them to file.
     :param filters: List of filters which are used to filter the results written to the evaluation file.
+    :param full_download: If True all results are synchronized with the central server, otherwise only the ones which
+    have not been downloaded completely before.
     """
     # Read config.
     config, config_name, general_config, _ = read_config(config_name)
@@ -81,31 +85,33 @@ def create_evaluation_file(config_name, outfile, no_download, sorter, filters):
     # Download all results from central machine.
     if not no_download:
         if 'rsync_command' in config:
-            rsync_command = config['rsync_command']
-            rsync_target = config['rsync_command_target']
-            full_rsync_command = '{} {}/* {}/'.format(rsync_command, rsync_target, general_save_folder)
-            print(full_rsync_command)
-            subprocess.run(full_rsync_command, shell=True)
+            with profiling.stage('download'):
+                pull_results(config['rsync_command'], config['rsync_command_target'], Path(general_save_folder),
+                             full=full_download)
 
     # Load all results folders and read yaml files.
-    all_results = load_result_yamls(Path(general_save_folder))
+    with profiling.stage('load_result_yamls'):
+        all_results = load_result_yamls(Path(general_save_folder))
 
     # Filter and sort results based on parameters
-    all_results.sort(key=sorter)
+    with profiling.stage('sort'):
+        all_results.sort(key=sorter)
 
     print('There are {} results before filtering.'.format(len(all_results)))
 
     # Apply filters.
-    filtered = all_results
-    for filter_fun in filters:
-        filtered = filter(filter_fun, filtered)
-    filtered_results = list(filtered)
+    with profiling.stage('filter'):
+        filtered = all_results
+        for filter_fun in filters:
+            filtered = filter(filter_fun, filtered)
+        filtered_results = list(filtered)
 
     print('There are {} results after filtering.'.format(len(filtered_results)))
 
     # Generate Python evaluation script.
     out_path = Path(outfile)
-    write_python_eval_file(filtered_results, out_path)
+    with profiling.stage('write_python_eval_file'):
+        write_python_eval_file(filtered_results, out_path)
 
     return all_results
 
@@ -115,13 +121,20 @@ def load_result_yamls(result_folder: Path):
     yaml = YAML(typ='safe')
     all_results = []
     for child in result_folder.iterdir():
+        if not child.is_dir():
+            continue  # e.g. the manifest of downloaded results.
         yaml_file = child / 'setup' / 'setup.yaml'
         finished_file = child / 'setup' / 'Finished.txt'
         if not yaml_file.exists():
             print('WARNING: Skipping {}, because the setup file does not exist'.format(child))
             continue
-        with open(yaml_file, 'r') as yaml_file_handle:
+        with open(yaml_file, 'r') as yaml_file_handle, profiling.stage('parse_yaml'):
             settings = yaml.load(yaml_file_handle)
+        profiling.count('setup_yamls')
+        if settings.get('sweep_index', False):
+            continue  # Only contains the index of a sweep, its configurations are separate results.
+        if 'merged_into' in settings:
+            continue  # Shard which has been merged with merge_shards.py, the merged result contains all its runs.
         finished = finished_file.exists()
         settings['finished'] = finished
         all_results.append((child, settings))
@@ -145,9 +158,10 @@ def write_python_eval_file(results, outfilename):
         outfile.write(autogen_string + '\n')
 
         # Init variables.
-        outfile.write('from trajectory_evaluation.evaluate import evaluate_run, Dataset\n'
+        outfile.write('from trajectory_evaluation.evaluate import evaluate_run, lazy_evaluate_run, Dataset\n'
                       'from pathlib import Path\n'
-                      'from trajectory_evaluation.plots import square_plot, results_table, line_plot\n')
+                      'from trajectory_evaluation.plots import square_plot, results_table, line_plot\n'
+                      'from trajectory_evaluation.statistics import compare_results\n')
 
         all_configs = read_all_configs()
 
@@ -221,6 +235,8 @@ def write_python_eval_file(results, outfilename):
                 res_name = 'orb' + res_name
             elif is_basalt_result:
                 res_name = 'basalt' + res_name
+            # Used in variable names, so e.g. hyphens in the name of a result are replaced.
+            res_name = re.sub(r'\W', '_', res_name)
             comment = custom_comment + diff_string + settings_string + custom_args_string + ' ' + \
                       commit_message_first_line
             visname = res_name + custom_comment + ':' + output_type_string + quiet_string + withgui_string + \
@@ -240,13 +256,22 @@ def write_python_eval_file(results, outfilename):
             if not prev_setup is None and setup['git_hash'] != prev_setup['git_hash']:
                 outfile.write('\n')
 
+            # Derived datasets (e.g. mini datasets) have their own groundtruth.
+            extra_args_string = ''
+            if 'groundtruth_folder' in setup:
+                extra_args_string = ", groundtruth_folder='{}'".format(setup['groundtruth_folder'])
+            # With adaptive iterations the number of iterations differs per sequence.
+            if 'iterations_per_sequence' in setup:
+                extra_args_string += ', iterations_per_sequence={}'.format(dict(setup['iterations_per_sequence']))
+
             outfile.write("#{}\n".format(comment))
             outfile.write(
-                "res{}, gtscale_{} = evaluate_run(Path(folder) / '{}', {}, {}, '{}')\n".format(res_name, res_name,
-                                                                                               folder_path.name,
-                                                                                               dataset_arg,
-                                                                                               setup['num_iter'],
-                                                                                               visname))
+                "res{}, gtscale_{} = lazy_evaluate_run(Path(folder) / '{}', {}, {}, '{}'{})\n".format(res_name, res_name,
+                                                                                                 folder_path.name,
+                                                                                                 dataset_arg,
+                                                                                                 setup['num_iter'],
+                                                                                                 visname,
+                                                                                                 extra_args_string))
 
             prev_setup = setup
 
@@ -281,12 +306,17 @@ def main():
                              'in configs.yaml')
     parser.add_argument('--no_download', default=False, action='store_true',
                         help="Don't download from central storage before creating the evaluation file.")
+    parser.add_argument('--full_download', default=False, action='store_true',
+                        help="Synchronize all results with central storage, not only the ones which have not been "
+                             "downloaded completely before.")
     parser.add_argument('--evaluate', default=False, action='store_true',
                         help="If passed this script will compute all results (which can take a while). Otherwise "
                              "results will only be computed on demand when using the written evaluation script.")
     parser.add_argument('--force_evaluate', default=False, action='store_true',
                         help="Re-evaluate all results even if they have already been evaluated before")
+    profiling.add_profile_argument(parser)
     args = parser.parse_args()
+    profiling.enable_from_args(args)
 
     sorter = ResultsSorter(use_commit_date=True)  # You can first use commit date for sorting or just the run date.
     finished_filter = lambda pair: pair[1]['finished'] is True
@@ -295,7 +325,8 @@ def main():
     date = datetime.strptime('03.12.20 17:25:00', '%d.%m.%y %H:%M:%S')
     date_filter = lambda pair: pair[1]['date_run'] > date
 
-    all_results = create_evaluation_file(args.config, args.outfile, args.no_download, sorter, [finished_filter])
+    all_results = create_evaluation_file(args.config, args.outfile, args.no_download, sorter, [finished_filter],
+                                         args.full_download)
 
     # Example: Use this to save only full evaluations.
     # all_results = create_evaluation_file(args.config, 'evaluations_only_full.py', True, sorter,
@@ -305,7 +336,8 @@ def main():
         print("Pre-evaluating all results which have not been evaluated yet.")
         for pair in tqdm(all_results, leave=True):
             from trajectory_evaluation.evaluate import evaluate_with_config
-            result, result_gt_scaled = evaluate_with_config(pair, args.force_evaluate)
+            with profiling.stage('evaluate'):
+                result, result_gt_scaled = evaluate_with_config(pair, args.force_evaluate)
 
 
 if __name__ == "__main__":
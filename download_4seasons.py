@@ -26,13 +26,13 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import subprocess
 from pathlib import Path
-from tqdm import tqdm
 from ruamel.yaml import YAML
 from utils.config_utils import read_config, replace_dataset_in_config, shall_replace_dataset_in_config
 import argparse
 from utils.prepare_4seasons import prepare4seasons
+from utils.download_utils import DownloadTask, download_files, exit_on_failed_downloads
+from utils.dataset_mirror import get_mirror
 
 
 def main():
@@ -53,6 +53,18 @@ def main():
     parser.add_argument('--accept_license', default=False, action='store_true',
                         help='Accept license of 4seasons dataset (for machines with no interactive commandline input. '
                              'Only select if you agree to the terms of the dataset!')
+    parser.add_argument('--components', type=str, nargs='+', default=['imu_gnss', 'stereo_images_undistorted'],
+                        choices=['imu_gnss', 'stereo_images_undistorted', 'reference_poses', 'point_clouds'],
+                        help='Parts of each recording to download. By default only the parts needed for running and '
+                             'evaluating DM-VIO are downloaded.')
+    parser.add_argument('--only_cam0', default=False, action='store_true',
+                        help="Only download the images of cam0 (DM-VIO is monocular so it doesn't need cam1).")
+    parser.add_argument('--num_parallel', default=4, type=int, help='Number of files to download in parallel.')
+    parser.add_argument('--mirror', type=str, default=None,
+                        help='Folder of a dataset mirror (e.g. on a NAS), where archives are looked up before they are '
+                             'downloaded and stored after downloading. Default: dataset_mirror in the config.')
+    parser.add_argument('--base_url', type=str, default='https://vision.cs.tum.edu/webshare/g/4seasons-dataset',
+                        help='URL to download the dataset from (can be changed e.g. to use a local mirror).')
     args = parser.parse_args()
 
     yaml = YAML()
@@ -60,6 +72,7 @@ def main():
     if config is None:
         print('Error: There is no default config for this machine yet. Have you called create_config.py yet?')
         return
+    mirror = get_mirror(config, args.mirror)
 
     target_folder = Path(args.folder)
 
@@ -106,9 +119,8 @@ def main():
     # First download calibration
     calibration_folder = Path(target_folder) / 'calibration'
     if not (calibration_folder.exists()):
-        subprocess.run('wget https://vision.cs.tum.edu/webshare/g/4seasons-dataset/calibration/calibration.zip',
-                       cwd=target_folder, shell=True)
-        subprocess.run('unzip calibration.zip', cwd=target_folder, shell=True)
+        exit_on_failed_downloads(download_files([DownloadTask('{}/calibration/calibration.zip'.format(args.base_url),
+                                                              extract_to=target_folder)], mirror=mirror))
 
     # We rename the sequence from 'recording_date' to 'name_date'
     folders = [('office', '2021-01-07_12-04-03'),
@@ -157,30 +169,48 @@ def main():
         with open('configs.yaml', 'w') as config_file:
             yaml.dump(all_configs, config_file)
 
-    command_general = "wget https://vision.cs.tum.edu/webshare/g/4seasons-dataset/dataset/"
-
     # -------------------- Download! --------------------
+    def get_marker_names(file_name, only_cam0):
+        # Markers so that an interrupted download of a sequence does not fetch the same archive again. A full download
+        # of the images also counts as done when only cam0 is requested.
+        full_marker = '.{}.done'.format(file_name)
+        if only_cam0 and 'stereo_images' in file_name:
+            return ['.{}.cam0.done'.format(file_name), full_marker]
+        return [full_marker]
+
+    def mark_done(task):
+        file_name = task.url.split('/')[-1]
+        (task.extract_to / get_marker_names(file_name, task.member_filter is not None)[0]).touch()
+
+    def is_cam0_or_not_image(path):
+        return not (len(path.parts) >= 2 and path.parts[0] == 'undistorted_images' and path.parts[1] == 'cam1')
+
     if not args.no_download:
-        for name, date in tqdm(folders):
+        tasks = []
+        for name, date in folders:
             down_name = 'recording_' + date
             new_name = name + '_' + date
 
             targ_folder = Path(target_folder) / new_name
-            if targ_folder.exists():
+            # Folders without any download markers or leftover archives have been downloaded completely by an older
+            # version of this script.
+            if targ_folder.exists() and any(targ_folder.iterdir()) and not any(
+                    file.suffix in ['.zip', '.done'] for file in targ_folder.iterdir()):
                 print('Skipping: {}'.format(new_name))
                 continue
-            targ_folder.mkdir()
-
-            postfixes = ['_imu_gnss.zip', '_stereo_images_undistorted.zip', '_reference_poses.zip', '_point_clouds.zip']
-            for postfix in postfixes:
-                file_name = down_name + postfix
-                command1 = '{}{}/{}'.format(command_general, down_name, file_name)
-                subprocess.run(command1, cwd=targ_folder, shell=True)
-                subprocess.run('unzip {}'.format(file_name), cwd=targ_folder, shell=True)
-
-                subprocess.run('mv {}/* .'.format(down_name), cwd=targ_folder, shell=True)
-                Path(targ_folder / down_name).rmdir()
-                subprocess.run('rm ' + str(Path(targ_folder / file_name)), cwd=targ_folder, shell=True)
+            targ_folder.mkdir(exist_ok=True)
+
+            for component in args.components:
+                file_name = '{}_{}.zip'.format(down_name, component)
+                only_cam0 = args.only_cam0 and component == 'stereo_images_undistorted'
+                if any((targ_folder / marker).exists() for marker in get_marker_names(file_name, only_cam0)):
+                    continue
+                url = '{}/dataset/{}/{}'.format(args.base_url, down_name, file_name)
+                # Each archive contains a folder recording_date, the content of which is extracted directly into the
+                # renamed sequence folder while downloading.
+                tasks.append(DownloadTask(url, extract_to=targ_folder, strip_components=1, on_finished=mark_done,
+                                          member_filter=is_cam0_or_not_image if only_cam0 else None))
+        exit_on_failed_downloads(download_files(tasks, args.num_parallel, mirror=mirror))
 
     # -------------------- Prepare dataset (interpolate IMU files, convert groundtruth, etc.)! --------------------
     groundtruth_save_folder = target_folder / "groundtruth"
@@ -32,6 +32,8 @@ from pathlib import Path
 from ruamel.yaml import YAML
 
 from utils.config_utils import read_config, replace_dataset_in_config, shall_replace_dataset_in_config
+from utils.download_utils import DownloadTask, download_files, exit_on_failed_downloads
+from utils.dataset_mirror import get_mirror
 
 
 def main():
@@ -42,6 +44,13 @@ def main():
     parser.add_argument('--folder', type=str, help='Location where the dataset shall be downloaded to.', required=True)
     parser.add_argument('--only_seq', default=None, type=int,
                         help='Only download one sequence (with the given index starting with 0).')
+    parser.add_argument('--num_parallel', default=4, type=int, help='Number of files to download in parallel.')
+    parser.add_argument('--mirror', type=str, default=None,
+                        help='Folder of a dataset mirror (e.g. on a NAS), where archives are looked up before they are '
+                             'downloaded and stored after downloading. Default: dataset_mirror in the config.')
+    parser.add_argument('--base_url', type=str,
+                        default='http://robotics.ethz.ch/~asl-datasets/ijrr_euroc_mav_dataset',
+                        help='URL to download the dataset from (can be changed e.g. to use a local mirror).')
     args = parser.parse_args()
 
     yaml = YAML()
@@ -49,6 +58,7 @@ def main():
     if config is None:
         print('Error: There is no default config for this machine yet. Have you called create_config.py yet?')
         return
+    mirror = get_mirror(config, args.mirror)
 
     print(
         "Please check the website of the EuRoC dataset for license information: "
@@ -81,15 +91,15 @@ def main():
             yaml.dump(all_configs, config_file)
 
     # -------------------- Download! --------------------
-    general_command = 'wget http://robotics.ethz.ch/~asl-datasets/ijrr_euroc_mav_dataset'
+    # The archives are extracted while they are downloaded, so they are never stored on disk.
+    tasks = []
     for i, folder in enumerate(folders):
         if (target_folder / folder).exists():
             print('Folder exists --> skipping sequence {}'.format(folder))
             continue
-        command = '{}/{}/{}/{}.zip'.format(general_command, prefixes[i], folder, folder)
-        subprocess.run(command, cwd=target_folder, shell=True)
-        # unpack
-        subprocess.run('unzip {}.zip -d {}'.format(folder, folder), cwd=target_folder, shell=True)
+        url = '{}/{}/{}/{}.zip'.format(args.base_url, prefixes[i], folder, folder)
+        tasks.append(DownloadTask(url, extract_to=target_folder / folder))
+    exit_on_failed_downloads(download_files(tasks, args.num_parallel, mirror=mirror))
 
     # -------------------- Prepare dataset --------------------
     # We need at least times.txt and imu.txt, both in mav0/cam0
@@ -26,12 +26,13 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import subprocess
 import argparse
 from pathlib import Path
 from ruamel.yaml import YAML
 
 from utils.config_utils import read_config, replace_dataset_in_config, shall_replace_dataset_in_config
+from utils.download_utils import DownloadTask, download_files, exit_on_failed_downloads
+from utils.dataset_mirror import get_mirror
 
 
 def main():
@@ -42,6 +43,12 @@ def main():
     parser.add_argument('--folder', type=str, help='Location where the dataset shall be downloaded to.', required=True)
     parser.add_argument('--only_seq', default=None, type=int,
                         help='Only download one sequence (with the given index starting with 0).')
+    parser.add_argument('--num_parallel', default=4, type=int, help='Number of files to download in parallel.')
+    parser.add_argument('--mirror', type=str, default=None,
+                        help='Folder of a dataset mirror (e.g. on a NAS), where archives are looked up before they are '
+                             'downloaded and stored after downloading. Default: dataset_mirror in the config.')
+    parser.add_argument('--base_url', type=str, default='https://cdn3.vision.in.tum.de/tumvi/exported/euroc/512_16',
+                        help='URL to download the dataset from (can be changed e.g. to use a local mirror).')
     args = parser.parse_args()
 
     yaml = YAML()
@@ -49,6 +56,7 @@ def main():
     if config is None:
         print('Error: There is no default config for this machine yet. Have you called create_config.py yet?')
         return
+    mirror = get_mirror(config, args.mirror)
 
     print(
         "Please note: The TUM-VI dataset was created by D. Schubert, T. Goll, N. Demmel, V. Usenko, J. Stueckler and "
@@ -103,23 +111,16 @@ def main():
         with open('configs.yaml', 'w') as config_file:
             yaml.dump(all_configs, config_file)
 
-    command_general = 'wget -4 https://cdn3.vision.in.tum.de/tumvi/exported/euroc/512_16/'
+    # The archives are extracted while they are downloaded (and the md5 sum is computed on the fly), so they are never
+    # stored on disk.
+    tasks = []
     for folder in folders:
         if (target_folder / folder).exists():
             print('Folder exists --> skipping sequence {}'.format(folder))
             continue
-        command = '{}{}.tar'.format(command_general, folder)
-        subprocess.run(command, cwd=target_folder, shell=True)
-        subprocess.run(command + '.md5', cwd=target_folder, shell=True)
-
-    # Check md5 sums:
-    subprocess.run('md5sum -c *.md5', cwd=target_folder, shell=True)
-
-    # Unpack all
-    for folder in folders:
-        if (target_folder / folder).exists():
-            continue
-        subprocess.run('tar -xvf {}.tar'.format(folder), cwd=target_folder, shell=True)
+        url = '{}/{}.tar'.format(args.base_url, folder)
+        tasks.append(DownloadTask(url, md5_url=url + '.md5', extract_to=target_folder / folder, strip_components=1))
+    exit_on_failed_downloads(download_files(tasks, args.num_parallel, mirror=mirror))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,324 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import http.client
+import json
+import math
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingUnixStreamServer
+from ruamel.yaml import YAML
+from utils.config_utils import read_config
+from utils.inotify import Inotify
+from trajectory_evaluation.evaluate import evaluate_with_config
+
+INDEX_FILENAME = '.results_index.json'
+
+
+def to_json_list(array):
+    """Convert numpy array to list, replacing inf (failed runs) and nan with None, which JSON doesn't support."""
+    return [None if isinstance(value, float) and not math.isfinite(value) else value for value in array.tolist()]
+
+
+def get_summary(folder: Path, setup, result, result_gt_scale):
+    """Summary metrics of an evaluated run which are stored in the results index."""
+    finite_median_errors = result.median_errors[result.median_errors != float('inf')]
+    return {
+        'folder': folder.name,
+        'dataset': setup['dataset'],
+        'name': setup['name'],
+        'num_iter': setup['num_iter'],
+        'date_run': str(setup['date_run']) if 'date_run' in setup else None,
+        'commit_message': setup['commit_message'].split('\n')[0] if 'commit_message' in setup else None,
+        'custom_dmvio_args': setup['custom_dmvio_args'] if 'custom_dmvio_args' in setup else None,
+        'evaluated': datetime.now().isoformat(timespec='seconds'),
+        'folder_names': result.folder_names,
+        'num_failed': int((result.errors == float('inf')).sum()),
+        'mean_median_error': float(finite_median_errors.mean()) if len(
+            finite_median_errors) == len(result.median_errors) else None,
+        'median_errors': to_json_list(result.median_errors),
+        'median_scale_errors': to_json_list(result.median_scale_errors),
+        'median_errors_gt_scale': to_json_list(result_gt_scale.median_errors),
+        'errors': [to_json_list(row) for row in result.errors],
+        'run_mtime': get_run_mtime(folder),
+    }
+
+
+def get_run_mtime(folder: Path):
+    """Latest modification time of the run folder and its sub folders, which changes when files in them are added,
+    removed or replaced (e.g. when a run is repeated or its setup is fixed)."""
+    return max([folder.stat().st_mtime] + [entry.stat().st_mtime for entry in os.scandir(folder) if entry.is_dir()])
+
+
+def get_failure(folder: Path, error):
+    """Entry in the results index for a run which could not be evaluated."""
+    return {
+        'folder': folder.name,
+        'error': str(error),
+        'evaluated': datetime.now().isoformat(timespec='seconds'),
+        'run_mtime': get_run_mtime(folder),
+    }
+
+
+class ResultsIndex:
+    """Summary metrics of all evaluated runs in a results folder, saved as JSON in the results folder.
+    Runs which could not be evaluated are stored with the error (see get_failure)."""
+
+    def __init__(self, results_folder: Path):
+        self.file = results_folder / INDEX_FILENAME
+        self.lock = threading.Lock()
+        self.runs = {}
+        if self.file.exists():
+            with open(self.file) as index_file:
+                self.runs = json.load(index_file)
+
+    def add(self, summary):
+        with self.lock:
+            self.runs[summary['folder']] = summary
+            self.save()
+
+    def save(self):
+        """Write the index atomically (has to be called with the lock held)."""
+        tmp_file = self.file.with_name(self.file.name + '.tmp')
+        with open(tmp_file, 'w') as index_file:
+            json.dump(self.runs, index_file)
+        os.replace(tmp_file, self.file)
+
+    def remove(self, folder):
+        with self.lock:
+            del self.runs[folder]
+            self.save()
+
+    def get(self, folder=None):
+        with self.lock:
+            if folder is None:
+                # Without the (potentially large) per-run errors.
+                return [{key: value for key, value in run.items() if key != 'errors'} for run in self.runs.values()]
+            return self.runs.get(folder)
+
+
+def evaluate_new_runs(results_folder: Path, index: ResultsIndex, inotify=None):
+    """Evaluate all finished runs which are not in the index yet.
+    Runs which failed to evaluate are only retried when their folder has changed since. Evaluated runs are removed
+    from the index when they have been merged into another result (merge_shards.py) since.
+    Unfinished runs are watched with inotify (if given), so that we are woken up when they finish."""
+    yaml = YAML(typ='safe')
+    for child in sorted(results_folder.iterdir()):
+        if not child.is_dir():
+            continue
+        entry = index.get(child.name)
+        if not entry is None:
+            run_mtime = get_run_mtime(child)
+            if entry.get('run_mtime') == run_mtime:
+                continue
+            if not 'error' in entry:
+                # merge_shards.py adds merged_into to the setup, which changes the run_mtime.
+                try:
+                    with open(child / 'setup' / 'setup.yaml') as setup_file:
+                        merged = 'merged_into' in yaml.load(setup_file)
+                except Exception:
+                    merged = False
+                if merged:
+                    index.remove(child.name)
+                else:
+                    index.add(dict(entry, run_mtime=run_mtime))
+                continue
+        setup_folder = child / 'setup'
+        if not (setup_folder / 'Finished.txt').exists():
+            if not inotify is None and setup_folder.exists():
+                try:
+                    inotify.add_watch(setup_folder)
+                except OSError:
+                    pass  # E.g. too many watches, the run will be found by the periodic rescan.
+            continue
+        try:
+            with open(setup_folder / 'setup.yaml') as setup_file:
+                setup = yaml.load(setup_file)
+            if setup.get('sweep_index', False):
+                continue  # Not a result, the configurations of the sweep are evaluated separately.
+            if 'merged_into' in setup:
+                continue  # Shard which has been merged, only the merged result is evaluated.
+            print('Evaluating {}'.format(child.name))
+            result, result_gt_scale = evaluate_with_config((child, setup))
+            index.add(get_summary(child, setup, result, result_gt_scale))
+        except Exception as e:
+            # A single broken run should not stop the daemon.
+            print('WARNING: Could not evaluate {}: {}'.format(child.name, e))
+            index.add(get_failure(child, e))
+
+
+def watch_results(results_folder: Path, index: ResultsIndex, poll_interval):
+    """Evaluate new runs forever, using inotify to react immediately (with polling as fallback)."""
+    try:
+        inotify = Inotify()
+        inotify.add_watch(results_folder)
+    except OSError as e:
+        print('WARNING: inotify not available ({}), polling every {} seconds.'.format(e, poll_interval))
+        inotify = None
+    while True:
+        evaluate_new_runs(results_folder, index, inotify)
+        if inotify is None:
+            time.sleep(poll_interval)
+        else:
+            # New run folders only get their setup folder a bit later, so we also rescan after the poll interval.
+            inotify.wait(poll_interval)
+
+
+class IndexRequestHandler(BaseHTTPRequestHandler):
+    """JSON API: /runs lists the summaries of all runs, /runs/<folder> returns the summary of one run including the
+    errors of all iterations."""
+
+    index = None
+
+    def do_GET(self):
+        path = urllib.parse.unquote(urllib.parse.urlparse(self.path).path).rstrip('/')
+        if path == '/runs':
+            data = self.index.get()
+        elif path.startswith('/runs/'):
+            data = self.index.get(path[len('/runs/'):])
+        else:
+            data = None
+        if data is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix sockets don't have a client address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix-socket'
+
+
+class UnixSocketHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path):
+        super().__init__('localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def query(path, port=8765, socket_path=None):
+    """Query the API of a running evaluation daemon.
+    :param path: e.g. /runs or /runs/<folder>
+    :return: the decoded JSON response (None if it does not exist).
+    """
+    connection = http.client.HTTPConnection('localhost', port) if socket_path is None else UnixSocketHTTPConnection(
+        socket_path)
+    connection.request('GET', urllib.parse.quote(path))
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    if response.status != HTTPStatus.OK:
+        return None
+    return json.loads(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='serve: watch the results folder, automatically evaluate finished runs and serve the summary '
+                    'metrics over a local JSON API. query: print results from a running daemon.')
+    # Options shared by both commands (given after the command).
+    connection_parser = argparse.ArgumentParser(add_help=False)
+    connection_parser.add_argument('--port', type=int, default=8765, help='Port of the API on localhost.')
+    connection_parser.add_argument('--socket', type=str, default=None, help='Use this Unix socket instead of a port.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', parents=[connection_parser],
+                                         help='Evaluate finished runs and serve the results index.')
+    serve_parser.add_argument('--config', type=str, default=None, help='Config to use (for the results_path).')
+    serve_parser.add_argument('--poll_interval', type=float, default=30.0,
+                              help='Seconds between checks of the results folder (if inotify is not available or '
+                                   'missed something).')
+    query_parser = subparsers.add_parser('query', parents=[connection_parser],
+                                         help='Print results from a running daemon.')
+    query_parser.add_argument('folder', type=str, nargs='?', default=None,
+                              help='Results folder to show in detail (otherwise all runs are listed).')
+    args = parser.parse_args()
+
+    if args.command == 'query':
+        path = '/runs' if args.folder is None else '/runs/{}'.format(args.folder)
+        try:
+            data = query(path, args.port, args.socket)
+        except OSError as e:
+            print('Error: Could not connect to the evaluation daemon: {}'.format(e))
+            sys.exit(1)
+        if data is None:
+            print('Error: {} not found.'.format(path))
+            sys.exit(1)
+        if args.folder is None:
+            for run in sorted(data, key=lambda run: run.get('date_run') or ''):
+                if 'error' in run:
+                    print('{} evaluation failed: {}'.format(run['folder'], run['error']))
+                    continue
+                mean_error = '-' if run['mean_median_error'] is None else '{:.3f}'.format(run['mean_median_error'])
+                print('{} {:>8} failed: {:3} {}'.format(run['folder'], mean_error, run['num_failed'],
+                                                        run['custom_dmvio_args'] or ''))
+        else:
+            print(json.dumps(data, indent=2))
+        return
+
+    config, _, _, _ = read_config(args.config)
+    if config is None:
+        print('Error: config has to specified.')
+        sys.exit(1)
+    results_folder = Path(config['results_path'])
+    index = ResultsIndex(results_folder)
+
+    IndexRequestHandler.index = index
+    if args.socket is None:
+        server = ThreadingHTTPServer(('localhost', args.port), IndexRequestHandler)
+        print('Serving results index on http://localhost:{}/runs'.format(args.port))
+    else:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixStreamServer(args.socket, IndexRequestHandler)
+        print('Serving results index on {}'.format(args.socket))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        watch_results(results_folder, index, args.poll_interval)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
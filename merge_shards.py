@@ -0,0 +1,240 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Merge results which contain different runs of the same setup (shards from run_dmvio.py --shard, or sequences run
+separately with --only_seq) into one result, which can be evaluated as a complete run.
+
+Usage: python3 merge_shards.py <results folder> <results folder> ... [--name merged_name]
+"""
+
+import argparse
+import copy
+import os
+import shutil
+import sys
+from datetime import datetime
+from pathlib import Path
+from ruamel.yaml import YAML
+from utils.config_utils import read_config
+from utils.save_setup import update_setup
+from utils.shards import get_fingerprint, parse_shard
+
+# Folders of a result which don't belong to a single run.
+SHARED_FOLDERS = ['setup', 'results', 'kfres', 'runoutputs']
+
+
+def link_or_copy(source, target):
+    """Hard link the file if possible (the results are not modified afterwards), otherwise copy it."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def get_run_names(results_folder: Path):
+    return sorted(child.name for child in results_folder.iterdir() if child.is_dir() and
+                  not child.name in SHARED_FOLDERS)
+
+
+def check_compatible(folders, setups):
+    """Check that the results can be merged.
+    :return: list of error messages.
+    """
+    errors = []
+    reference = get_fingerprint(setups[0], folders[0] / 'setup')
+    for folder, setup in zip(folders[1:], setups[1:]):
+        fingerprint = get_fingerprint(setup, folder / 'setup')
+        for key, value in reference.items():
+            if fingerprint[key] != value:
+                errors.append('{} differs: {} in {}, but {} in {}.'.format(key, value, folders[0].name,
+                                                                         fingerprint[key], folder.name))
+    num_shards = set(parse_shard(setup['shard'])[1] for setup in setups if setup.get('shard'))
+    if len(num_shards) > 1:
+        errors.append('The results were split into different numbers of shards: {}'.format(sorted(num_shards)))
+    return errors
+
+
+def get_iterations_per_sequence(setups):
+    """Iterations run for each sequence with adaptive iterations (empty otherwise). Each part only contains the
+    sequences it has run, so they are combined."""
+    iterations_per_sequence = {}
+    for setup in setups:
+        for sequence, num_iter in setup.get('iterations_per_sequence', {}).items():
+            iterations_per_sequence[sequence] = max(num_iter, iterations_per_sequence.get(sequence, 0))
+    return iterations_per_sequence
+
+
+def merge_results(folders, setups, target_folder: Path, name):
+    """Merge the runs of the results into target_folder and save the merged setup.yaml with the provenance of each
+    run."""
+    runs_per_folder = [get_run_names(folder) for folder in folders]
+    run_sources = {}
+    for folder, run_names in zip(folders, runs_per_folder):
+        for run_name in run_names:
+            if run_name in run_sources:
+                print('Error: Run {} exists in {} and {}.'.format(run_name, run_sources[run_name].name, folder.name))
+                sys.exit(1)
+            run_sources[run_name] = folder
+
+    target_folder.mkdir()
+    for folder in SHARED_FOLDERS:
+        (target_folder / folder).mkdir()
+    for run_name, folder in sorted(run_sources.items()):
+        shutil.copytree(folder / run_name, target_folder / run_name, copy_function=link_or_copy)
+        for subfolder in ['results', 'kfres']:
+            source = folder / subfolder / '{}.txt'.format(run_name)
+            if source.exists():
+                link_or_copy(source, target_folder / subfolder / source.name)
+        if (folder / 'runoutputs').exists():
+            for source in (folder / 'runoutputs').glob('{}_runoutput*'.format(run_name)):
+                link_or_copy(source, target_folder / 'runoutputs' / source.name)
+
+    # The setup of the first result is used as base, the setups of all results are kept in setup/shards.
+    setup = copy.deepcopy(setups[0])
+    for key in list(setup.keys()):
+        if key.startswith('command_') or key.startswith('cwd'):
+            del setup[key]
+    only_seqs = set(shard_setup.get('only_seq') for shard_setup in setups)
+    iterations_per_sequence = get_iterations_per_sequence(setups)
+    if len(iterations_per_sequence) > 0:
+        setup['iterations_per_sequence'] = iterations_per_sequence
+    setup.update({
+        'name': name,
+        'results_name': target_folder.name,
+        'only_seq': only_seqs.pop() if len(only_seqs) == 1 else None,
+        'shard': '',
+        'date_merged': datetime.now(),
+        'merged_from': [{
+            'results_name': folder.name,
+            'shard': shard_setup.get('shard', ''),
+            'only_seq': shard_setup.get('only_seq'),
+            'date_run': shard_setup.get('date_run'),
+            'finished': (folder / 'setup' / 'Finished.txt').exists(),
+            'runs': run_names,
+        } for folder, shard_setup, run_names in zip(folders, setups, runs_per_folder)],
+    })
+    command_index = 0
+    for shard_setup in setups:
+        i = 0
+        while 'command_{}'.format(i) in shard_setup:
+            setup['command_{}'.format(command_index)] = shard_setup['command_{}'.format(i)]
+            setup['cwd{}'.format(command_index)] = shard_setup['cwd{}'.format(i)]
+            command_index += 1
+            i += 1
+
+    setup_folder = target_folder / 'setup'
+    for folder in folders:
+        shutil.copytree(folder / 'setup', setup_folder / 'shards' / folder.name,
+                        ignore=shutil.ignore_patterns('evaluation_results.txt'))
+    for filename in ['git_diff.txt', 'eval_tools_git_diff.txt', 'pcconfig.txt']:
+        if (folders[0] / 'setup' / filename).exists():
+            shutil.copy2(folders[0] / 'setup' / filename, setup_folder / filename)
+    with open(setup_folder / 'setup.yaml', 'w') as setup_file:
+        YAML().dump(setup, setup_file)
+    if all(shard['finished'] for shard in setup['merged_from']):
+        (setup_folder / 'Finished.txt').write_text('Finished\n')
+    return run_sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge results of shards (run_dmvio.py --shard) or of separately run '
+                                                 'sequences into one result.')
+    parser.add_argument('folders', type=str, nargs='+',
+                        help='Results folders to merge (absolute or relative to the results_path of the config).')
+    parser.add_argument('--config', type=str, default=None, help='Config to use (for the results paths).')
+    parser.add_argument('--name', type=str, default=None,
+                        help='Name of the merged result (letters, digits and underscores, as it is used for the '
+                             'variable names in the evaluation file). Default: name of the first result with _merged.')
+    args = parser.parse_args()
+    if not args.name is None and not args.name.isidentifier():
+        print('Error: --name may only contain letters, digits and underscores.')
+        sys.exit(1)
+
+    config, _, _, all_configs = read_config(args.config)
+    folders = []
+    for folder_name in args.folders:
+        folder = Path(folder_name)
+        if not folder.exists() and not config is None:
+            # The results path can also be set per dataset.
+            results_paths = [config['results_path']] + [value['results_path'] for value in config.values() if
+                                                        isinstance(value, dict) and 'results_path' in value]
+            for results_path in results_paths:
+                if (Path(results_path) / folder_name).exists():
+                    folder = Path(results_path) / folder_name
+                    break
+        if not (folder / 'setup' / 'setup.yaml').exists():
+            print('Error: {} is not a results folder.'.format(folder_name))
+            sys.exit(1)
+        folders.append(folder.resolve())
+    if len(set(folders)) != len(folders):
+        print('Error: A results folder is given twice.')
+        sys.exit(1)
+
+    yaml = YAML(typ='safe')
+    setups = []
+    for folder in folders:
+        with open(folder / 'setup' / 'setup.yaml') as setup_file:
+            setups.append(yaml.load(setup_file))
+        if not (folder / 'setup' / 'Finished.txt').exists():
+            print('WARNING: {} has not finished yet.'.format(folder.name))
+
+    errors = check_compatible(folders, setups)
+    if len(errors) > 0:
+        print('Error: The results have different settings and cannot be merged:')
+        for error in errors:
+            print(error)
+        sys.exit(1)
+
+    name = args.name
+    if name is None:
+        name = '{}_merged'.format(setups[0]['name'])
+    date_string = datetime.today().strftime('%Y-%m-%d--%H-%M-%S')
+    target_folder = folders[0].parent / '{}-{}-{}{}'.format(name, setups[0]['dataset'],
+                                                            'RT-' if setups[0]['realtime'] else '', date_string)
+    run_sources = merge_results(folders, setups, target_folder, name)
+
+    dataset_config = all_configs['config_general'].get(setups[0]['dataset'])
+    if not dataset_config is None:
+        only_seq = set(setup.get('only_seq') for setup in setups)
+        only_seq = only_seq.pop() if len(only_seq) == 1 else None
+        iterations_per_sequence = get_iterations_per_sequence(setups)
+        res_prefix = dataset_config['res_prefix']
+        missing_runs = ['{}{}_{}'.format(res_prefix, folder, iter) for i, folder in
+                        enumerate(dataset_config['folder_names']) if only_seq is None or i == only_seq for iter in
+                        range(iterations_per_sequence.get(res_prefix + folder, setups[0]['num_iter']))]
+        missing_runs = [run_name for run_name in missing_runs if not run_name in run_sources]
+        if len(missing_runs) > 0:
+            print('WARNING: {} runs are missing and will be evaluated as failed: {}'.format(
+                len(missing_runs), ', '.join(missing_runs)))
+    for folder in folders:
+        update_setup(folder / 'setup', {'merged_into': target_folder.name})
+    print('Merged {} runs from {} results into {}'.format(len(run_sources), len(folders), target_folder))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from ruamel.yaml import YAML
+from tqdm import tqdm
+from utils.config_utils import read_config, add_dataset_variant
+from utils.preflight import parse_dataset_args
+
+
+def get_packed_dataset_args(dataset_args: str):
+    """Return the dataset_args with files= pointing to the zip file instead of the image folder."""
+    files = parse_dataset_args(dataset_args)['files']
+    return dataset_args.replace('files=' + files, 'files=' + files.rstrip('/') + '.zip')
+
+
+def pack_folder(image_folder: Path):
+    """Pack all images in the folder into an uncompressed zip file next to it (which DSO / DM-VIO can read directly).
+    :return: path of the zip file.
+    """
+    zip_path = image_folder.parent / (image_folder.name + '.zip')
+    images = sorted(entry.name for entry in os.scandir(image_folder) if entry.is_file())
+    if zip_path.exists():
+        with zipfile.ZipFile(zip_path) as zip_file:
+            if sorted(zip_file.namelist()) == images:
+                return zip_path
+
+    # Write to a temporary file first, so that an interrupted run never leaves an incomplete archive behind.
+    tmp_path = image_folder.parent / '.{}.zip.tmp'.format(image_folder.name)
+    # Images are compressed already, so storing them is much faster to read than deflating them again.
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zip_file:
+        for image in images:
+            zip_file.write(image_folder / image, image)
+    os.replace(tmp_path, zip_path)
+    return zip_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Pack the images of each sequence into a single uncompressed zip file, which is much cheaper to '
+                    'open on shared filesystems than thousands of individual images. Also adds a dataset config '
+                    '(e.g. euroc_packed) which uses the zip files.')
+    parser.add_argument('--dataset', type=str, default='euroc', help='Dataset to pack.')
+    parser.add_argument('--config', type=str, default=None,
+                        help='Config to use (if not specified the config in defaultconfig.txt is used).')
+    parser.add_argument('--only_seq', default=None, type=int, help='Only pack one sequence.')
+    parser.add_argument('--num_parallel', default=4, type=int, help='Number of sequences to pack in parallel.')
+    args = parser.parse_args()
+
+    yaml = YAML()
+    config, config_name, general_config, all_configs = read_config(args.config, yaml)
+    if config is None:
+        print('Error: There is no default config for this machine yet. Have you called create_config.py yet?')
+        sys.exit(1)
+    dataset = args.dataset
+    if not dataset in config or not 'dataset_path' in config[dataset]:
+        print('Error: No dataset_path for {} in the config {}.'.format(dataset, config_name))
+        sys.exit(1)
+    dataset_config = general_config[dataset]
+    dataset_path = Path(config[dataset]['dataset_path'])
+
+    folders = dataset_config['folder_names']
+    if not args.only_seq is None:
+        folders = [folders[args.only_seq]]
+    image_folder_name = parse_dataset_args(dataset_config['dataset_args'])['files']
+    image_folders = [dataset_path / folder / dataset_config['afterpath'] / image_folder_name for folder in folders]
+
+    with ThreadPoolExecutor(max_workers=args.num_parallel) as executor:
+        for zip_path in tqdm(executor.map(pack_folder, image_folders), total=len(image_folders)):
+            print('Packed {}'.format(zip_path))
+
+    # Add the packed variant of the dataset to the configs.
+    packed_name = dataset + '_packed'
+    add_dataset_variant(config, general_config, dataset, packed_name,
+                        get_packed_dataset_args(dataset_config['dataset_args']))
+    print('Saving updated config, run with --dataset={} to use the packed images.'.format(packed_name))
+    with open('configs.yaml', 'w') as config_file:
+        yaml.dump(all_configs, config_file)
+
+
+if __name__ == '__main__':
+    main()
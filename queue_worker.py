@@ -0,0 +1,166 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Worker for the shared-filesystem work queue (run_dmvio.py --queue). Start it on any number of machines which can
+access the queue and results folders: each worker claims pending tasks, resolves the paths in them with the config of
+its machine, runs them and writes the results into the results folder of the task.
+
+Usage: python3 queue_worker.py --config <config of this machine> --queue <queue folder> [--num_workers N]
+"""
+
+import argparse
+import multiprocessing
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from ruamel.yaml import YAML
+from utils.config_utils import read_config
+from utils.save_setup import get_git_log_and_diff
+from utils.work_queue import WorkQueue, get_dataset_config, get_machine_paths, resolve_placeholders, \
+    HEARTBEAT_INTERVAL
+
+
+class Worker:
+    def __init__(self, queue_folder: Path, config, general_config, requeue_stale=None):
+        """
+        :param requeue_stale: Claims without heartbeat for this number of seconds are moved back to pending/ (None
+        to disable).
+        """
+        self.queue = WorkQueue(queue_folder)
+        self.requeue_stale = requeue_stale
+        self.config = config
+        self.general_config = general_config
+        self.datasets = [name for name in general_config if name in config and 'dataset_path' in config[name]]
+        self.checked_results = set()
+
+    def check_code_version(self, results_folder: Path):
+        """Warn if the DM-VIO version of this machine differs from the one the results were started with."""
+        if results_folder in self.checked_results:
+            return
+        self.checked_results.add(results_folder)
+        with open(results_folder / 'setup' / 'setup.yaml') as setup_file:
+            setup = YAML(typ='safe').load(setup_file)
+        if setup.get('fake_dmvio', False):
+            return
+        git_hash, _, _, _ = get_git_log_and_diff(self.config['dmvio_folder'], None)
+        if git_hash != setup['git_hash']:
+            print('WARNING: DM-VIO on this machine is at {}, but {} was started with {}.'.format(
+                git_hash, results_folder.name, setup['git_hash']))
+
+    def run_task(self, task):
+        dataset_config = get_dataset_config(self.config, self.general_config, task['dataset'])
+        paths = get_machine_paths(self.config, dataset_config, sys.executable)
+        results_folder = Path(dataset_config['results_path']) / task['results_name']
+        self.check_code_version(results_folder)
+        command = resolve_placeholders(task['command'], paths)
+        working_dir = resolve_placeholders(task['working_dir'], paths)
+        print('Worker {}: Running {} of {}'.format(self.queue.worker_name, task['run_name'], task['results_name']),
+              flush=True)
+        print('Working Dir: {}'.format(working_dir))
+        print('Command: {}'.format(command))
+        returncode = subprocess.run(command, shell=True, cwd=working_dir).returncode
+        for move_command in task['post_run_commands']:
+            move_command = resolve_placeholders(move_command, paths)
+            print('Executing: {}'.format(move_command))
+            subprocess.run(move_command, shell=True)
+        return returncode, results_folder
+
+    def send_heartbeats(self, claimed_file, stop):
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            self.queue.heartbeat(claimed_file)
+
+    def run(self, poll_interval, exit_when_empty):
+        while True:
+            if not self.requeue_stale is None:
+                self.queue.requeue_stale(self.requeue_stale)
+            claimed = self.queue.claim(self.datasets)
+            if claimed is None:
+                if exit_when_empty:
+                    return
+                time.sleep(poll_interval)
+                continue
+            claimed_file, task = claimed
+            start_time = datetime.now()
+            stop_heartbeats = threading.Event()
+            threading.Thread(target=self.send_heartbeats, args=(claimed_file, stop_heartbeats), daemon=True).start()
+            try:
+                returncode, results_folder = self.run_task(task)
+            except Exception as e:
+                print('Error: Task {} failed: {}'.format(claimed_file.name, e))
+                returncode, results_folder = None, None
+            stop_heartbeats.set()
+            if self.queue.finish(claimed_file, task, returncode, start_time) and not results_folder is None:
+                # This was the last task of the results, so they are complete now.
+                (results_folder / 'setup' / 'Finished.txt').write_text('Finished\n')
+
+
+def run_worker(queue_folder, config, general_config, poll_interval, exit_when_empty, requeue_stale):
+    Worker(queue_folder, config, general_config, requeue_stale).run(poll_interval, exit_when_empty)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run tasks from a work queue created with run_dmvio.py --queue.')
+    parser.add_argument('--queue', type=str, required=True, help='Queue folder (on a shared filesystem).')
+    parser.add_argument('--config', type=str, default=None,
+                        help='Config of this machine, used to resolve the dataset, DM-VIO and results paths.')
+    parser.add_argument('--num_workers', type=int, default=1, help='Number of workers to start on this machine.')
+    parser.add_argument('--poll_interval', type=float, default=10.0,
+                        help='Seconds to wait before checking again when the queue is empty.')
+    parser.add_argument('--exit_when_empty', default=False, action='store_true',
+                        help='Exit when there are no pending tasks instead of waiting for new ones.')
+    parser.add_argument('--requeue_stale', type=float, default=10.0,
+                        help='Move tasks claimed by workers which have not sent a heartbeat for this number of minutes '
+                             '(e.g. because their machine crashed) back to pending. Set to 0 to disable.')
+    args = parser.parse_args()
+
+    config, _, general_config, _ = read_config(args.config)
+    if config is None:
+        print('Error: config has to specified.')
+        sys.exit(1)
+    queue_folder = Path(args.queue)
+    if not queue_folder.exists():
+        print('Error: Queue folder {} does not exist.'.format(queue_folder))
+        sys.exit(1)
+
+    requeue_stale = args.requeue_stale * 60 if args.requeue_stale > 0 else None
+    worker_args = (queue_folder, config, general_config, args.poll_interval, args.exit_when_empty, requeue_stale)
+    if args.num_workers == 1:
+        run_worker(*worker_args)
+        return
+    workers = [multiprocessing.Process(target=run_worker, args=worker_args) for _ in range(args.num_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == '__main__':
+    main()
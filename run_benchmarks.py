@@ -0,0 +1,139 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from benchmarks.synthetic import SIZES
+from benchmarks.suite import run_benchmarks
+
+
+def load_history(history_file: Path):
+    if not history_file.exists():
+        return []
+    with open(history_file) as history_file_handle:
+        return json.load(history_file_handle)
+
+
+def get_spread(result):
+    """Difference between the slowest and fastest repetition (0 for results saved without all repetitions)."""
+    times = result.get('times', [result['time']])
+    return max(times) - min(times)
+
+
+def compare(old_results, new_results, threshold, min_time_delta=0.0):
+    """Compare two benchmark results and print the relative changes.
+    A slowdown only counts as regression if it is also larger than min_time_delta and than the spread of the
+    repetitions of both results, as short benchmarks otherwise fail because of timer noise.
+    :return: list of names of benchmarks where time or peak memory got worse by more than threshold.
+    """
+    regressions = []
+    print('{:40} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}'.format('benchmark', 'old time', 'new time', 'change',
+                                                                 'old MB', 'new MB', 'change'))
+    for name, new in new_results.items():
+        if not name in old_results:
+            continue
+        old = old_results[name]
+        time_change = new['time'] / old['time'] - 1
+        time_noise = max(min_time_delta, get_spread(old), get_spread(new))
+        time_regression = time_change > threshold and new['time'] - old['time'] > time_noise
+        memory_change = new['peak_memory'] / max(old['peak_memory'], 1) - 1
+        regression = time_regression or memory_change > threshold
+        if regression:
+            regressions.append(name)
+        print('{:40} {:10.4f} {:10.4f} {:7.1f}% {:10.1f} {:10.1f} {:7.1f}%{}'.format(
+            name, old['time'], new['time'], time_change * 100, old['peak_memory'] / 1e6, new['peak_memory'] / 1e6,
+            memory_change * 100, ' <-- REGRESSION' if regression else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the evaluation on synthetic data. "run" appends the timings and peak memory to a '
+                    'history file, "compare" compares the last two entries of it (and fails on regressions).')
+    parser.add_argument('command', type=str, choices=['run', 'compare'])
+    parser.add_argument('--history', type=str, default='benchmarks/history.json',
+                        help='JSON file where the results of all benchmark runs are stored.')
+    parser.add_argument('--sizes', type=str, nargs='+', default=['euroc'], choices=list(SIZES.keys()),
+                        help='Sequence sizes to run the trajectory benchmarks with.')
+    parser.add_argument('--num_runs', type=int, nargs='+', default=[10, 100],
+                        help='Numbers of results folders to benchmark load_result_yamls with (e.g. up to 10000).')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repetitions of each benchmark.')
+    parser.add_argument('--filter', type=str, default=None, help='Only run benchmarks containing this string.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative increase of time or memory which counts as regression for compare.')
+    parser.add_argument('--min_time_delta', type=float, default=0.005,
+                        help='Slowdowns by less than this number of seconds (or than the spread of the repetitions) '
+                             'are considered noise for compare.')
+    parser.add_argument('--baseline', type=int, default=None,
+                        help='Index of the history entry to compare the last entry against (default: the last one '
+                             'before it from the same machine).')
+    args = parser.parse_args()
+
+    history_file = Path(args.history)
+    history = load_history(history_file)
+
+    if args.command == 'run':
+        with tempfile.TemporaryDirectory() as folder:
+            results = run_benchmarks(Path(folder), args.sizes, args.num_runs, args.repeat, args.filter)
+        git_hash = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE).stdout.decode('ascii').strip()
+        history.append({'date': datetime.now().isoformat(timespec='seconds'), 'git_hash': git_hash,
+                        'machine': socket.gethostname(), 'results': results})
+        with open(history_file, 'w') as history_file_handle:
+            json.dump(history, history_file_handle, indent=2)
+        print('Saved results to {}'.format(history_file))
+    else:
+        machine = history[-1]['machine'] if len(history) > 0 else None
+        if args.baseline is None:
+            baselines = [entry for entry in history[:-1] if entry['machine'] == machine]
+            if len(baselines) == 0:
+                print('Error: Need an earlier entry from {} in {} to compare.'.format(machine, history_file))
+                sys.exit(1)
+            baseline = baselines[-1]
+        else:
+            baseline = history[args.baseline]
+            if baseline['machine'] != machine:
+                # Timings of different machines can't be compared, so regressions are only reported.
+                print('WARNING: The baseline was run on {}, but the last entry on {}. Regressions are not checked.'
+                      .format(baseline['machine'], machine))
+        print('Comparing {} ({}) against {} ({})'.format(history[-1]['git_hash'][:8], history[-1]['date'],
+                                                         baseline['git_hash'][:8], baseline['date']))
+        regressions = compare(baseline['results'], history[-1]['results'], args.threshold, args.min_time_delta)
+        if len(regressions) > 0 and baseline['machine'] == machine:
+            print('Error: {} benchmarks regressed by more than {:.0f}%.'.format(len(regressions),
+                                                                                args.threshold * 100))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
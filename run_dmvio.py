@@ -1,12 +1,24 @@
 import argparse
+import shlex
 import sys
 import subprocess
 from pathlib import Path
 from datetime import datetime
 from enum import Enum
 from utils.config_utils import read_config, input_custom_variables
-from utils.save_setup import save_setup
+from utils.save_setup import save_setup, save_setup_from_snapshot, update_setup
 from utils.slurm_utils import execute_commands_slurm
+from utils.preflight import preflight_check, parse_dataset_args, SequencePaths
+from utils.staging import StageMode, StagingCache
+import utils.profiling as profiling
+from utils.result_sync import ResultSyncWorker
+from utils.adaptive_iterations import AdaptiveIterations
+from utils.run_watchdog import DivergenceCriteria, get_watchdog_command, get_groundtruth_extents
+from utils.run_limits import collect_run_history, get_run_limits, get_sequence_name
+from utils.work_queue import WorkQueue, get_machine_paths
+from utils.shards import parse_shard, get_shard_runs
+from utils.sweep import load_sweep_spec, get_sweep_configurations, get_expected_durations, write_sweep_index, \
+    evaluate_sweep
 
 
 class OutputType(Enum):
@@ -15,6 +27,12 @@ class OutputType(Enum):
     null = 2
 
 
+class OutputCompression(Enum):
+    none = 0
+    gzip = 1
+    zstd = 2
+
+
 class BuildType(Enum):
     Debug = 0
     RelWithDebInfo = 1
@@ -24,16 +42,27 @@ class BuildType(Enum):
 class RunCommand:
     """Data for a command which should be run."""
 
-    def __init__(self, command, working_dir, post_run_commands):
+    def __init__(self, command, working_dir, post_run_commands, sequence_folder=None, input_paths=None,
+                 run_name=None, limits=None, results_folder=None):
         """
         :param command: The main command which shall be run (DM-VIO execution).
         :param working_dir: The working directory to run it in.
         :param post_run_commands: Commands which should be run afterwards (e.g. moving the results to the correct
         places).
+        :param sequence_folder: Folder of the sequence the command runs on.
+        :param input_paths: Dataset files and folders read by the command (used for staging them).
+        :param run_name: Name of the run (e.g. mav_MH_01_easy_0).
+        :param limits: RunLimits of the run (also requested from Slurm) or None.
+        :param results_folder: Results folder the run belongs to.
         """
         self.command = command
         self.working_dir = working_dir
         self.post_run_commands = post_run_commands
+        self.sequence_folder = sequence_folder
+        self.input_paths = input_paths
+        self.run_name = run_name
+        self.limits = limits
+        self.results_folder = results_folder
 
 
 def main():
@@ -45,8 +74,24 @@ def main():
                         help="Config to use. If not set it will use the one in defaultconfig.txt")
     parser.add_argument('--build_type', type=str, default='RelWithDebInfo', help="Build type to compile with.")
     parser.add_argument('--dataset', type=str, default='euroc', help='Dataset to run on.')
-    parser.add_argument('--iter', default=None, type=int, help='Number of iterations to use.')
+    parser.add_argument('--iter', default=None, type=int,
+                        help='Number of iterations to use (maximum number of iterations with --adaptive).')
+    parser.add_argument('--adaptive', default=False, action='store_true',
+                        help='Start with --min_iter iterations per sequence and only run more iterations for sequences '
+                             'where the confidence interval of the median error is too wide (see --ci_width).')
+    parser.add_argument('--min_iter', default=3, type=int, help='Initial number of iterations with --adaptive.')
+    parser.add_argument('--ci_width', default=0.2, type=float,
+                        help='Target width of the 95%% confidence interval of the median error with --adaptive, '
+                             'relative to the median error of the sequence (0.2: the interval may be at most 20%% of '
+                             'the median wide).')
     parser.add_argument('--only_seq', default=None, type=int, help='Only run one sequence.')
+    parser.add_argument('--sweep', type=str, default=None,
+                        help='YAML file with a grid or random specification over DM-VIO arguments and settings files '
+                             '(see utils/sweep.py). Each configuration is saved as its own result, all runs share one '
+                             'build and are executed together, longest first.')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='Only run a part of the runs, given as i/n for shard i (starting at 0) of n. The shards '
+                             'can be run on different machines and combined with merge_shards.py.')
     parser.add_argument('--realtime', action='store_true', help='Run in realtime mode.')
     parser.add_argument('--pull', default=False, action='store_true', help='Git pull before running.')
     parser.add_argument('--dmvio_args', type=str, default=None, help='Additional commandline arguments for DM-VIO.')
@@ -57,6 +102,12 @@ def main():
     parser.add_argument('--output', type=str, default='save',
                         help="What to do with console output, either 'save', 'null' (to delete) or console. For Slurm "
                              "console doesn't work as intended, as the output is routed to a log file anyway.")
+    parser.add_argument('--output_compression', type=str, default='none',
+                        choices=[compression.name for compression in OutputCompression],
+                        help='Compress the saved console output while it is written (with output=save).')
+    parser.add_argument('--output_filter', type=str, default=None,
+                        help='Only save lines of the console output matching this (extended grep) regular '
+                             'expression (with output=save).')
     parser.add_argument('--quiet', default=False, action='store_true',
                         help='Set quiet=1 for DM-VIO execution (disables some of the output).')
     parser.add_argument('--temporary', default=False, action='store_true',
@@ -69,7 +120,50 @@ def main():
     parser.add_argument('--num_nodes', type=str, default=None, help='Num nodes to report to slurm.')
     parser.add_argument('--gdb', default=False, action='store_true',
                         help='Debug with gdb and stop as soon as error happens.')
+    parser.add_argument('--stage', type=str, default='none', choices=[mode.name for mode in StageMode],
+                        help='Stage the dataset files of each sequence before running it: shm copies them to '
+                             '--stage_folder (a RAM disk), pagecache reads them once into the page cache. Avoids '
+                             'frame drops caused by slow reads in realtime mode. Only for local execution.')
+    parser.add_argument('--stage_folder', type=str, default='/dev/shm/dmvio_stage',
+                        help='Folder to copy sequences to with --stage shm.')
+    parser.add_argument('--stage_max_gb', type=float, default=8.0,
+                        help='Maximum size of all staged sequences in GB. The least recently used sequences are '
+                             'evicted first.')
+    parser.add_argument('--fake_dmvio', default=False, action='store_true',
+                        help="Don't build and run DM-VIO but a stand-in which writes results computed from the "
+                             "groundtruth (utils/fake_dmvio_dataset.py). For testing and benchmarking these tools. "
+                             "The dataset is not needed for it (and not checked).")
+    parser.add_argument('--watchdog', default=False, action='store_true',
+                        help='Terminate runs early which have clearly diverged (see utils/run_watchdog.py). The '
+                             'reason is saved to run_status.yaml and the evaluation counts these runs as failed.')
+    parser.add_argument('--watchdog_max_scale_change', type=float, default=10.0,
+                        help='Terminate a run if its estimated scale changes by more than this factor.')
+    parser.add_argument('--watchdog_max_resets', type=int, default=5,
+                        help='Terminate a run if it reports more resets or tracking failures.')
+    parser.add_argument('--watchdog_max_distance_factor', type=float, default=3.0,
+                        help='Terminate a run if its trajectory gets further away from the start than this factor '
+                             'times the size of the groundtruth trajectory (only if result.txt is written while '
+                             'running).')
+    parser.add_argument('--limits', default=False, action='store_true',
+                        help='Limit the wall time and memory of each run, derived from the runtime and peak memory of '
+                             'previous runs on the same sequence (see utils/run_limits.py). Runs exceeding them are '
+                             'terminated and reported as timeout / memory_limit. Also sets the Slurm requests.')
+    parser.add_argument('--limit_time_margin', type=float, default=2.0,
+                        help='Time limit is the maximum previous runtime times this factor.')
+    parser.add_argument('--limit_memory_margin', type=float, default=1.5,
+                        help='Memory limit is the maximum previous peak memory times this factor.')
+    parser.add_argument('--limit_min_runs', type=int, default=3,
+                        help='Minimum number of previous runs on a sequence for limiting it.')
+    parser.add_argument('--queue', type=str, default=None,
+                        help='Instead of running, publish the runs as tasks to this queue folder on a shared '
+                             'filesystem, from where they are run by queue_worker.py on any machine. The results '
+                             'path should be on the shared filesystem as well.')
+    profiling.add_profile_argument(parser)
+    parser.add_argument('--no_preflight', default=False, action='store_true',
+                        help="Don't check that the dataset files exist and are consistent before running (never "
+                             "checked with --fake_dmvio).")
     args = parser.parse_args()
+    profiling.enable_from_args(args)
 
     # Read config.
     config, config_name, general_config, _ = read_config(args.config)
@@ -94,9 +188,13 @@ def main():
 
     build_folder_name = 'cmake-build-{}'.format(build_type.name.lower())
     build_folder = Path(dmvio_folder) / build_folder_name
-    if not build_folder.exists():
-        build_folder.mkdir()
-    dmvio_executable = build_folder / 'bin' / 'dmvio_dataset'
+    if args.fake_dmvio:
+        dmvio_executable = '{} {}'.format(sys.executable, Path(__file__).resolve().parent / 'utils' /
+                                          'fake_dmvio_dataset.py')
+    else:
+        if not build_folder.exists():
+            build_folder.mkdir()
+        dmvio_executable = build_folder / 'bin' / 'dmvio_dataset'
 
     dataset_config = general_config[dataset]
     try:
@@ -123,35 +221,150 @@ def main():
         num_iter = dataset_config['default_iter']
     print('Num iterations: {}'.format(num_iter))
     only_seq = args.only_seq
+    adaptive = args.adaptive
+    if adaptive and (use_slurm or not args.queue is None):
+        print('WARNING: Adaptive iterations are not supported with Slurm or a queue, running {} iterations.'.format(
+            num_iter))
+        adaptive = False
+    shard = None
+    if not args.shard is None:
+        shard = parse_shard(args.shard)
+        if shard is None:
+            print('Error: Invalid shard {}, expected i/n with 0 <= i < n.'.format(args.shard))
+            sys.exit(1)
+        if adaptive:
+            print('WARNING: Adaptive iterations are not supported with shards, running {} iterations.'.format(
+                num_iter))
+            adaptive = False
+    sweep_spec = None
+    sweep_configurations = None
+    if not args.sweep is None:
+        try:
+            sweep_spec = load_sweep_spec(args.sweep)
+        except (OSError, ValueError) as e:
+            print('Error: Invalid sweep specification {}: {}'.format(args.sweep, e))
+            sys.exit(1)
+        sweep_configurations = get_sweep_configurations(sweep_spec)
+        print('Sweep with {} configurations.'.format(len(sweep_configurations)))
+        if not shard is None:
+            print('Error: Shards are not supported for sweeps.')
+            sys.exit(1)
+        if adaptive:
+            print('WARNING: Adaptive iterations are not supported for sweeps, running {} iterations.'.format(num_iter))
+            adaptive = False
+
+    # (results folder, custom DM-VIO arguments, settings file) of each result to run. For a sweep each configuration
+    # is a separate result.
+    if sweep_configurations is None:
+        results_to_run = [(results_folder, args.dmvio_args, args.dmvio_settings)]
+    else:
+        results_to_run = []
+        for configuration in sweep_configurations:
+            dmvio_args = configuration.get_dmvio_args()
+            if not args.dmvio_args is None:
+                dmvio_args = '{} {}'.format(args.dmvio_args, dmvio_args)
+            dmvio_settings = configuration.get_dmvio_settings()
+            results_to_run.append((Path(general_save_folder) / '{}-{:03d}'.format(results_name, configuration.index),
+                                   dmvio_args, args.dmvio_settings if dmvio_settings is None else dmvio_settings))
+        # Only contains the setup and the sweep index.
+        results_folder = Path(general_save_folder) / (results_name + '-sweep')
+
+    def get_settings_file(dmvio_settings):
+        return None if dmvio_settings is None else str(Path(dmvio_folder) / 'configs' / dmvio_settings)
+
+    # Check all sequences before starting anything, as problems would otherwise only show up when the runs crash.
+    # The fake DM-VIO only needs the groundtruth, so the dataset is not checked for it.
+    if not args.no_preflight and not args.fake_dmvio:
+        print('Checking dataset.')
+        with profiling.stage('preflight'):
+            errors = preflight_check(dataset_config, dmvio_folder, only_seq, check_imu=not noimu)
+        for settings_file in set(get_settings_file(dmvio_settings) for _, _, dmvio_settings in results_to_run):
+            if not settings_file is None and not Path(settings_file).exists():
+                errors.append('Settings file does not exist: {}'.format(settings_file))
+        if len(errors) > 0:
+            print('Error: Dataset check failed (pass --no_preflight to skip it):')
+            for error in errors:
+                print(error)
+            sys.exit(1)
 
-    # Maybe Git pull code
-    if args.pull:
-        git_pull(dmvio_folder)
+    if not args.fake_dmvio:
+        # Maybe Git pull code
+        if args.pull:
+            git_pull(dmvio_folder)
 
-    # Build code
-    build_code(build_folder, build_type, config['cmake_command'] if 'cmake_command' in config else None)
+        # Build code
+        with profiling.stage('build'):
+            build_code(build_folder, build_type, config['cmake_command'] if 'cmake_command' in config else None)
 
     # Create save folder
-    if not results_folder.exists():
-        results_folder.mkdir()
-    else:
-        print('WARNING: Results folder already exists.')
-        if temporary:
-            subprocess.run('rm -r {}'.format(results_folder), shell=True)
-            results_folder.mkdir()
-        else:
-            sys.exit(1)
+    create_results_folder(results_folder, temporary)
+    if not sweep_configurations is None:
+        for folder, _, _ in results_to_run:
+            create_results_folder(folder, temporary)
 
     # -> Create array of commands and working directories
     # -> For a normal script we can just run them one by one, for Slurm we need to write them to an sbatch file which
     # is then run.
-    settings_file = args.dmvio_settings
-    if not settings_file is None:
-        settings_file = str(Path(dmvio_folder) / 'configs' / settings_file)
-
-    commands = create_dmvio_commands(dmvio_executable, dmvio_folder, dataset_config, results_folder, num_iter,
-                                     only_seq, output_type,
-                                     realtime, args.withgui, noimu, quiet, args.dmvio_args, settings_file, args.gdb)
+    watchdog_criteria = None
+    if args.watchdog:
+        try:
+            extents = get_groundtruth_extents(dataset, dataset_config.get('groundtruth_folder'))
+        except Exception as e:
+            print('WARNING: Could not read groundtruth ({}), the watchdog will not check the distance.'.format(e))
+            extents = {}
+        watchdog_criteria = {}
+        for folder in dataset_config['folder_names']:
+            sequence_name = dataset_config['res_prefix'] + folder
+            max_distance = extents[sequence_name] * args.watchdog_max_distance_factor if sequence_name in extents \
+                else None
+            watchdog_criteria[sequence_name] = DivergenceCriteria(args.watchdog_max_scale_change,
+                                                                  args.watchdog_max_resets, max_distance)
+
+    run_limits = None
+    if args.limits:
+        history = collect_run_history(general_save_folder, dataset, realtime, args.fake_dmvio, results_folder)
+        run_limits = get_run_limits(history, args.limit_time_margin, args.limit_memory_margin, args.limit_min_runs)
+        for i, folder in enumerate(dataset_config['folder_names']):
+            sequence_name = dataset_config['res_prefix'] + folder
+            if (only_seq is None or i == only_seq) and not sequence_name in run_limits:
+                print('WARNING: Not enough previous runs on {}, it will run without limits.'.format(sequence_name))
+
+    def create_commands(runs=None, commands_results_folder=results_folder, dmvio_args=args.dmvio_args,
+                        dmvio_settings=args.dmvio_settings):
+        commands = create_dmvio_commands(dmvio_executable, dmvio_folder, dataset_config, commands_results_folder,
+                                         num_iter, only_seq, output_type,
+                                         realtime, args.withgui, noimu, quiet, dmvio_args,
+                                         get_settings_file(dmvio_settings),
+                                         args.gdb, OutputCompression[args.output_compression], args.output_filter,
+                                         runs, watchdog_criteria, run_limits)
+        if args.fake_dmvio:
+            # The fake DM-VIO only needs the groundtruth, so it can also run on machines without the dataset.
+            for command in commands:
+                if not Path(command.working_dir).exists():
+                    command.working_dir = commands_results_folder
+        return commands
+
+    sequence_names = [dataset_config['res_prefix'] + folder for i, folder in
+                      enumerate(dataset_config['folder_names']) if only_seq is None or i == only_seq]
+    runs = None
+    adaptive_iterations = None
+    if adaptive:
+        adaptive_iterations = AdaptiveIterations(results_folder, dataset, sequence_names, args.min_iter, num_iter,
+                                                 args.ci_width, dataset_config.get('groundtruth_folder'))
+        runs = adaptive_iterations.next_runs()
+    elif not shard is None:
+        runs = get_shard_runs(sequence_names, num_iter, *shard)
+    with profiling.stage('create_commands'):
+        commands_per_result = [create_commands(runs, folder, dmvio_args, dmvio_settings) for
+                               folder, dmvio_args, dmvio_settings in results_to_run]
+    commands = [command for result_commands in commands_per_result for command in result_commands]
+    if not sweep_configurations is None:
+        # All runs of the sweep are scheduled longest first, so that parallel execution (Slurm or queue workers)
+        # doesn't end with a few long runs.
+        history = collect_run_history(general_save_folder, dataset, realtime, args.fake_dmvio)
+        expected_durations = get_expected_durations(history, dataset_config, sequence_names)
+        commands.sort(key=lambda command: expected_durations.get(get_sequence_name(command.run_name), 0.0),
+                      reverse=True)
 
     # ------------------------------ Save Project Status ------------------------------
     setup = {
@@ -168,48 +381,182 @@ def main():
         'noimu': noimu,
         'quiet': quiet,
         'output_type': output_type.name,
+        'output_compression': args.output_compression,
+        'output_filter': '' if args.output_filter is None else args.output_filter,
         'withgui': args.withgui,
         'custom_dmvio_args': '' if args.dmvio_args is None else args.dmvio_args,
         'dmvio_settings': '' if args.dmvio_settings is None else args.dmvio_settings,
-        'gdb': args.gdb
+        'gdb': args.gdb,
+        'stage': args.stage,
+        'fake_dmvio': args.fake_dmvio,
+        'watchdog': args.watchdog,
+        'limits_from_history': args.limits,
+        'queue': '' if args.queue is None else args.queue,
+        'shard': '' if args.shard is None else args.shard,
+        'sweep': ''
     }
+    if args.watchdog:
+        setup['watchdog_max_scale_change'] = args.watchdog_max_scale_change
+        setup['watchdog_max_resets'] = args.watchdog_max_resets
+        setup['watchdog_max_distance_factor'] = args.watchdog_max_distance_factor
+    if not run_limits is None:
+        setup['run_limits'] = {name: {'max_time': limits.max_time, 'max_memory_mb': limits.max_memory_mb} for
+                           name, limits in run_limits.items()}
+    if 'groundtruth_folder' in dataset_config:
+        setup['groundtruth_folder'] = dataset_config['groundtruth_folder']
+    if not adaptive_iterations is None:
+        setup['adaptive'] = True
+        setup['adaptive_ci_width'] = adaptive_iterations.ci_width
+        setup['iterations_per_sequence'] = dict(adaptive_iterations.iterations)
     # in this folder we save all details about environment, code versions, etc.
     setup_folder = results_folder / 'setup'
     setup_folder.mkdir()
-    save_setup(setup, setup_folder, dmvio_folder, config, commands)
+    # The fake DM-VIO is part of this repository, so we save its version instead.
+    code_folder = Path(__file__).resolve().parent if args.fake_dmvio else dmvio_folder
+    # Setup folders of the sweep configurations, which are marked as finished together with setup_folder.
+    other_setup_folders = []
+    if sweep_configurations is None:
+        with profiling.stage('save_setup'):
+            save_setup(setup, setup_folder, code_folder, config, commands)
+    else:
+        # The environment is only saved once for the sweep, and copied to the setup of each configuration.
+        sweep_setup = dict(setup)
+        sweep_setup.update({'results_name': results_folder.name, 'sweep_index': True, 'sweep_spec': sweep_spec})
+        with profiling.stage('save_setup'):
+            save_setup(sweep_setup, setup_folder, code_folder, config, commands)
+        sweep_index = {'sweep_spec': sweep_spec, 'configurations': []}
+        for configuration, (folder, dmvio_args, dmvio_settings), result_commands in zip(
+                sweep_configurations, results_to_run, commands_per_result):
+            result_setup = dict(setup)
+            result_setup.update({
+                'results_name': folder.name,
+                'custom_dmvio_args': dmvio_args,
+                'dmvio_settings': '' if dmvio_settings is None else dmvio_settings,
+                'sweep': results_folder.name,
+                'sweep_params': configuration.params
+            })
+            (folder / 'setup').mkdir()
+            save_setup_from_snapshot(result_setup, folder / 'setup', setup_folder, result_commands)
+            other_setup_folders.append(folder / 'setup')
+            sweep_index['configurations'].append({
+                'index': configuration.index,
+                'results_name': folder.name,
+                'params': configuration.params,
+                'dmvio_args': dmvio_args,
+                'dmvio_settings': '' if dmvio_settings is None else dmvio_settings
+            })
+        write_sweep_index(results_folder, sweep_index)
 
     # ------------------------------ Run-Loop -> Run / create Slurm script. ------------------------------
     print("----------- STARTING EXECUTION! -----------")
-    if not use_slurm:
-        execute_commands(commands, args.dryrun, setup_folder)
-
-        # Transfer results to Uni (if not there already).
-        if 'rsync_command' in config and not temporary:
-            rsync_command = config['rsync_command']
-            rsync_target = config['rsync_command_target']
-            full_rsync_command = '{} {} {}/'.format(rsync_command, results_folder, rsync_target)
-            print(full_rsync_command)
-            subprocess.run(full_rsync_command, shell=True)
+    if not args.queue is None:
+        if StageMode[args.stage] != StageMode.none:
+            print('WARNING: Staging is not supported with a queue and will be ignored.')
+        if not args.dryrun:
+            paths = get_machine_paths(config, dataset_config, sys.executable)
+            WorkQueue(Path(args.queue)).publish(commands, results_folder.name, dataset, paths)
+    elif not use_slurm:
+        staging_cache = None
+        if StageMode[args.stage] != StageMode.none:
+            staging_cache = StagingCache(StageMode[args.stage], Path(args.stage_folder), args.stage_max_gb * 1e9)
+        # Transfer results to Uni (if not there already). Each run is transferred in the background as soon as it has
+        # finished.
+        sync_workers = None
+        if 'rsync_command' in config and not temporary and not args.dryrun:
+            sync_workers = {folder: ResultSyncWorker(config['rsync_command'], folder, config['rsync_command_target'])
+                            for folder in [results_folder] + [folder for folder, _, _ in results_to_run]}
+        if not adaptive_iterations is None and not args.dryrun:
+            commands = get_adaptive_commands(commands, adaptive_iterations, create_commands, setup_folder)
+        execute_commands(commands, args.dryrun, setup_folder, staging_cache,
+                         None if sync_workers is None else
+                         lambda command: sync_workers[command.results_folder].push_run(command.run_name),
+                         other_setup_folders)
+
+        if not sync_workers is None:
+            with profiling.stage('rsync'):
+                for sync_worker in sync_workers.values():
+                    sync_worker.finish()
+        if not sweep_configurations is None and not args.dryrun:
+            evaluate_sweep(results_folder)
     else:
+        if StageMode[args.stage] != StageMode.none:
+            print('WARNING: Staging is not supported with Slurm and will be ignored.')
         execute_commands_slurm(commands, setup_folder, dataset_config['slurm_mem'], dataset_config['slurm_time'],
-                               args.mail_type, args.num_tasks, args.num_nodes)
-
-
-def execute_commands(commands, dryrun, setup_folder):
-    for command in commands:
-        print('Working Dir: {}'.format(command.working_dir))
-        print('Command: {}'.format(command.command))
-        if not dryrun:
-            subprocess.run(command.command, shell=True, cwd=command.working_dir)
-            for move_command in command.post_run_commands:
-                print('Executing: {}'.format(move_command))
-                subprocess.run(move_command, shell=True)
-    subprocess.run('echo Finished > {}'.format(setup_folder / 'Finished.txt'), shell=True)
+                               args.mail_type, args.num_tasks, args.num_nodes, other_setup_folders)
+
+
+def get_adaptive_commands(commands, adaptive_iterations: AdaptiveIterations, create_commands, setup_folder):
+    """Yield the initial commands and afterwards the commands for the additional iterations chosen by
+    adaptive_iterations, until no more iterations are needed. As this is a generator, the following iterations are
+    only decided on when the previous commands have been executed."""
+    while len(commands) > 0:
+        yield from commands
+        runs = adaptive_iterations.next_runs()
+        print('Adaptive iterations: running {} more iterations.'.format(len(runs)))
+        update_setup(setup_folder, {'iterations_per_sequence': dict(adaptive_iterations.iterations)})
+        commands = create_commands(runs)
+
+
+def execute_commands(commands, dryrun, setup_folder, staging_cache=None, on_run_finished=None,
+                     other_setup_folders=()):
+    """
+    Run the commands one after another.
+    :param staging_cache: Optional StagingCache used to stage the dataset files of each sequence before running it.
+    :param on_run_finished: Optional function called with the RunCommand after each run (and its post run commands).
+    :param other_setup_folders: Setup folders of further results run by the commands (e.g. the configurations of a
+    sweep), which are marked as finished as well.
+    """
+    try:
+        for command in commands:
+            working_dir = command.working_dir
+            if not staging_cache is None and not dryrun and not command.sequence_folder is None:
+                with profiling.stage('stage_dataset'):
+                    working_dir = staging_cache.stage(command.sequence_folder, command.input_paths, working_dir)
+            print('Working Dir: {}'.format(working_dir))
+            print('Command: {}'.format(command.command))
+            if not dryrun:
+                with profiling.stage('run'):
+                    subprocess.run(command.command, shell=True, cwd=working_dir)
+                with profiling.stage('post_run_commands'):
+                    for move_command in command.post_run_commands:
+                        print('Executing: {}'.format(move_command))
+                        subprocess.run(move_command, shell=True)
+                profiling.count('runs')
+                if not on_run_finished is None:
+                    on_run_finished(command)
+    finally:
+        if not staging_cache is None:
+            staging_cache.evict_all()
+    for folder in [setup_folder] + list(other_setup_folders):
+        subprocess.run('echo Finished > {}'.format(folder / 'Finished.txt'), shell=True)
+
+
+def create_results_folder(results_folder, temporary):
+    if not results_folder.exists():
+        results_folder.mkdir()
+    else:
+        print('WARNING: Results folder already exists.')
+        if temporary:
+            subprocess.run('rm -r {}'.format(results_folder), shell=True)
+            results_folder.mkdir()
+        else:
+            sys.exit(1)
 
 
 def create_dmvio_commands(dmvio_executable, dmvio_folder, dataset_config, results_folder, num_iter, only_seq,
                           output_type, realtime,
-                          withgui, noimu, quiet, custom_dmvio_args, dmvio_settings_file, gdb):
+                          withgui, noimu, quiet, custom_dmvio_args, dmvio_settings_file, gdb,
+                          output_compression=OutputCompression.none, output_filter=None, runs=None,
+                          watchdog_criteria=None, run_limits=None):
+    """
+    Create the commands for running DM-VIO on all (selected) sequences of the dataset.
+    :param runs: If not None only commands for these runs are created, given as list of (sequence name with
+    res_prefix, iteration).
+    :param watchdog_criteria: If not None DM-VIO is run with the watchdog, using the DivergenceCriteria in this dict
+    for each sequence (with res_prefix).
+    :param run_limits: If not None all runs use the watchdog, and the RunLimits in this dict are applied to each
+    sequence (with res_prefix) contained in it.
+    """
     # ------------------------------ Create DSO Commands: ------------------------------
     # - Argument-specific parts: nogui, preset (realtime or not) -> Set here (passed arguments).
     # - Dataset-specific parts: camera-folder-name, (imu, camera and photometric) calibration-name, mode (with
@@ -250,8 +597,12 @@ def create_dmvio_commands(dmvio_executable, dmvio_folder, dataset_config, result
     for i, folder in enumerate(folders):
         if not only_seq is None and i != only_seq:
             continue
-        for iter in range(num_iter):
-            working_directory = dataset_path / folder / afterpath
+        working_directory = dataset_path / folder / afterpath
+        sequence_paths = SequencePaths(working_directory, parse_dataset_args(dataset_arguments))
+        input_paths = [sequence_paths.images, sequence_paths.times, sequence_paths.imu] + list(
+            sequence_paths.other_files.values())
+        iterations = range(num_iter) if runs is None else [iter for name, iter in runs if name == res_prefix + folder]
+        for iter in iterations:
             run_name = '{}{}_{}'.format(res_prefix, folder, iter)
             results_folder_sequence = results_folder / run_name
             results_folder_sequence.mkdir()
@@ -272,12 +623,40 @@ def create_dmvio_commands(dmvio_executable, dmvio_folder, dataset_config, result
                 runoutput_filename = '{}_runoutput.txt'.format(run_name)
                 if not runoutput_folder.exists():
                     runoutput_folder.mkdir()
-                pipestring = ' > {} 2>&1'.format(runoutput_folder / runoutput_filename)
+                if output_compression == OutputCompression.none and output_filter is None:
+                    pipestring = ' > {} 2>&1'.format(runoutput_folder / runoutput_filename)
+                else:
+                    # Filter and compress the output while it is written, which saves a lot of space (and I/O on
+                    # shared storage) for non-quiet runs.
+                    pipestring = ' 2>&1'
+                    if not output_filter is None:
+                        # grep returns 1 if no line matches, which should not count as a failed run.
+                        pipestring += " | {{ grep -E --line-buffered '{}' || true; }}".format(
+                            output_filter.replace("'", "'\\''"))
+                    if output_compression != OutputCompression.none:
+                        if output_compression == OutputCompression.gzip:
+                            pipestring += ' | gzip -c'
+                            runoutput_filename += '.gz'
+                        else:
+                            pipestring += ' | zstd -q -c'
+                            runoutput_filename += '.zst'
+                    pipestring += ' > {}'.format(runoutput_folder / runoutput_filename)
 
             command = "{} {}{}".format(dmvio_executable, full_arguments, pipestring)
             if gdb:
+                # Wrapped like any other command below, so that a hanging run in gdb is still limited.
                 command = "gdb -ex='set confirm on' -ex=run -ex=quit --args {} {}".format(dmvio_executable,
                                                                                           full_arguments)
+            criteria = None if watchdog_criteria is None else watchdog_criteria[res_prefix + folder]
+            limits = None if run_limits is None else run_limits.get(res_prefix + folder)
+            # With limits every run is wrapped (even without limits for its sequence yet), so that its runtime and
+            # peak memory are recorded for deriving the limits of future runs.
+            if not criteria is None or not run_limits is None:
+                command = '{} {}'.format(get_watchdog_command(results_folder_sequence, criteria, limits), command)
+            if '|' in pipestring and not gdb:
+                # Without pipefail the exit status of the pipeline is the one of the last command (e.g. gzip), so a
+                # crashed run would not be noticed (sh does not support pipefail, so bash is used).
+                command = 'bash -o pipefail -c {}'.format(shlex.quote(command))
 
             move_commands = []
             traj_results_folder = results_folder / 'results'
@@ -290,7 +669,8 @@ def create_dmvio_commands(dmvio_executable, dmvio_folder, dataset_config, result
                                                    traj_results_folder / '{}.txt'.format(run_name)))
             move_commands.append('cp {} {}'.format(results_folder_sequence / 'resultKFs.txt',
                                                    kf_results_folder / '{}.txt'.format(run_name)))
-            commands.append(RunCommand(command, working_directory, move_commands))
+            commands.append(RunCommand(command, working_directory, move_commands, dataset_path / folder, input_paths,
+                                       run_name, limits, results_folder))
     return commands
 
 
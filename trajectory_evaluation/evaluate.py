@@ -26,6 +26,7 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import functools
 from enum import Enum
 from pathlib import Path
 import trajectory_evaluation.evaluate_ate as evaluate_ate
@@ -33,6 +34,11 @@ import trajectory_evaluation.associate as associate
 import numpy as np
 from ruamel.yaml import YAML
 from tqdm import tqdm
+import utils.profiling as profiling
+from utils.run_watchdog import read_run_status, RunStatus
+
+
+GROUNDTRUTH_MANIFEST = 'manifest.yaml'
 
 
 class Dataset(Enum):
@@ -48,7 +54,8 @@ class EvalResults:
     folder_names
         names of all the sequences of the dataset evaluated on.
     errors : np.array(num_iter x num_sequences)
-        rmse (absolute trajectory error) for each run
+        rmse (absolute trajectory error) for each run. Failed runs are inf, iterations which have not been run for a
+        sequence (with adaptive iterations) are NaN.
     scales : np.array(num_iter x num_sequences)
         the estimated scale for each run.
     scale_errors : np.array(num_iter x num_sequences)
@@ -64,6 +71,8 @@ class EvalResults:
     median_index : np.array(num_sequences)
         index of the median result (in terms of rmse) for each sequence. If num_iter is even this will be the middle
         result with larger error.
+    groundtruth_folder : str
+        folder with the groundtruth manifest the run was evaluated against, None for the full dataset.
     """
 
     def __init__(self, run_folder, folder_names, errors, scales, scale_errors, percentage_done, dataset: Dataset):
@@ -75,14 +84,17 @@ class EvalResults:
         self.percentage_done = percentage_done
         self.name = None
         self.dataset = dataset
+        self.groundtruth_folder = None
 
         self.num_iter = errors.shape[0]
 
-        # Compute median results.
-        self.median_errors = np.median(errors, axis=0)
+        # Compute median results (ignoring iterations which have not been run).
+        num_runs = (~np.isnan(errors)).sum(axis=0)
+        self.median_errors = np.median(errors, axis=0) if num_runs.min() == self.num_iter else np.nanmedian(errors,
+                                                                                                          axis=0)
 
-        # Note: When even we use the worse of the middle results.
-        self.median_index = np.argsort(errors, axis=0)[errors.shape[0] // 2, :]
+        # Note: When even we use the worse of the middle results. NaNs are sorted to the end.
+        self.median_index = np.take_along_axis(np.argsort(errors, axis=0), num_runs[None, :] // 2, axis=0)[0]
         # We don't save median scale, but the scale of the median result (according to rmse).
         # The reason is that we think it makes more sense to sort results based on rmse than on scale error, but
         # probably both would be fine.
@@ -99,23 +111,29 @@ def evaluate_with_config(pair, always_reevaluate=False):
     """
     folder, setup = pair
 
-    dataset_name = setup['dataset']
+    dataset = get_dataset(setup['dataset'])
     noimu_bool = 'noimu' in setup and setup['noimu']
+    groundtruth_folder = setup['groundtruth_folder'] if 'groundtruth_folder' in setup else None
+    iterations_per_sequence = setup['iterations_per_sequence'] if 'iterations_per_sequence' in setup else None
+
+    return evaluate_run(folder, dataset, setup['num_iter'], None, always_reevaluate, groundtruth_folder,
+                        iterations_per_sequence)
 
+
+def get_dataset(dataset_name):
+    """Get the Dataset for a dataset name in configs.yaml (which can also be a variant like 4seasonsCR)."""
     if 'tumvi' in dataset_name:
-        dataset = Dataset.tumvi
+        return Dataset.tumvi
     elif '4seasons' in dataset_name:
-        dataset = Dataset.four_seasons
+        return Dataset.four_seasons
     elif 'euroc' in dataset_name:
-        dataset = Dataset.euroc
+        return Dataset.euroc
     else:
         raise ValueError("ERROR: Unknown dataset")
 
-    return evaluate_run(folder, dataset, setup['num_iter'], None, always_reevaluate)
-
 
-def evaluate_run(run_folder: Path, dataset: Dataset, num_iter: int, name=None, always_reevaluate=False) -> (
-        EvalResults, EvalResults):
+def evaluate_run(run_folder: Path, dataset: Dataset, num_iter: int, name=None, always_reevaluate=False,
+                 groundtruth_folder=None, iterations_per_sequence=None) -> (EvalResults, EvalResults):
     """Evaluate all sequences and iterations of a run and save it to file (and return it).
     If the evaluation result has already been saved to file it will just load it.
         returns
@@ -125,14 +143,20 @@ def evaluate_run(run_folder: Path, dataset: Dataset, num_iter: int, name=None, a
     :param num_iter: Number of iterations this run used.
     :param name: Name which will be stored in the returned results.
     :param always_reevaluate: If true the results will be re-evaluated even if results have already been saved to file.
+    :param groundtruth_folder: Folder with a groundtruth manifest (e.g. created by create_mini_dataset.py). If None the
+    groundtruth for the full dataset is used.
+    :param iterations_per_sequence: dict with the number of iterations run for each sequence (if they differ, e.g.
+    with adaptive iterations). Iterations which have not been run are NaN in the results instead of failed (inf).
     :return: result (uses estimated scale), result_gt_scaled (uses groundtruth scale); both of type EvalResults.
     """
     np.set_printoptions(precision=3, suppress=True)
     # First check if result already exists.
     if not always_reevaluate:
-        result, result_gt_scale = load_eval_results_from_folder(run_folder, dataset)
+        with profiling.stage('load_eval_results'):
+            result, result_gt_scale = load_eval_results_from_folder(run_folder, dataset)
         if not result is None:
             print('Loaded pre-evaluated results from file.')
+            result.groundtruth_folder = result_gt_scale.groundtruth_folder = groundtruth_folder
             if not name is None:
                 result.name = name
                 result_gt_scale.name = 'gt_scale_' + name
@@ -140,7 +164,8 @@ def evaluate_run(run_folder: Path, dataset: Dataset, num_iter: int, name=None, a
 
     print("Evaluating now.")
 
-    sequences, time_threshold = get_groundtruth_data(dataset)
+    with profiling.stage('load_groundtruth'):
+        sequences, time_threshold = get_groundtruth_data(dataset, groundtruth_folder)
 
     # Rows are iterations, columns are sequences.
     all_percentage_done = np.zeros((num_iter, len(sequences)))
@@ -153,49 +178,28 @@ def evaluate_run(run_folder: Path, dataset: Dataset, num_iter: int, name=None, a
 
     for i, sequence in enumerate(tqdm(sequences, leave=False)):
         for iter in range(num_iter):
-            results_file = run_folder / 'results' / '{}_{}.txt'.format(sequence.folder, iter)
-            if results_file.exists():
-                # Read scale to use from scale file.
-                scale_file = run_folder / '{}_{}'.format(sequence.folder, iter) / 'scalesdso.txt'
-                if not scale_file.exists():
-                    print("WARNING: No scale file exists --> assuming scale of 1.")
-                    scale = 1.0
-                else:
-                    try:
-                        scale = get_estimated_scale(scale_file)
-                    except IndexError:
-                        print("WARNING: Could not get scale for result {}. --> Skipping.".format(results_file))
-                        continue
-
-                result, result_gt_scale, min_and_max_time = evaluate_ate.compute_ate_fast(sequence.groundtruth_data,
-                                                                                          results_file, scale, 0.05,
-                                                                                          allow_unassociated=(
-                                                                                                  dataset !=
-                                                                                                  Dataset.euroc))
-
-                # Compute percentage of the sequence completed and invalidate result if it is too low.
-                percentage_done = (min_and_max_time[1] - min_and_max_time[0]) / sequence.duration
-                # Enforce that incomplete sequences don't count as success.
-                if percentage_done < time_threshold:
-                    if not result is None:
-                        result.rmse = float('inf')
-                    result_gt_scale.rmse = float('inf')
+            if not iterations_per_sequence is None and iter >= iterations_per_sequence.get(sequence.folder, num_iter):
+                all_rmse[iter, i] = all_scale_errors[iter, i] = all_rmse_gt_scaled[iter, i] = np.nan
+                continue
+            evaluated = evaluate_sequence_run(run_folder, sequence, iter, dataset, time_threshold)
+            if not evaluated is None:
+                result, result_gt_scale, percentage_done = evaluated
                 all_percentage_done[iter, i] = percentage_done
                 all_rmse[iter, i] = result.rmse
                 all_scales[iter, i] = result.scale
                 all_scale_errors[iter, i] = get_scale_error(result.scale, result_gt_scale.scale)
                 all_rmse_gt_scaled[iter, i] = result_gt_scale.rmse
                 all_gt_scales[iter, i] = result_gt_scale.scale
-            else:
-                print('WARNING: Skipping because does not exist: {}'.format(results_file))
 
     folder_names = [sequence.folder for sequence in sequences]
     result = EvalResults(run_folder, folder_names, all_rmse, all_scales, all_scale_errors, all_percentage_done, dataset)
     result_gt_scale = EvalResults(run_folder, folder_names, all_rmse_gt_scaled, all_gt_scales,
                                   np.zeros((num_iter, len(sequences))), all_percentage_done, dataset)
+    result.groundtruth_folder = result_gt_scale.groundtruth_folder = groundtruth_folder
 
     # Save result.
-    save_results_to_folder(run_folder, result, result_gt_scale)
+    with profiling.stage('save_eval_results'):
+        save_results_to_folder(run_folder, result, result_gt_scale)
 
     if not name is None:
         result.name = name
@@ -204,6 +208,126 @@ def evaluate_run(run_folder: Path, dataset: Dataset, num_iter: int, name=None, a
     return result, result_gt_scale
 
 
+class LazyRun:
+    """Evaluates (or loads) a run on first use and keeps both results, which are shared by the two LazyEvalResults."""
+
+    def __init__(self, run_folder: Path, dataset: Dataset, num_iter: int, name=None, groundtruth_folder=None,
+                 iterations_per_sequence=None):
+        self.run_folder = run_folder
+        self.dataset = dataset
+        self.num_iter = num_iter
+        self.name = name
+        self.groundtruth_folder = groundtruth_folder
+        self.iterations_per_sequence = iterations_per_sequence
+        self.results = None
+
+    def get(self):
+        if self.results is None:
+            self.results = evaluate_run(self.run_folder, self.dataset, self.num_iter, self.name,
+                                        groundtruth_folder=self.groundtruth_folder,
+                                        iterations_per_sequence=self.iterations_per_sequence)
+        return self.results
+
+
+class LazyEvalResults:
+    """Handle for EvalResults which are only evaluated or loaded when one of their attributes is accessed.
+    Can be used everywhere instead of EvalResults. Use resolve() to get the actual EvalResults."""
+
+    # Available without evaluating. Changing them (e.g. res.name = 'baseline') is applied to the EvalResults as well.
+    HANDLE_ATTRIBUTES = ['run_folder', 'dataset', 'name']
+
+    def __init__(self, lazy_run: LazyRun, gt_scale: bool):
+        object.__setattr__(self, 'lazy_run', lazy_run)
+        object.__setattr__(self, 'gt_scale', gt_scale)
+        self.run_folder = lazy_run.run_folder
+        self.dataset = lazy_run.dataset
+        self.name = lazy_run.name if not gt_scale or lazy_run.name is None else 'gt_scale_' + lazy_run.name
+
+    def resolve(self) -> EvalResults:
+        result = self.lazy_run.get()[1 if self.gt_scale else 0]
+        for attribute in self.HANDLE_ATTRIBUTES:
+            setattr(result, attribute, self.__dict__[attribute])
+        return result
+
+    def __setattr__(self, attribute, value):
+        if attribute in self.HANDLE_ATTRIBUTES:
+            object.__setattr__(self, attribute, value)
+            if self.lazy_run.results is None:
+                return  # Applied when resolving.
+        # Other attributes only exist in the EvalResults.
+        setattr(self.resolve(), attribute, value)
+
+    def __getattr__(self, attribute):
+        # Only called for attributes not set in __init__. Special attributes (e.g. used by copy and pickle) are not
+        # forwarded, as they are looked up before the object is initialized.
+        if attribute.startswith('__') or attribute == 'lazy_run':
+            raise AttributeError(attribute)
+        return getattr(self.resolve(), attribute)
+
+    def __repr__(self):
+        return 'LazyEvalResults({}, evaluated={})'.format(self.name, not self.lazy_run.results is None)
+
+
+def lazy_evaluate_run(run_folder: Path, dataset: Dataset, num_iter: int, name=None, groundtruth_folder=None,
+                      iterations_per_sequence=None) -> (LazyEvalResults, LazyEvalResults):
+    """Like evaluate_run, but the run is only evaluated (or loaded from file) on first access of the results.
+    :return: result (uses estimated scale), result_gt_scaled (uses groundtruth scale); both of type LazyEvalResults.
+    """
+    lazy_run = LazyRun(run_folder, dataset, num_iter, name, groundtruth_folder, iterations_per_sequence)
+    return LazyEvalResults(lazy_run, False), LazyEvalResults(lazy_run, True)
+
+
+def resolve_results(results):
+    """Return the EvalResults for a list of (possibly lazy) results."""
+    return [result.resolve() if isinstance(result, LazyEvalResults) else result for result in results]
+
+
+def evaluate_sequence_run(run_folder: Path, sequence, iter, dataset: Dataset, time_threshold):
+    """Evaluate a single run (one iteration on one sequence).
+    :param sequence: GroundtruthDataForSequence of the sequence.
+    :return: result, result_gt_scale (both AlignmentResult with inf rmse if the run is incomplete) and the percentage of
+    the sequence completed, or None if the run failed (e.g. was terminated by the watchdog) or cannot be evaluated.
+    """
+    results_file = run_folder / 'results' / '{}_{}.txt'.format(sequence.folder, iter)
+    # Saved if the run was executed with the watchdog or with limits.
+    run_status = read_run_status(run_folder / '{}_{}'.format(sequence.folder, iter))
+    terminated = [RunStatus.diverged, RunStatus.timeout, RunStatus.memory_limit]
+    if not run_status is None and (run_status['status'] in terminated or (
+            run_status['status'] == RunStatus.crashed and not results_file.exists())):
+        print('WARNING: Run {}_{} failed ({}: {}).'.format(sequence.folder, iter, run_status['status'],
+                                                         run_status['reason']))
+        return None
+    if not results_file.exists():
+        print('WARNING: Skipping because does not exist: {}'.format(results_file))
+        return None
+    # Read scale to use from scale file.
+    scale_file = run_folder / '{}_{}'.format(sequence.folder, iter) / 'scalesdso.txt'
+    if not scale_file.exists():
+        print("WARNING: No scale file exists --> assuming scale of 1.")
+        scale = 1.0
+    else:
+        try:
+            scale = get_estimated_scale(scale_file)
+        except IndexError:
+            print("WARNING: Could not get scale for result {}. --> Skipping.".format(results_file))
+            return None
+
+    profiling.count('evaluated_runs')
+    result, result_gt_scale, min_and_max_time = evaluate_ate.compute_ate_fast(sequence.groundtruth_data, results_file,
+                                                                              scale, 0.05,
+                                                                              allow_unassociated=(
+                                                                                      dataset != Dataset.euroc))
+
+    # Compute percentage of the sequence completed and invalidate result if it is too low.
+    percentage_done = (min_and_max_time[1] - min_and_max_time[0]) / sequence.duration
+    # Enforce that incomplete sequences don't count as success.
+    if percentage_done < time_threshold:
+        if not result is None:
+            result.rmse = float('inf')
+        result_gt_scale.rmse = float('inf')
+    return result, result_gt_scale, percentage_done
+
+
 def get_scale_error(estimated_scale, gt_scale):
     scale_err = gt_scale / estimated_scale
 
@@ -303,10 +427,31 @@ class GroundtruthDataForSequence:
         self.duration = real_end_time - real_start_time
 
 
-def get_groundtruth_data(dataset: Dataset):
+@functools.lru_cache(maxsize=None)
+def get_manifest_trajectory_lengths(groundtruth_folder):
+    """Return dict with the trajectory length (in meters) of each sequence stored in the groundtruth manifest."""
+    with open(Path(groundtruth_folder) / GROUNDTRUTH_MANIFEST) as manifest_file:
+        manifest = YAML(typ='safe').load(manifest_file)
+    return {sequence['folder']: sequence['trajectory_length'] for sequence in manifest['sequences'] if
+            'trajectory_length' in sequence}
+
+
+# Cached, as long-running processes (e.g. evaluation_daemon.py) evaluate many runs against the same groundtruth.
+@functools.lru_cache(maxsize=None)
+def get_groundtruth_data(dataset: Dataset, groundtruth_folder=None):
     # We don't just read them from configs.yaml, so that different configs (e.g. 4seasons and 4seasonsCR) can be
     # compared against each other without having the risk that different params are used for the evaluation.
 
+    if not groundtruth_folder is None:
+        # Groundtruth of a derived dataset (e.g. a mini dataset), which describes its sequences in a manifest.
+        path = Path(groundtruth_folder)
+        with open(path / GROUNDTRUTH_MANIFEST) as manifest_file:
+            manifest = YAML(typ='safe').load(manifest_file)
+        return [GroundtruthDataForSequence(sequence['folder'], sequence['start_time'], sequence['end_time'],
+                                           path / 'timesFiles' / '{}.txt'.format(sequence['folder']),
+                                           path / 'gtFiles' / '{}.txt'.format(sequence['folder'])
+                                           ) for sequence in manifest['sequences']], manifest['time_threshold']
+
     # groundtruth files are stored in this repository.
     groundtruth_folder = Path('groundtruth_files')
     if dataset == Dataset.euroc:
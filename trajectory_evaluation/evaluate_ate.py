@@ -43,6 +43,7 @@ import sys
 import numpy
 import argparse
 import trajectory_evaluation.associate as associate
+import utils.profiling as profiling
 
 class AlignmentResult:
     def __init__(self, rot, trans, trans_error, scale):
@@ -75,7 +76,7 @@ def align(model,data, scale = 1):
     W = numpy.zeros( (3,3) )
     for column in range(model.shape[1]):
         W += numpy.outer(model_zerocentered[:,column],data_zerocentered[:,column])
-    U,d,Vh = numpy.linalg.linalg.svd(W.transpose())
+    U,d,Vh = numpy.linalg.svd(W.transpose())
     S = numpy.matrix(numpy.identity( 3 ))
     if(numpy.linalg.det(U) * numpy.linalg.det(Vh)<0):
         S[2,2] = -1
@@ -140,17 +141,20 @@ def plot_traj(ax,stamps,traj,style,color,label):
 def compute_ate_fast(first_list, second_file, scale, max_difference, allow_unassociated):
     """Modified version of compute_ate which uses faster association code."""
     # first is gt data, second is groundtruth data
-    second_list = associate.read_file_list(second_file)
+    with profiling.stage('read_result'):
+        second_list = associate.read_file_list(second_file)
 
-    matches, min_and_max_time = associate.associate_fast(first_list, second_list, float(max_difference), allow_unassociated)
+    with profiling.stage('associate'):
+        matches, min_and_max_time = associate.associate_fast(first_list, second_list, float(max_difference), allow_unassociated)
     if len(matches) < 2:
         raise RuntimeError(
             "Couldn't find matching timestamp pairs between groundtruth and estimated trajectory! Did you choose the correct sequence?")
 
-    first_xyz = numpy.matrix([[float(value) for value in first_list[a][0:3]] for a, b in matches]).transpose()
-    second_xyz_unscaled = numpy.matrix(
-        [[float(value) for value in second_list[b][0:3]] for a, b in matches]).transpose()
-    result, result_gt_scale = align(second_xyz_unscaled, first_xyz, scale)
+    with profiling.stage('align'):
+        first_xyz = numpy.matrix([[float(value) for value in first_list[a][0:3]] for a, b in matches]).transpose()
+        second_xyz_unscaled = numpy.matrix(
+            [[float(value) for value in second_list[b][0:3]] for a, b in matches]).transpose()
+        result, result_gt_scale = align(second_xyz_unscaled, first_xyz, scale)
 
     return result, result_gt_scale, min_and_max_time
 
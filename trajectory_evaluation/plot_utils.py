@@ -26,7 +26,7 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from trajectory_evaluation.evaluate import EvalResults, Dataset
+from trajectory_evaluation.evaluate import EvalResults, Dataset, get_manifest_trajectory_lengths
 import numpy as np
 from typing import List
 
@@ -40,9 +40,9 @@ def get_sorted_errors(results: List[EvalResults]):
             'WARNING: Not all evaluated results have the same number of iterations. Only using the first {} runs for '
             'each result'.format(
                 min_iter))
-    errors = [result.errors[0:min_iter, :] for result in results]
-    sorted_errors = [np.sort(error.flatten()) for error in errors]
-    return sorted_errors
+    # Sorting all results at once is much faster than sorting them one by one when comparing many results.
+    errors = np.stack([result.errors[0:min_iter, :] for result in results])
+    return list(np.sort(errors.reshape(len(results), -1), axis=1))
 
 
 def find_between(string, begin, end):
@@ -61,11 +61,26 @@ def get_short_folder_names(folder_names: List[str], dataset):
 
 
 def get_normalizer(result):
-    """Return array to convert results to drift in percent."""
+    """Return array to convert results to drift in percent.
+    For derived datasets (e.g. mini datasets) the trajectory lengths stored in the groundtruth manifest are used."""
     dataset = result.dataset
-    if dataset == Dataset.tumvi:
-        trajectory_lengths = [305, 322, 300, 114, 270, 918, 561, 566, 688, 458, 771, 2656, 1601, 1531, 928, 1168, 2045,
-                              1748, 986, 146, 142, 135, 68, 131, 67, 289, 299, 383]
+    groundtruth_folder = getattr(result, 'groundtruth_folder', None)
+    if not groundtruth_folder is None:
+        map = get_manifest_trajectory_lengths(groundtruth_folder)
+        missing = [name for name in result.folder_names if not name in map]
+        if len(missing) > 0:
+            raise ValueError("No trajectory length for {} in the manifest of {} (recreate it with "
+                             "create_mini_dataset.py).".format(', '.join(missing), groundtruth_folder))
+        trajectory_lengths = [map[name] for name in result.folder_names]
+    elif dataset == Dataset.tumvi:
+        names = ['corridor1', 'corridor2', 'corridor3', 'corridor4', 'corridor5', 'magistrale1', 'magistrale2',
+                 'magistrale3', 'magistrale4', 'magistrale5', 'magistrale6', 'outdoors1', 'outdoors2', 'outdoors3',
+                 'outdoors4', 'outdoors5', 'outdoors6', 'outdoors7', 'outdoors8', 'room1', 'room2', 'room3', 'room4',
+                 'room5', 'room6', 'slides1', 'slides2', 'slides3']
+        lengths = [305, 322, 300, 114, 270, 918, 561, 566, 688, 458, 771, 2656, 1601, 1531, 928, 1168, 2045, 1748, 986,
+                   146, 142, 135, 68, 131, 67, 289, 299, 383]
+        map = {'tumvi_dataset-{}_512_16'.format(name): length for name, length in zip(names, lengths)}
+        trajectory_lengths = [map[name] for name in result.folder_names]
     elif dataset == Dataset.four_seasons:
         map = dict()
         map['4seasons_business_2020-10-08_09-30-57'] = 3011.6408305623318
@@ -28,6 +28,9 @@
 
 import copy
 from trajectory_evaluation.plot_utils import *
+from trajectory_evaluation.evaluate import resolve_results
+from trajectory_evaluation.results_collection import ResultsCollection, is_normalized
+from trajectory_evaluation.runoutput import get_timing_summary
 from tabulate import tabulate
 import matplotlib.pyplot as plt
 
@@ -37,6 +40,7 @@ def square_plot(result: EvalResults):
     For EuRoC rmse until 0.5 is shown (like in the DSO and VI-DSO papers).
     For the other datasets drift until 2 percent is shown.
     """
+    result = resolve_results([result])[0]
     dataset = result.dataset
     if dataset == Dataset.euroc:
         # RMSE until 0.5 for EuRoC
@@ -54,7 +58,7 @@ def square_plot_base(result: EvalResults, vmax=0.5):
     :param vmax: Maximum result still showing in the plot (all results worse than this will be shown in red).
     """
     fig = plt.figure()
-    errors = result.errors
+    errors = result.errors.copy()
     errors[errors == np.inf] = 2000  # to show them in plot
     cmap = plt.get_cmap('jet', 100)
     plt.imshow(errors, vmin=0, vmax=vmax, cmap=cmap)
@@ -67,26 +71,43 @@ def square_plot_base(result: EvalResults, vmax=0.5):
 def results_table(results: List[EvalResults]):
     """Prints a table with the results (automatically choosing the right format for each dataset).
     For EuRoC it will also print the mean rmse, whereas for other datasets it will print mean drift.
+    If the run outputs have been saved, it also prints the median realtime factor and percentiles of the time needed
+    per frame (in ms).
     """
-    dataset = results[0].dataset
+    collection = ResultsCollection(results)
+    dataset = collection.dataset
     mean_header = 'mean' if dataset == Dataset.euroc else 'mean drift'
     transpose = dataset != Dataset.euroc
-    header = ['result', ''] + get_short_folder_names(results[0].folder_names, dataset) + [mean_header]
+    header = ['result', ''] + get_short_folder_names(collection.folder_names, dataset) + [mean_header]
+    timing_summaries = [get_timing_summary(run_folder, collection.folder_names, num_iter) for run_folder, num_iter in
+                        zip(collection.run_folders, collection.num_iters)]
+    show_timing = any(not summary is None for summary in timing_summaries)
+    timing_keys = ['realtime_factor']
+    # The per-frame latency is only available if the run output patterns for it have been set.
+    if any(not summary is None and not np.isnan(summary['latency_p50']) for summary in timing_summaries):
+        timing_keys += ['latency_p50', 'latency_p90', 'latency_p99']
+    if show_timing:
+        header += ['RT factor', 'p50 ms', 'p90 ms', 'p99 ms'][:len(timing_keys)]
+    all_median_errors = collection.median_errors()
+    # For EuRoC the mean rmse is shown, for the other datasets the mean drift.
+    all_mean_median_errors = collection.median_errors(is_normalized(dataset)).round(
+        3 if dataset == Dataset.euroc else 2).mean(axis=1).round(3)
+    all_median_scale_errors = collection.median_scale_errors().round(1)
     all_data = [header]
-    for result in results:
-        name = find_between(result.name, '', ':')
-        median_errors = result.median_errors.round(3 if dataset == Dataset.euroc else 2).tolist()
-        if dataset == Dataset.euroc:
-            mean_median_err = result.median_errors.round(3).mean().round(3)
-        else:
-            mean_median_err = get_normalized_result(result).median_errors.round(2).mean().round(3)
-        data = [name, 'rmse'] + median_errors + [mean_median_err]
+    for i, timing_summary in enumerate(timing_summaries):
+        name = find_between(collection.names[i], '', ':')
+        median_errors = all_median_errors[i].round(3 if dataset == Dataset.euroc else 2).tolist()
+        data = [name, 'rmse'] + median_errors + [all_mean_median_errors[i]]
+        if show_timing:
+            data += [''] * len(timing_keys) if timing_summary is None else [round(timing_summary[key], 2) for key in
+                                                                             timing_keys]
         all_data.append(data)
 
         if dataset == Dataset.euroc:
-            median_scale_errors = result.median_scale_errors.round(1).tolist()
-            mean_median_scale_err = result.median_scale_errors.round(1).mean().round(1)
-            scale_data = [name, 'scale_err'] + median_scale_errors + [mean_median_scale_err]
+            scale_data = [name, 'scale_err'] + all_median_scale_errors[i].tolist() + [
+                all_median_scale_errors[i].mean().round(1)]
+            if show_timing:
+                scale_data += [''] * len(timing_keys)
             all_data.append(scale_data)
     if transpose:
         all_data = list(zip(*all_data))
@@ -100,27 +121,27 @@ def line_plot(results: List[EvalResults]):
     For EuRoC rmse until 0.5 is shown (like in the DSO and VI-DSO papers).
     For the other datasets drift until 2 percent is shown.
     """
-    dataset = results[0].dataset
-    if not all(result.dataset == dataset for result in results):
-        raise ValueError("ERROR: Trying to compare runs on different datasets.")
-    if dataset == Dataset.euroc:
-        line_plot_base(results, 0.5)
-    elif dataset == Dataset.tumvi or dataset == Dataset.four_seasons:
-        line_plot_base(get_normalized_results(results), 2.0)
+    collection = ResultsCollection(results)
+    if collection.dataset == Dataset.euroc:
+        line_plot_base(collection, 0.5)
+    elif collection.dataset == Dataset.tumvi or collection.dataset == Dataset.four_seasons:
+        line_plot_base(collection, 2.0, normalized=True)
 
 
-def line_plot_base(results: List[EvalResults], threshold=2.0):
+def line_plot_base(results, threshold=2.0, normalized=False):
     """
     Show a cumulative error plot.
-    :param results: results to show.
+    :param results: results to show (list of EvalResults or ResultsCollection).
     :param threshold: maximum result still shown in the plot.
+    :param normalized: show drift in percent instead of rmse.
     """
-    sorted_errors_all = get_sorted_errors(results)
+    collection = results if isinstance(results, ResultsCollection) else ResultsCollection(results)
+    sorted_errors_all = collection.sorted_errors(normalized)
+    sorted_errors_all[sorted_errors_all == np.inf] = 2000  # to show them in plot
     plt.figure()
-    for i, sorted_errors in enumerate(sorted_errors_all):
-        sorted_errors[sorted_errors == np.inf] = 2000  # to show them in plot
-        plt.plot(sorted_errors, np.arange(sorted_errors.size), label=results[i].name)
-    plt.axis([0, threshold, 0, len(sorted_errors)])
+    for name, sorted_errors in zip(collection.names, sorted_errors_all):
+        plt.plot(sorted_errors, np.arange(sorted_errors.size), label=name)
+    plt.axis([0, threshold, 0, sorted_errors_all.shape[1]])
     plt.grid(True)
     plt.legend(loc='lower left')
     plt.show()
@@ -134,7 +155,8 @@ def get_normalized_results(results):
 def get_normalized_result(result: EvalResults):
     """Return copy of results normalized by trajectory length (drift in percentage)."""
     normalizer = get_normalizer(result)
-    ret = copy.deepcopy(result)
+    # The normalized arrays are new, so a shallow copy is enough.
+    ret = copy.copy(result)
     ret.errors = ret.errors / normalizer
     ret.median_errors = ret.median_errors / normalizer
     return ret
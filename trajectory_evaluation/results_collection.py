@@ -0,0 +1,132 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from typing import List
+import numpy as np
+from trajectory_evaluation.evaluate import EvalResults, Dataset, resolve_results
+from trajectory_evaluation.plot_utils import get_normalizer
+
+
+class ResultsCollection:
+    """Stacks many results of the same dataset into arrays, so that they can be compared with vectorized operations.
+    errors : np.array(num_results x max_iter x num_sequences)
+        rmse for each result and run. Iterations which a result doesn't have (because it was run with fewer
+        iterations) are NaN, failed runs are inf like in EvalResults.
+    scale_errors : np.array(num_results x max_iter x num_sequences)
+        scale error (in percentage) for each result and run, NaN where errors is NaN.
+    mask : np.array(num_results x max_iter x num_sequences)
+        True for all existing entries.
+    num_iters : np.array(num_results)
+        number of iterations of each result.
+    """
+
+    def __init__(self, results: List[EvalResults]):
+        results = resolve_results(results)
+        if len(results) == 0:
+            raise ValueError("ERROR: Cannot create a ResultsCollection without results.")
+        self.dataset = results[0].dataset
+        self.folder_names = results[0].folder_names
+        if not all(result.dataset == self.dataset for result in results):
+            raise ValueError("ERROR: Trying to compare runs on different datasets.")
+        if not all(result.folder_names == self.folder_names for result in results):
+            raise ValueError("ERROR: Trying to compare runs on different sequences.")
+        # Needed for normalizing (e.g. mini datasets have the same folder names, but shorter trajectories).
+        self.groundtruth_folder = results[0].groundtruth_folder
+        if not all(result.groundtruth_folder == self.groundtruth_folder for result in results):
+            raise ValueError("ERROR: Trying to compare runs evaluated against different groundtruth.")
+        self.names = [result.name for result in results]
+        self.run_folders = [result.run_folder for result in results]
+        self.num_iters = np.array([result.num_iter for result in results])
+
+        shape = (len(results), self.num_iters.max(), len(self.folder_names))
+        self.errors = np.full(shape, np.nan)
+        self.scale_errors = np.full(shape, np.nan)
+        for i, result in enumerate(results):
+            self.errors[i, :result.num_iter] = result.errors
+            self.scale_errors[i, :result.num_iter] = result.scale_errors
+        self.mask = ~np.isnan(self.errors)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_errors(self, normalized=False):
+        """Return the errors of all runs, normalized to drift in percent (of the trajectory length) if requested."""
+        if normalized:
+            return self.errors / get_normalizer(self)
+        return self.errors
+
+    def median_errors(self, normalized=False):
+        """Median error for each result and sequence (num_results x num_sequences)."""
+        return np.nanmedian(self.get_errors(normalized), axis=1)
+
+    def mean_median_errors(self, normalized=False):
+        """Mean over the sequences of the median errors for each result."""
+        return self.median_errors(normalized).mean(axis=1)
+
+    def median_index(self):
+        """Index of the median run (in terms of rmse) for each result and sequence. Like in EvalResults the worse of
+        the middle runs is used for an even number of iterations."""
+        # NaNs are sorted to the end, so the middle of the existing runs is at half the number of existing runs.
+        sorted_indices = np.argsort(self.errors, axis=1)
+        middle = self.mask.sum(axis=1, keepdims=True) // 2
+        return np.take_along_axis(sorted_indices, middle, axis=1)[:, 0, :]
+
+    def median_scale_errors(self):
+        """Scale error of the median run (in terms of rmse) for each result and sequence."""
+        return np.take_along_axis(self.scale_errors, self.median_index()[:, None, :], axis=1)[:, 0, :]
+
+    def sorted_errors(self, normalized=False):
+        """Sorted errors of all runs of each result (num_results x min_iter * num_sequences), which are the cumulative
+        error curves. Only the first min_iter iterations of each result are used, so that all curves are comparable.
+        """
+        min_iter = self.num_iters.min()
+        if min_iter != self.num_iters.max():
+            print('WARNING: Not all evaluated results have the same number of iterations. Only using the first {} runs '
+                  'for each result'.format(min_iter))
+        errors = self.get_errors(normalized)[:, :min_iter, :]
+        return np.sort(errors.reshape(len(self), -1), axis=1)
+
+    def success_rates(self, threshold, normalized=False):
+        """Fraction of the first min_iter runs of each result with an error below the threshold (the value of the
+        cumulative error curve at the threshold)."""
+        return (self.sorted_errors(normalized) < threshold).mean(axis=1)
+
+    def ranking(self, normalized=False, threshold=None):
+        """Indices of the results ordered from best to worst.
+        :param threshold: If None results are ranked by the mean of the median errors, otherwise by the fraction of runs
+        with an error below the threshold (which is more robust when some sequences fail).
+        """
+        if threshold is None:
+            # Stable sort, so that results with equal (e.g. infinite) errors keep their order.
+            return np.argsort(self.mean_median_errors(normalized), kind='stable')
+        return np.argsort(-self.success_rates(threshold, normalized), kind='stable')
+
+
+def is_normalized(dataset: Dataset):
+    """Results on all datasets except EuRoC are compared as drift in percent of the trajectory length."""
+    return dataset != Dataset.euroc
@@ -0,0 +1,193 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Parse timing information and events from the console output of DM-VIO (saved in runoutputs/ with
+--output=save)."""
+
+import gzip
+import io
+import re
+import subprocess
+from pathlib import Path
+import numpy as np
+
+
+class RunOutputPatterns:
+    """Regular expressions used for parsing the run output. They can be changed for custom logging in DM-VIO.
+    summary
+        dict from name to pattern (with one group) for the summary DSO / DM-VIO prints when finished.
+    frame, keyframe
+        pattern with the groups (id, milliseconds) of a line reporting the processing time of a frame / keyframe.
+        DM-VIO does not print per-frame processing times, so these are None by default (and the per-frame latency is
+        not available). Set them if your DM-VIO build logs the time of each frame.
+    events
+        dict from event name to pattern, e.g. for initializations, resets and tracking failures.
+    """
+
+    def __init__(self):
+        self.summary = {
+            'num_frames': re.compile(r'^(\d+) Frames \([\d.]+ fps\)'),
+            'ms_per_frame_single': re.compile(r'^([\d.]+)ms per frame \(single core\)'),
+            'ms_per_frame_multi': re.compile(r'^([\d.]+)ms per frame \(multi core\)'),
+            'realtime_factor_single': re.compile(r'^([\d.]+)x \(single core\)'),
+            'realtime_factor_multi': re.compile(r'^([\d.]+)x \(multi core\)'),
+        }
+        self.frame = None
+        self.keyframe = None
+        self.events = {
+            'initialized': re.compile(r'INITIALIZE FROM INITIALIZER|Initialized'),
+            'reset': re.compile(r'RESETTING|Resetting'),
+            'tracking_lost': re.compile(r'LOST|Tracking failed'),
+        }
+
+
+DEFAULT_PATTERNS = RunOutputPatterns()
+
+
+class RunTiming:
+    """Timing information of one run.
+    frame_ms, keyframe_ms : np.array
+        processing time of each frame / keyframe in milliseconds.
+    events : List[(str, int)]
+        name of each event and the number of frames processed before it (0 without a frame pattern).
+    summary : dict
+        values of the final summary (see RunOutputPatterns), missing if the run did not finish.
+    """
+
+    def __init__(self, frame_ms, keyframe_ms, events, summary):
+        self.frame_ms = frame_ms
+        self.keyframe_ms = keyframe_ms
+        self.events = events
+        self.summary = summary
+
+    def save(self, filename):
+        np.savez_compressed(filename, frame_ms=self.frame_ms, keyframe_ms=self.keyframe_ms,
+                            event_names=np.array([event[0] for event in self.events], dtype=str),
+                            event_frames=np.array([event[1] for event in self.events], dtype=np.int64),
+                            summary_names=np.array(list(self.summary.keys()), dtype=str),
+                            summary_values=np.array(list(self.summary.values()), dtype=np.float64))
+
+    @staticmethod
+    def load(filename):
+        data = np.load(filename)
+        events = list(zip(data['event_names'].tolist(), data['event_frames'].tolist()))
+        summary = dict(zip(data['summary_names'].tolist(), data['summary_values'].tolist()))
+        return RunTiming(data['frame_ms'], data['keyframe_ms'], events, summary)
+
+
+def open_runoutput(filename):
+    """Open a run output as text file, transparently decompressing it if it has been saved with
+    --output_compression."""
+    filename = Path(filename)
+    if filename.suffix == '.gz':
+        return gzip.open(filename, 'rt', errors='replace')
+    elif filename.suffix == '.zst':
+        # Decompress with the command line tool (which is also used for compressing) to not need another dependency.
+        process = subprocess.Popen(['zstd', '-q', '-d', '-c', str(filename)], stdout=subprocess.PIPE)
+        return io.TextIOWrapper(process.stdout, errors='replace')
+    return open(filename, errors='replace')
+
+
+def parse_runoutput(filename, patterns: RunOutputPatterns = DEFAULT_PATTERNS):
+    """Parse the run output line by line (so that even huge outputs are not loaded into memory)."""
+    frame_ms = []
+    keyframe_ms = []
+    events = []
+    summary = {}
+    with open_runoutput(filename) as runoutput:
+        for line in runoutput:
+            line = line.strip()
+            match = None if patterns.frame is None else patterns.frame.match(line)
+            if match:
+                frame_ms.append(float(match.group(2)))
+                continue
+            match = None if patterns.keyframe is None else patterns.keyframe.match(line)
+            if match:
+                keyframe_ms.append(float(match.group(2)))
+                continue
+            for name, pattern in patterns.summary.items():
+                match = pattern.match(line)
+                if match:
+                    summary[name] = float(match.group(1))
+            for name, pattern in patterns.events.items():
+                if pattern.search(line):
+                    events.append((name, len(frame_ms)))
+    return RunTiming(np.array(frame_ms, dtype=np.float32), np.array(keyframe_ms, dtype=np.float32), events, summary)
+
+
+def find_runoutput(run_folder: Path, run_name):
+    for filename in (run_folder / 'runoutputs').glob('{}_runoutput.txt*'.format(run_name)):
+        return filename
+    return None
+
+
+def get_run_timings(run_folder: Path, folder_names, num_iter, patterns: RunOutputPatterns = DEFAULT_PATTERNS,
+                    always_reparse=False):
+    """Get the timing of all runs, parsing the run outputs if they have not been parsed yet. Parsed timings are saved
+    to timings/ in the run folder.
+    :return: dict from run name (e.g. mav_MH_01_easy_0) to RunTiming (only for runs with a run output).
+    """
+    run_folder = Path(run_folder)
+    timings_folder = run_folder / 'timings'
+    timings = {}
+    for folder in folder_names:
+        for iter in range(num_iter):
+            run_name = '{}_{}'.format(folder, iter)
+            runoutput = find_runoutput(run_folder, run_name)
+            if runoutput is None:
+                continue
+            timing_file = timings_folder / '{}.npz'.format(run_name)
+            if not always_reparse and timing_file.exists() and \
+                    timing_file.stat().st_mtime >= runoutput.stat().st_mtime:
+                timings[run_name] = RunTiming.load(timing_file)
+                continue
+            timings[run_name] = parse_runoutput(runoutput, patterns)
+            try:
+                timings_folder.mkdir(exist_ok=True)
+                timings[run_name].save(timing_file)
+            except OSError:
+                pass  # The results might be read-only.
+    return timings
+
+
+def get_timing_summary(run_folder: Path, folder_names, num_iter):
+    """Summary of the speed of a run over all sequences and iterations.
+    :return: dict with the median realtime factor (multi core) and percentiles of the per-frame latency (NaN if not
+    available), or None if there are no run outputs.
+    """
+    timings = get_run_timings(run_folder, folder_names, num_iter)
+    if len(timings) == 0:
+        return None
+    realtime_factors = [timing.summary['realtime_factor_multi'] for timing in timings.values() if
+                        'realtime_factor_multi' in timing.summary]
+    frame_ms = np.concatenate([timing.frame_ms for timing in timings.values()])
+    summary = {'realtime_factor': np.median(realtime_factors) if len(realtime_factors) > 0 else np.nan}
+    for percentile in [50, 90, 99]:
+        summary['latency_p{}'.format(percentile)] = np.percentile(frame_ms, percentile) if len(
+            frame_ms) > 0 else np.nan
+    return summary
@@ -0,0 +1,213 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Bootstrap confidence intervals and permutation tests, to decide whether differences between results are significant
+without running more iterations. All resampling is vectorized over resamples, iterations and sequences."""
+
+from typing import List
+import numpy as np
+from tabulate import tabulate
+from trajectory_evaluation.evaluate import EvalResults, Dataset, resolve_results
+from trajectory_evaluation.plot_utils import get_normalizer, find_between
+
+
+class BootstrapResult:
+    """Bootstrap confidence intervals of the median error for each sequence and of the mean median error.
+    median_errors, lower, upper : np.array(num_sequences)
+    mean_median_error, mean_lower, mean_upper : float
+    """
+
+    def __init__(self, median_errors, lower, upper, mean_median_error, mean_lower, mean_upper, confidence):
+        self.median_errors = median_errors
+        self.lower = lower
+        self.upper = upper
+        self.mean_median_error = mean_median_error
+        self.mean_lower = mean_lower
+        self.mean_upper = mean_upper
+        self.confidence = confidence
+
+
+class PermutationTestResult:
+    """Result of a permutation test between two results.
+    difference : float
+        mean median error of the second minus the first result (negative if the second is better).
+    p_value : float
+        two-sided p-value for the null hypothesis that the runs of both results come from the same distribution.
+    """
+
+    def __init__(self, difference, p_value):
+        self.difference = difference
+        self.p_value = p_value
+
+
+def get_errors(result: EvalResults, normalized=None, failure_value=None):
+    """Errors of all runs (num_iter x num_sequences) as used for the statistics.
+    :param normalized: Use drift in percent instead of rmse. If None this is used for all datasets except EuRoC (like in
+    the plots).
+    :param failure_value: If not None failed runs (inf) are replaced by this value. This is needed for tests where
+    failed runs would otherwise make all differences infinite.
+    """
+    if normalized is None:
+        normalized = result.dataset != Dataset.euroc
+    errors = result.errors / get_normalizer(result) if normalized else result.errors.copy()
+    if not failure_value is None:
+        errors[errors == np.inf] = failure_value
+    return errors
+
+
+def get_default_failure_value(dataset: Dataset):
+    # The maximum error shown by line_plot, so a failed run counts as slightly worse than the worst shown error.
+    return 0.5 if dataset == Dataset.euroc else 2.0
+
+
+def median_ignoring_nan(values, axis):
+    """Median along the axis, ignoring NaN (iterations which have not been run). Much faster than np.nanmedian for
+    the large arrays of resamples, as it only needs one sort."""
+    if not np.isnan(values).any():
+        return np.median(values, axis=axis)
+    counts = np.expand_dims((~np.isnan(values)).sum(axis=axis), axis)
+    # NaNs are sorted to the end, so the middle of the existing values is at half their number.
+    sorted_values = np.sort(values, axis=axis)
+    lower = np.take_along_axis(sorted_values, np.maximum(counts - 1, 0) // 2, axis=axis)
+    upper = np.take_along_axis(sorted_values, counts // 2, axis=axis)
+    median = np.where(counts > 0, (lower + upper) / 2.0, np.nan)
+    return np.squeeze(median, axis=axis)
+
+
+def bootstrap_median_ci(result: EvalResults, num_resamples=10000, confidence=0.95, normalized=None,
+                        failure_value=None, seed=None):
+    """Compute bootstrap confidence intervals for the median error of each sequence and for the mean median error (the
+    value shown in results_table). The iterations of each sequence are resampled with replacement.
+    :param failure_value: If not None failed runs are replaced by this value, otherwise the upper bounds become
+    infinite as soon as a resample can contain a majority of failed runs.
+    :return: BootstrapResult
+    """
+    result = resolve_results([result])[0]
+    # Iterations which have not been run (NaN) are moved to the end of each sequence.
+    errors = np.sort(get_errors(result, normalized, failure_value), axis=0)
+    num_iter, num_sequences = errors.shape
+    num_runs = (~np.isnan(errors)).sum(axis=0)
+    rng = np.random.default_rng(seed)
+
+    # num_resamples x num_iter x num_sequences, each sequence only draws from its existing runs.
+    indices = (rng.random((num_resamples, num_iter, num_sequences)) * num_runs).astype(int)
+    resampled = np.take_along_axis(errors[None], np.minimum(indices, num_iter - 1), axis=1)
+    if num_runs.min() < num_iter:
+        # Each resample has as many runs as the sequence.
+        resampled[:, np.arange(num_iter)[:, None] >= num_runs[None, :]] = np.nan
+    resampled_medians = median_ignoring_nan(resampled, axis=1)
+    resampled_means = resampled_medians.mean(axis=1)
+
+    # Failed runs are infinite, so the interval bounds are taken from the resamples without interpolation.
+    alpha = (1.0 - confidence) / 2.0
+    lower = np.quantile(resampled_medians, alpha, axis=0, method='lower')
+    upper = np.quantile(resampled_medians, 1.0 - alpha, axis=0, method='higher')
+    median_errors = median_ignoring_nan(errors, axis=0)
+    return BootstrapResult(median_errors, lower, upper, median_errors.mean(),
+                           np.quantile(resampled_means, alpha, method='lower'),
+                           np.quantile(resampled_means, 1.0 - alpha, method='higher'), confidence)
+
+
+def permutation_test(result_a: EvalResults, result_b: EvalResults, num_resamples=10000, normalized=None,
+                     failure_value=None, seed=None):
+    """Permutation test for the difference in mean median error between two results on the same dataset.
+    The test is paired by sequence: For each sequence the runs of both results are pooled and randomly split into two
+    groups of the original sizes, so only runs on the same sequence are exchanged.
+    :param failure_value: value used for failed runs. By default the maximum error shown in line_plot.
+    :return: PermutationTestResult
+    """
+    result_a, result_b = resolve_results([result_a, result_b])
+    if result_a.dataset != result_b.dataset or result_a.folder_names != result_b.folder_names:
+        raise ValueError("ERROR: Trying to compare runs on different datasets.")
+    if failure_value is None:
+        failure_value = get_default_failure_value(result_a.dataset)
+    errors_a = get_errors(result_a, normalized, failure_value)
+    errors_b = get_errors(result_b, normalized, failure_value)
+
+    def get_difference(medians_a, medians_b):
+        return (medians_b - medians_a).mean(axis=-1)
+
+    difference = get_difference(median_ignoring_nan(errors_a, axis=0), median_ignoring_nan(errors_b, axis=0))
+
+    # Pooled runs: num_sequences x (num_iter_a + num_iter_b)
+    pooled = np.concatenate([errors_a, errors_b]).T
+    missing = np.isnan(pooled)
+    num_runs_a = (~np.isnan(errors_a)).sum(axis=0)[None, :, None]
+    num_runs = (~missing).sum(axis=1)[None, :, None]
+    rng = np.random.default_rng(seed)
+    # Random permutation of the runs of each sequence for each resample: num_resamples x num_sequences x num_runs.
+    # Iterations which have not been run get keys larger than all others, so only existing runs are exchanged.
+    keys = rng.random((num_resamples,) + pooled.shape)
+    keys[:, missing] = 2.0
+    permuted = np.take_along_axis(pooled[None], keys.argsort(axis=2), axis=2)
+    positions = np.arange(pooled.shape[1])[None, None, :]
+    resampled_differences = get_difference(
+        median_ignoring_nan(np.where(positions < num_runs_a, permuted, np.nan), axis=2),
+        median_ignoring_nan(np.where((positions >= num_runs_a) & (positions < num_runs), permuted, np.nan), axis=2))
+
+    # Two-sided, counting the observed split itself so that the p-value is never 0.
+    num_extreme = np.count_nonzero(np.abs(resampled_differences) >= np.abs(difference) - 1e-12)
+    p_value = (num_extreme + 1) / (num_resamples + 1)
+    return PermutationTestResult(difference, p_value)
+
+
+def holm_correction(p_values):
+    """Holm-Bonferroni correction of p-values for multiple comparisons."""
+    p_values = np.asarray(p_values, dtype=float)
+    order = np.argsort(p_values)
+    adjusted = np.minimum(1.0, np.maximum.accumulate(p_values[order] * (len(p_values) - np.arange(len(p_values)))))
+    result = np.empty_like(adjusted)
+    result[order] = adjusted
+    return result
+
+
+def compare_results(results: List[EvalResults], num_resamples=10000, confidence=0.95, seed=None):
+    """Print a table comparing all results against the first one: the mean median error (rmse for EuRoC, drift
+    otherwise) with its bootstrap confidence interval, the difference to the first result and the p-value of a
+    permutation test (Holm-corrected for the number of comparisons). Unlike in results_table, failed runs are counted
+    with the maximum error shown in line_plot, so that the mean stays finite.
+    :return: list of BootstrapResult and list of PermutationTestResult (None for the first result).
+    """
+    results = resolve_results(results)
+    failure_value = get_default_failure_value(results[0].dataset)
+    bootstraps = [bootstrap_median_ci(result, num_resamples, confidence, failure_value=failure_value, seed=seed) for
+                  result in results]
+    tests = [None] + [permutation_test(results[0], result, num_resamples, seed=seed) for result in results[1:]]
+    corrected_p_values = [None] + holm_correction([test.p_value for test in tests[1:]]).tolist() if len(
+        results) > 1 else [None]
+
+    mean_header = 'mean' if results[0].dataset == Dataset.euroc else 'mean drift'
+    all_data = [['result', mean_header, '{:.0f}% CI'.format(confidence * 100), 'difference', 'p-value']]
+    for result, bootstrap, test, p_value in zip(results, bootstraps, tests, corrected_p_values):
+        name = find_between(result.name, '', ':') if not result.name is None else str(result.run_folder)
+        all_data.append([name, round(bootstrap.mean_median_error, 3),
+                         '[{:.3f}, {:.3f}]'.format(bootstrap.mean_lower, bootstrap.mean_upper),
+                         '' if test is None else round(test.difference, 3),
+                         '' if p_value is None else round(p_value, 4)])
+    print(tabulate(all_data, headers='firstrow'))
+    return bootstraps, tests
@@ -0,0 +1,154 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from ruamel.yaml import YAML
+from tqdm import tqdm
+from utils.config_utils import read_config, add_dataset_variant
+from utils.preflight import parse_dataset_args
+
+# Extension and additional ImageMagick arguments for each target format. Both are stored without compression, so
+# decoding them is almost free.
+FORMATS = {
+    'pgm': ('pgm', ''),
+    'png0': ('png', '-define png:compression-level=0 -define png:compression-filter=0'),
+}
+CHUNK_SIZE = 200  # Images converted per call to ImageMagick, to avoid starting one process per image.
+
+
+def get_depths_and_signatures(files):
+    """Return the bit depth and the signature (hash over the pixel values, independent of the file format) of the
+    given images."""
+    output = subprocess.run('identify -format "%z %#\\n" {}'.format(' '.join(str(file) for file in files)),
+                            shell=True, stdout=subprocess.PIPE, check=True).stdout.decode('utf-8')
+    return [line.split() for line in output.splitlines() if line.strip() != '']
+
+
+def transcode_chunk(files, target_folder, image_format):
+    extension, format_args = FORMATS[image_format]
+    # Pass the depth explicitly so that ImageMagick never reduces 16 bit images (e.g. from TUM-VI) to 8 bit.
+    depth = get_depths_and_signatures(files[:1])[0][0]
+    subprocess.run('mogrify -path {} -format {} -depth {} {} {}'.format(
+        target_folder, extension, depth, format_args, ' '.join(str(file) for file in files)), shell=True, check=True)
+
+
+def verify_chunk(files, target_folder, image_format):
+    """Check that the transcoded images have exactly the same pixel values and bit depth as the original ones.
+    :return: list of images which differ.
+    """
+    extension = FORMATS[image_format][0]
+    converted = [target_folder / (file.stem + '.' + extension) for file in files]
+    original_values = get_depths_and_signatures(files)
+    converted_values = get_depths_and_signatures(converted)
+    return [str(converted[i]) for i in range(len(files)) if original_values[i] != converted_values[i]]
+
+
+def transcode_folder(image_folder: Path, image_format, executor):
+    """Transcode all images in the folder into the folder {image_folder}_{image_format} next to it.
+    :return: list of errors.
+    """
+    target_folder = image_folder.parent / '{}_{}'.format(image_folder.name, image_format)
+    if target_folder.exists():
+        return []
+    images = sorted(file for file in image_folder.iterdir() if file.suffix == '.png')
+    # Convert into a temporary folder which is only renamed when everything has been verified.
+    tmp_folder = image_folder.parent / '.{}.tmp'.format(target_folder.name)
+    if tmp_folder.exists():
+        shutil.rmtree(tmp_folder)
+    tmp_folder.mkdir()
+    chunks = [images[i:i + CHUNK_SIZE] for i in range(0, len(images), CHUNK_SIZE)]
+    list(executor.map(lambda chunk: transcode_chunk(chunk, tmp_folder, image_format), chunks))
+    errors = [error for chunk_errors in executor.map(lambda chunk: verify_chunk(chunk, tmp_folder, image_format),
+                                                     chunks) for error in chunk_errors]
+    if len(errors) > 0:
+        return ['Pixel values differ: {}'.format(error) for error in errors]
+    os.replace(tmp_folder, target_folder)
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Transcode the images of a dataset into an uncompressed format (keeping the bit depth), so that '
+                    'DM-VIO spends less CPU time on decoding them. The result is verified to be pixel-exact and a '
+                    'dataset config (e.g. euroc_pgm) which uses the transcoded images is added. Needs ImageMagick.')
+    parser.add_argument('--dataset', type=str, default='euroc', help='Dataset to transcode.')
+    parser.add_argument('--format', type=str, default='pgm', choices=list(FORMATS.keys()),
+                        help='Target format: pgm or png0 (PNG without compression).')
+    parser.add_argument('--config', type=str, default=None,
+                        help='Config to use (if not specified the config in defaultconfig.txt is used).')
+    parser.add_argument('--only_seq', default=None, type=int, help='Only transcode one sequence.')
+    parser.add_argument('--num_parallel', default=os.cpu_count(), type=int,
+                        help='Number of ImageMagick processes to run in parallel.')
+    args = parser.parse_args()
+
+    yaml = YAML()
+    config, config_name, general_config, all_configs = read_config(args.config, yaml)
+    if config is None:
+        print('Error: There is no default config for this machine yet. Have you called create_config.py yet?')
+        sys.exit(1)
+    dataset = args.dataset
+    if not dataset in config or not 'dataset_path' in config[dataset]:
+        print('Error: No dataset_path for {} in the config {}.'.format(dataset, config_name))
+        sys.exit(1)
+    dataset_config = general_config[dataset]
+    dataset_path = Path(config[dataset]['dataset_path'])
+
+    folders = dataset_config['folder_names']
+    if not args.only_seq is None:
+        folders = [folders[args.only_seq]]
+    image_folder_name = parse_dataset_args(dataset_config['dataset_args'])['files'].rstrip('/')
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=args.num_parallel) as executor:
+        for folder in tqdm(folders):
+            errors += transcode_folder(dataset_path / folder / dataset_config['afterpath'] / image_folder_name,
+                                       args.format, executor)
+    if len(errors) > 0:
+        print('Error: Transcoding failed:')
+        for error in errors:
+            print(error)
+        sys.exit(1)
+
+    # The transcoded folder is next to the original one, so times.txt and all other files are shared.
+    variant_name = '{}_{}'.format(dataset, args.format)
+    dataset_args = dataset_config['dataset_args'].replace('files=' + image_folder_name,
+                                                          'files={}_{}'.format(image_folder_name, args.format))
+    add_dataset_variant(config, general_config, dataset, variant_name, dataset_args)
+    print('Saving updated config, run with --dataset={} to use the transcoded images.'.format(variant_name))
+    with open('configs.yaml', 'w') as config_file:
+        yaml.dump(all_configs, config_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import warnings
+from pathlib import Path
+import numpy as np
+from trajectory_evaluation.evaluate import EvalResults, get_dataset, get_groundtruth_data, evaluate_sequence_run
+from trajectory_evaluation.statistics import bootstrap_median_ci, get_default_failure_value
+
+
+class AdaptiveIterations:
+    """Decides how many iterations to run for each sequence: All sequences start with min_iter iterations, afterwards
+    one more iteration is run for each sequence where the bootstrap confidence interval of the median error is still
+    wider than ci_width times the median error, until max_iter is reached."""
+
+    def __init__(self, run_folder: Path, dataset_name, sequence_names, min_iter, max_iter, ci_width=0.2,
+                 groundtruth_folder=None, num_resamples=2000):
+        """
+        :param sequence_names: Names of the sequences to run (with res_prefix, like the run names).
+        :param ci_width: Target width of the 95% confidence interval relative to the median error (0.2: the interval
+        may be at most 20% of the median wide). Relative, as the errors of the sequences differ by orders of magnitude.
+        """
+        self.run_folder = run_folder
+        self.dataset = get_dataset(dataset_name)
+        self.sequence_names = sequence_names
+        self.min_iter = min_iter
+        self.max_iter = max(min_iter, max_iter)
+        self.ci_width = ci_width
+        self.num_resamples = num_resamples
+        self.iterations = {name: 0 for name in sequence_names}
+
+        self.groundtruth_folder = groundtruth_folder
+        self.groundtruth, self.time_threshold = get_groundtruth_data(self.dataset, groundtruth_folder)
+        all_names = [sequence.folder for sequence in self.groundtruth]
+        missing = [name for name in sequence_names if not name in all_names]
+        if len(missing) > 0:
+            raise ValueError('No groundtruth for the sequences {}'.format(missing))
+        # Errors of all evaluated runs for all sequences of the dataset, NaN where no run has been evaluated.
+        self.errors = np.full((self.max_iter, len(all_names)), np.nan)
+
+    def next_runs(self):
+        """Evaluate the runs finished since the last call and return the runs which should be executed next as a list
+        of (sequence name, iteration). Returns an empty list when no more runs are needed."""
+        if all(num_iter == 0 for num_iter in self.iterations.values()):
+            runs = [(name, iter) for name in self.sequence_names for iter in range(self.min_iter)]
+        else:
+            self.evaluate_new_runs()
+            runs = [(name, self.iterations[name]) for name in self.get_unstable_sequences() if
+                    self.iterations[name] < self.max_iter]
+        for name, iter in runs:
+            self.iterations[name] = max(self.iterations[name], iter + 1)
+        return runs
+
+    def evaluate_new_runs(self):
+        for i, sequence in enumerate(self.groundtruth):
+            for iter in range(self.iterations.get(sequence.folder, 0)):
+                if np.isnan(self.errors[iter, i]):
+                    evaluated = evaluate_sequence_run(self.run_folder, sequence, iter, self.dataset,
+                                                      self.time_threshold)
+                    # Runs which could not be evaluated count as failed.
+                    self.errors[iter, i] = np.inf if evaluated is None else evaluated[0].rmse
+
+    def get_unstable_sequences(self):
+        """Names of the sequences where the confidence interval of the median error is wider than the target (relative
+        to the median error)."""
+        folder_names = [sequence.folder for sequence in self.groundtruth]
+        with warnings.catch_warnings():
+            # Sequences which are not run are all NaN.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            result = EvalResults(self.run_folder, folder_names, self.errors, self.errors, self.errors, self.errors,
+                                 self.dataset)
+            result.groundtruth_folder = self.groundtruth_folder
+            bootstrap = bootstrap_median_ci(result, self.num_resamples,
+                                            failure_value=get_default_failure_value(self.dataset))
+        widths = bootstrap.upper - bootstrap.lower
+        # A median error of 0 only counts as stable if the interval is 0 wide as well.
+        relative_widths = np.divide(widths, bootstrap.median_errors, out=np.where(widths > 0, np.inf, 0.0),
+                                    where=bootstrap.median_errors > 0)
+        return [name for name in self.sequence_names if relative_widths[folder_names.index(name)] > self.ci_width]
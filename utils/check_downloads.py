@@ -0,0 +1,143 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import hashlib
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.download_utils import DownloadTask, download_files, get_tmp_folder
+from utils.serve_mirror import serve_mirror
+
+
+def create_test_files(folder: Path, file_size):
+    """Create a plain file, a tar archive (with md5 file) and a zip archive with random content in folder.
+    :return: dict with the content of each archive member.
+    """
+    members = {'sequence/data/{}.bin'.format(i): os.urandom(file_size) for i in range(3)}
+    (folder / 'plain.bin').write_bytes(members['sequence/data/0.bin'])
+    with tarfile.open(folder / 'archive.tar', 'w') as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    md5 = hashlib.md5((folder / 'archive.tar').read_bytes()).hexdigest()
+    (folder / 'archive.tar.md5').write_text('{}  archive.tar\n'.format(md5))
+    with zipfile.ZipFile(folder / 'archive.zip', 'w') as zip_file:
+        for name, content in members.items():
+            zip_file.writestr(name, content)
+    return members
+
+
+def check_extracted(folder: Path, members, strip_components=0):
+    for name, content in members.items():
+        path = folder / Path(*Path(name).parts[strip_components:])
+        if not path.exists() or path.read_bytes() != content:
+            return False
+    return True
+
+
+def simulate_interrupted_runs(serve_folder: Path, target_folder: Path, base_url, members):
+    """Leave the state of interrupted runs of the download scripts behind: a zip extraction with one complete and one
+    truncated member, and a tar extraction with half of the archive in a .part file.
+    :return: path of the complete zip member, which should not be downloaded again.
+    """
+    zip_tmp_folder = get_tmp_folder(base_url + '/archive.zip', target_folder / 'zip_resumed')
+    names = sorted(members)
+    for name, size in [(names[0], len(members[names[0]])), (names[1], len(members[names[1]]) // 2)]:
+        (zip_tmp_folder / name).parent.mkdir(parents=True, exist_ok=True)
+        (zip_tmp_folder / name).write_bytes(members[name][:size])
+    complete_file = zip_tmp_folder / names[0]
+    os.utime(complete_file, (0, 0))
+
+    tar_tmp_folder = get_tmp_folder(base_url + '/archive.tar', target_folder / 'tar_resumed')
+    tar_tmp_folder.mkdir(parents=True)
+    archive = (serve_folder / 'archive.tar').read_bytes()
+    tar_tmp_folder.with_name(tar_tmp_folder.name + '.tar.part').write_bytes(archive[:len(archive) // 2])
+    return complete_file
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check that downloads are resumed and retried correctly: serves generated archives with '
+                    'serve_mirror.py, which interrupts every response after --drop_after bytes, and downloads them '
+                    'with the download engine used by the download scripts.')
+    parser.add_argument('--port', type=int, default=8765, help='Port for the local server.')
+    parser.add_argument('--file_size', type=int, default=100 * 1024, help='Size of each file in the archives.')
+    parser.add_argument('--drop_after', type=int, default=128 * 1024,
+                        help='Interrupt each response after this number of bytes.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        serve_folder = Path(tmp) / 'serve'
+        target_folder = Path(tmp) / 'target'
+        serve_folder.mkdir()
+        target_folder.mkdir()
+        members = create_test_files(serve_folder, args.file_size)
+
+        server = serve_mirror(serve_folder, args.port, args.drop_after)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = 'http://localhost:{}'.format(args.port)
+        complete_file = simulate_interrupted_runs(serve_folder, target_folder, base_url, members)
+        plain_md5 = hashlib.md5(members['sequence/data/0.bin']).hexdigest()
+        tasks = [DownloadTask(base_url + '/plain.bin', target_file=target_folder / 'plain.bin', md5=plain_md5),
+                 DownloadTask(base_url + '/archive.tar', md5_url=base_url + '/archive.tar.md5',
+                              extract_to=target_folder / 'tar', strip_components=1),
+                 DownloadTask(base_url + '/archive.zip', extract_to=target_folder / 'zip'),
+                 DownloadTask(base_url + '/archive.zip', extract_to=target_folder / 'zip_resumed'),
+                 DownloadTask(base_url + '/archive.tar', md5_url=base_url + '/archive.tar.md5',
+                              extract_to=target_folder / 'tar_resumed'),
+                 DownloadTask(base_url + '/missing.zip', extract_to=target_folder / 'missing')]
+        failed = download_files(tasks, num_parallel=4)
+        server.shutdown()
+
+        checks = [
+            ('resumed plain download', (target_folder / 'plain.bin').exists() and
+             (target_folder / 'plain.bin').read_bytes() == members['sequence/data/0.bin']),
+            ('resumed tar extraction', check_extracted(target_folder / 'tar', members, strip_components=1)),
+            ('resumed zip extraction', check_extracted(target_folder / 'zip', members)),
+            ('zip extraction continued from earlier run', check_extracted(target_folder / 'zip_resumed', members) and
+             (target_folder / 'zip_resumed' / sorted(members)[0]).stat().st_mtime == 0),
+            ('tar extraction continued from .part file', check_extracted(target_folder / 'tar_resumed', members) and
+             not any(path.name.endswith(('.tar', '.part')) for path in target_folder.iterdir())),
+            ('missing file reported as failed', [task.url for task in failed] == [base_url + '/missing.zip'])]
+    for name, passed in checks:
+        print('{:45} {}'.format(name, 'OK' if passed else 'FAILED'))
+    if not all(passed for _, passed in checks):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
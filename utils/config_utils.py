@@ -26,6 +26,7 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import copy
 from ruamel.yaml import YAML
 from pathlib import Path
 
@@ -90,3 +91,14 @@ def replace_dataset_in_config(config, dataset_name, target_folder):
     config[dataset_name]['dataset_path'] = str(target_folder)
     if not 'results_path' in config[dataset_name]:
         config[dataset_name]['results_path'] = config['results_path']
+
+
+def add_dataset_variant(config, general_config, dataset_name, variant_name, dataset_args):
+    """Add a variant of a dataset (same sequences and paths but different dataset_args, e.g. to read preprocessed
+    images) to config_general (if it's not there yet) and register the dataset path for it in the given machine
+    config."""
+    if not variant_name in general_config:
+        variant_config = copy.deepcopy(general_config[dataset_name])
+        variant_config['dataset_args'] = dataset_args
+        general_config[variant_name] = variant_config
+    replace_dataset_in_config(config, variant_name, Path(config[dataset_name]['dataset_path']))
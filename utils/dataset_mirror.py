@@ -0,0 +1,174 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import socket
+from pathlib import Path
+
+from utils.download_utils import download_file, compute_md5, get_extraction_path, get_tmp_folder, move_into_folder
+
+FICLONE = 0x40049409  # ioctl for creating a reflink on Linux (btrfs, xfs, etc.).
+
+
+class DatasetMirror:
+    """Content-addressed store for dataset archives, which can be shared between machines (e.g. on a NAS).
+    Layout of the mirror folder:
+        objects/<md5[:2]>/<md5><suffix>: the archives, named by their md5 sum.
+        urls/<sha1 of url>: md5 sum of the archive which was downloaded from this URL.
+        trees/<md5>/: extracted content of the archive (read-only), from which sequence folders are materialized with
+        reflinks or hardlinks.
+    All files are published atomically (written to a temporary file first and then renamed), so multiple machines
+    can use the same mirror at the same time.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.tmp_folder = self.folder / 'tmp'
+        for sub_folder in ['objects', 'urls', 'trees', 'tmp']:
+            (self.folder / sub_folder).mkdir(parents=True, exist_ok=True)
+        # Unique for each process, to avoid clashes between multiple machines writing temporary files.
+        self.tmp_postfix = '{}.{}'.format(socket.gethostname(), os.getpid())
+
+    def get_object_path(self, md5, url):
+        suffix = ''.join(Path(url.split('/')[-1]).suffixes)
+        return self.folder / 'objects' / md5[:2] / (md5 + suffix)
+
+    def get_url_index_path(self, url):
+        return self.folder / 'urls' / hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def lookup(self, url, md5=None):
+        """Return the md5 sum of the archive for this URL, if it exists in the mirror (otherwise None)."""
+        if md5 is None:
+            index_path = self.get_url_index_path(url)
+            if not index_path.exists():
+                return None
+            md5 = index_path.read_text().strip()
+        if self.get_object_path(md5, url).exists():
+            return md5
+        return None
+
+    def fetch(self, url, md5=None, max_retries=5, progress=None):
+        """Download the archive into the mirror (unless it exists already) and return its md5 sum."""
+        existing = self.lookup(url, md5)
+        if existing is not None:
+            print('Using archive from mirror for {}'.format(url))
+            return existing
+        # The partial file is named after the URL (and not the process) so that an interrupted download is resumed. The
+        # lock makes sure that only one process of this machine writes to it at a time.
+        tmp_file = self.tmp_folder / '{}.{}'.format(self.get_url_index_path(url).name, socket.gethostname())
+        with open(tmp_file.with_name(tmp_file.name + '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another process might have downloaded it while we were waiting for the lock.
+            existing = self.lookup(url, md5)
+            if existing is not None:
+                return existing
+            download_file(url, tmp_file, md5, max_retries, progress=progress)
+            if md5 is None:
+                md5 = compute_md5(tmp_file)
+            object_path = self.get_object_path(md5, url)
+            object_path.parent.mkdir(exist_ok=True)
+            os.replace(tmp_file, object_path)
+            self.write_atomically(self.get_url_index_path(url), md5)
+        return md5
+
+    def write_atomically(self, path: Path, content):
+        tmp_file = self.tmp_folder / '{}.{}'.format(path.name, self.tmp_postfix)
+        tmp_file.write_text(content)
+        os.replace(tmp_file, path)
+
+    def link_object(self, md5, url, target_file: Path):
+        """Make the archive itself available at target_file."""
+        link_file(self.get_object_path(md5, url), target_file)
+
+    def get_tree(self, md5, url):
+        """Return the folder with the extracted archive, extracting it first if necessary."""
+        tree = self.folder / 'trees' / md5
+        if tree.exists():
+            return tree
+        tmp_tree = self.tmp_folder / '{}.{}'.format(md5, self.tmp_postfix)
+        archive_format = 'zip' if url.endswith('.zip') else 'tar'
+        shutil.unpack_archive(str(self.get_object_path(md5, url)), str(tmp_tree), archive_format)
+        # Make everything read-only, so that files which are hardlinked to a dataset folder cannot be modified there.
+        for root, _, files in os.walk(tmp_tree):
+            for file in files:
+                os.chmod(os.path.join(root, file), 0o444)
+        try:
+            os.rename(tmp_tree, tree)
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            # Another process has extracted it at the same time.
+            shutil.rmtree(tmp_tree, ignore_errors=True)
+        return tree
+
+    def materialize(self, md5, url, target_folder: Path, strip_components=0, member_filter=None):
+        """Create the extracted content of the archive in target_folder, using reflinks or hardlinks where the
+        filesystem supports them (and copying otherwise)."""
+        tree = self.get_tree(md5, url)
+        # Like when extracting, we first create everything in a temporary folder so that the target folder is complete.
+        tmp_folder = get_tmp_folder(url, target_folder)
+        if tmp_folder.exists():
+            shutil.rmtree(tmp_folder)
+        tmp_folder.mkdir(parents=True)
+        for root, _, files in os.walk(tree):
+            for file in files:
+                source = Path(root) / file
+                path = get_extraction_path(source.relative_to(tree).as_posix(), strip_components, member_filter)
+                if path is None:
+                    continue
+                (tmp_folder / path).parent.mkdir(parents=True, exist_ok=True)
+                link_file(source, tmp_folder / path)
+        move_into_folder(tmp_folder, target_folder)
+
+
+def link_file(source: Path, target: Path):
+    """Reflink source to target, or hardlink it if reflinks are not supported, or copy it if neither works (e.g.
+    because they are on different filesystems)."""
+    try:
+        with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        return
+    except OSError:
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def get_mirror(config, mirror_folder=None):
+    """Return the DatasetMirror passed on the commandline or configured in the config (or None if there is none)."""
+    if mirror_folder is None and config is not None:
+        mirror_folder = config.get('dataset_mirror')
+    if mirror_folder is None:
+        return None
+    return DatasetMirror(mirror_folder)
@@ -0,0 +1,419 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import http.client
+import io
+import shutil
+import sys
+import tarfile
+import time
+import urllib.error
+import urllib.request
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path, PurePosixPath
+from tqdm import tqdm
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadTask:
+    """Data for a file which should be downloaded."""
+
+    def __init__(self, url, target_file=None, md5=None, md5_url=None, on_finished=None, extract_to=None,
+                 strip_components=0, member_filter=None):
+        """
+        :param url: URL of the file to download.
+        :param target_file: Path where the downloaded file will be stored (only used if extract_to is None).
+        :param md5: Expected md5 checksum of the file (optional).
+        :param md5_url: URL of a file in the format of md5sum containing the checksum (optional, only used if md5 is
+        None).
+        :param on_finished: Function which is called with the task after the file has been downloaded and verified
+        (e.g. for unpacking it). It is run in the download thread, so multiple of them can run in parallel.
+        :param extract_to: If set, the archive (.tar or .zip) is not saved, but directly extracted into this folder
+        while it is downloaded.
+        :param strip_components: Number of leading folders to remove from the paths in the archive when extracting
+        (like tar --strip-components).
+        :param member_filter: Function which gets the extraction path of each archive member and returns whether it
+        shall be extracted. For zip archives, members which are not extracted are also not downloaded.
+        """
+        self.url = url
+        self.target_file = None if target_file is None else Path(target_file)
+        self.md5 = md5
+        self.md5_url = md5_url
+        self.on_finished = on_finished
+        self.extract_to = None if extract_to is None else Path(extract_to)
+        self.strip_components = strip_components
+        self.member_filter = member_filter
+
+
+class DownloadError(Exception):
+    pass
+
+
+def open_url(url, start=0, timeout=60):
+    """Open the URL, requesting only the bytes from start onwards (HTTP range request) if start > 0.
+    :return: response, and the position in the file where the response starts (0 if the server does not support range
+    requests).
+    """
+    request = urllib.request.Request(url)
+    if start > 0:
+        request.add_header('Range', 'bytes={}-'.format(start))
+    response = urllib.request.urlopen(request, timeout=timeout)
+    if start > 0 and response.status != 206:
+        # Server ignored the range request, so the response contains the full file.
+        return response, 0
+    return response, start
+
+
+def fetch_md5(md5_url):
+    """Download a checksum file (format of md5sum) and return the checksum in it."""
+    with urllib.request.urlopen(md5_url, timeout=60) as response:
+        content = response.read().decode('ascii')
+    return content.split()[0].lower()
+
+
+def compute_md5(filename):
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def download_file(url, target_file: Path, md5=None, max_retries=5, backoff=2.0, progress=None):
+    """Download a single file, resuming a previous partial download if there is one.
+    Data is first written to target_file + '.part', which is renamed once the download is complete and the checksum
+    has been verified. If the connection breaks the download is resumed (with exponential backoff between attempts).
+    :param progress: tqdm progress bar which is updated with the downloaded bytes (optional).
+    """
+    part_file = target_file.with_name(target_file.name + '.part')
+    for attempt in range(max_retries + 1):
+        try:
+            start = part_file.stat().st_size if part_file.exists() else 0
+            response, start = open_url(url, start)
+            with response, open(part_file, 'ab' if start > 0 else 'wb') as out_file:
+                expected_size = response.headers.get('Content-Length')
+                expected_size = start + int(expected_size) if expected_size is not None else None
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    out_file.write(chunk)
+                    if progress is not None:
+                        progress.update(len(chunk))
+            if expected_size is not None and part_file.stat().st_size != expected_size:
+                raise DownloadError('Incomplete download of {}'.format(url))
+            if md5 is not None and compute_md5(part_file) != md5:
+                # The partial file is corrupt, so we have to start from scratch.
+                part_file.unlink()
+                raise DownloadError('Checksum mismatch for {}'.format(url))
+            part_file.rename(target_file)
+            return
+        except urllib.error.HTTPError as e:
+            if e.code == 416:
+                # Range not satisfiable: the part file is already complete (or larger than the remote file).
+                if md5 is None or compute_md5(part_file) == md5:
+                    part_file.rename(target_file)
+                    return
+                part_file.unlink()
+            elif 400 <= e.code < 500:
+                raise DownloadError('Could not download {}: {}'.format(url, e))
+            error = e
+        except (urllib.error.URLError, http.client.HTTPException, OSError, DownloadError) as e:
+            error = e
+        if attempt < max_retries:
+            wait_time = backoff ** attempt
+            print('WARNING: Download of {} failed ({}), retrying in {:.0f}s.'.format(url, error, wait_time))
+            time.sleep(wait_time)
+    raise DownloadError('Giving up on {} after {} attempts: {}'.format(url, max_retries + 1, error))
+
+
+class RemoteFile(io.RawIOBase):
+    """Seekable, read-only file object for a file on an HTTP server supporting range requests.
+    Sequential reads are served from one open connection, so reading the file from front to back downloads it only
+    once. When seeking, a new range request is started. Broken connections are resumed transparently at the current
+    position.
+    """
+
+    def __init__(self, url, max_retries=5, backoff=2.0, progress=None):
+        super().__init__()
+        self.url = url
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.progress = progress
+        self.pos = 0
+        self.response = None
+        self.response_pos = 0
+        request = urllib.request.Request(url, method='HEAD')
+        with urllib.request.urlopen(request, timeout=60) as response:
+            self.size = int(response.headers['Content-Length'])
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = offset
+        return self.pos
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+        super().close()
+
+    def readinto(self, buffer):
+        if self.pos >= self.size:
+            return 0
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.response is not None and 0 <= self.pos - self.response_pos < CHUNK_SIZE:
+                    # Small forward seeks (e.g. over the data descriptor of a zip member) reuse the connection.
+                    self.response.read(self.pos - self.response_pos)
+                    self.response_pos = self.pos
+                if self.response is None or self.response_pos != self.pos:
+                    if self.response is not None:
+                        self.response.close()
+                    self.response, self.response_pos = open_url(self.url, self.pos)
+                    if self.response_pos != self.pos:
+                        raise DownloadError('Server does not support range requests.')
+                num_read = self.response.readinto(buffer)
+                if num_read == 0:
+                    raise DownloadError('Connection closed unexpectedly.')
+                self.pos += num_read
+                self.response_pos += num_read
+                if self.progress is not None:
+                    self.progress.update(num_read)
+                return num_read
+            except (urllib.error.URLError, http.client.HTTPException, OSError, DownloadError) as e:
+                if self.response is not None:
+                    self.response.close()
+                self.response = None
+                if attempt == self.max_retries:
+                    raise DownloadError('Giving up on {}: {}'.format(self.url, e))
+                time.sleep(self.backoff ** attempt)
+
+
+class HashingReader(io.RawIOBase):
+    """Wraps a (sequentially read) file object and computes the md5 sum of everything read through it."""
+
+    def __init__(self, file):
+        super().__init__()
+        self.file = file
+        self.md5 = hashlib.md5()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        num_read = self.file.readinto(buffer)
+        self.md5.update(memoryview(buffer)[:num_read])
+        return num_read
+
+
+def get_extraction_path(name, strip_components, member_filter=None):
+    """Path of an archive member relative to the extraction folder (or None if it shall not be extracted)."""
+    parts = PurePosixPath(name).parts[strip_components:]
+    if len(parts) == 0 or '..' in parts or PurePosixPath(name).is_absolute():
+        return None
+    path = Path(*parts)
+    if member_filter is not None and not member_filter(path):
+        return None
+    return path
+
+
+def get_tmp_folder(url, target_folder: Path):
+    """Temporary extraction folder (unique per archive, as multiple archives can be extracted into the same folder)."""
+    return target_folder.with_name('.{}.{}.tmp'.format(target_folder.name, url.split('/')[-1]))
+
+
+def move_into_folder(source_folder: Path, target_folder: Path):
+    """Move the extracted content to the target folder (which might already contain files of other archives)."""
+    if not target_folder.exists():
+        source_folder.rename(target_folder)
+        return
+    for child in source_folder.iterdir():
+        target = target_folder / child.name
+        if target.is_dir() and child.is_dir():
+            move_into_folder(child, target)
+        else:
+            child.replace(target)
+    source_folder.rmdir()
+
+
+def extract_tar_members(tar, tmp_folder: Path, strip_components=0, member_filter=None):
+    """Extract the members of the (streamed) tar archive into tmp_folder."""
+    for member in tar:
+        path = get_extraction_path(member.name, strip_components, member_filter)
+        if path is None:
+            continue
+        if member.isdir():
+            (tmp_folder / path).mkdir(parents=True, exist_ok=True)
+        elif member.isfile():
+            (tmp_folder / path).parent.mkdir(parents=True, exist_ok=True)
+            with tar.extractfile(member) as source, open(tmp_folder / path, 'wb') as target:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+
+def stream_extract_tar(url, target_folder: Path, md5=None, strip_components=0, member_filter=None, max_retries=5,
+                       progress=None):
+    """Extract a tar archive while it is being downloaded, without saving the archive itself.
+    The content is extracted to a temporary folder first and only moved to target_folder if the md5 sum matches.
+    Tar archives can only be read from the start, so if the temporary folder of an interrupted attempt exists, the
+    archive is downloaded to a (resumable) .part file instead and extracted afterwards."""
+    tmp_folder = get_tmp_folder(url, target_folder)
+    if tmp_folder.exists():
+        archive_file = tmp_folder.with_name(tmp_folder.name + '.tar')
+        if not archive_file.exists():  # Otherwise only the extraction was interrupted.
+            print('Resuming {} from a partial download (needs space for the archive).'.format(url))
+            download_file(url, archive_file, md5, max_retries, progress=progress)
+        shutil.rmtree(tmp_folder)
+        tmp_folder.mkdir(parents=True)
+        with tarfile.open(archive_file, mode='r|') as tar:
+            extract_tar_members(tar, tmp_folder, strip_components, member_filter)
+        move_into_folder(tmp_folder, target_folder)
+        archive_file.unlink()
+        return
+    with RemoteFile(url, max_retries, progress=progress) as remote:
+        tmp_folder.mkdir(parents=True)
+        hashing_reader = HashingReader(io.BufferedReader(remote, CHUNK_SIZE))
+        with tarfile.open(fileobj=hashing_reader, mode='r|') as tar:
+            extract_tar_members(tar, tmp_folder, strip_components, member_filter)
+        # Read the remaining padding of the archive, so that the checksum covers the whole file.
+        while hashing_reader.read(CHUNK_SIZE):
+            pass
+    if md5 is not None and hashing_reader.md5.hexdigest() != md5:
+        shutil.rmtree(tmp_folder)
+        raise DownloadError('Checksum mismatch for {}'.format(url))
+    move_into_folder(tmp_folder, target_folder)
+
+
+def is_extracted(path: Path, info: zipfile.ZipInfo):
+    """Whether the zip member has already been extracted completely to path (by an interrupted attempt)."""
+    if not path.is_file() or path.stat().st_size != info.file_size:
+        return False
+    crc = 0
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc == info.CRC
+
+
+def stream_extract_zip(url, target_folder: Path, strip_components=0, member_filter=None, max_retries=5,
+                       progress=None):
+    """Extract a zip archive directly from the server, without saving the archive itself.
+    The central directory at the end of the file is read first, afterwards all members are downloaded in the order
+    they are stored in the archive (which means the archive is only downloaded once) and written to their final
+    location. The CRC of each member is checked by zipfile.
+    Members which an interrupted attempt has already extracted to the temporary folder (with matching size and CRC)
+    are not downloaded again.
+    """
+    tmp_folder = get_tmp_folder(url, target_folder)
+    with RemoteFile(url, max_retries, progress=progress) as remote:
+        tmp_folder.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(io.BufferedReader(remote, CHUNK_SIZE)) as zip_file:
+            for info in sorted(zip_file.infolist(), key=lambda info: info.header_offset):
+                path = get_extraction_path(info.filename, strip_components, member_filter)
+                if path is None:
+                    continue
+                if info.is_dir():
+                    (tmp_folder / path).mkdir(parents=True, exist_ok=True)
+                    continue
+                if is_extracted(tmp_folder / path, info):
+                    continue
+                (tmp_folder / path).parent.mkdir(parents=True, exist_ok=True)
+                with zip_file.open(info) as source, open(tmp_folder / path, 'wb') as target:
+                    shutil.copyfileobj(source, target, CHUNK_SIZE)
+    move_into_folder(tmp_folder, target_folder)
+
+
+def run_task(task: DownloadTask, max_retries, progress, mirror):
+    md5 = task.md5
+    if md5 is None and task.md5_url is not None:
+        md5 = fetch_md5(task.md5_url)
+    if mirror is not None:
+        # With a mirror the archive is downloaded into the mirror (if it is not in there already) and the content
+        # is linked from there.
+        md5 = mirror.fetch(task.url, md5, max_retries, progress)
+        if task.extract_to is not None:
+            mirror.materialize(md5, task.url, task.extract_to, task.strip_components, task.member_filter)
+        elif not task.target_file.exists():
+            mirror.link_object(md5, task.url, task.target_file)
+    elif task.extract_to is not None:
+        if task.url.endswith('.zip'):
+            stream_extract_zip(task.url, task.extract_to, task.strip_components, task.member_filter, max_retries,
+                               progress)
+        else:
+            stream_extract_tar(task.url, task.extract_to, md5, task.strip_components, task.member_filter,
+                               max_retries, progress)
+    elif task.target_file.exists():
+        print('File exists --> skipping download of {}'.format(task.target_file.name))
+    else:
+        download_file(task.url, task.target_file, md5, max_retries, progress=progress)
+    if task.on_finished is not None:
+        task.on_finished(task)
+
+
+def download_files(tasks, num_parallel=4, max_retries=5, mirror=None):
+    """Download all passed DownloadTasks with a bounded number of parallel connections.
+    The checksum of each file is verified as soon as it has finished (not only after all files have been downloaded).
+    :param mirror: DatasetMirror to look up archives in before downloading them (and to store them in), optional.
+    :return: list of tasks which failed.
+    """
+    failed = []
+    with tqdm(unit='B', unit_scale=True, unit_divisor=1024, desc='Downloading') as progress:
+        with ThreadPoolExecutor(max_workers=num_parallel) as executor:
+            futures = {executor.submit(run_task, task, max_retries, progress, mirror): task for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print('ERROR: {} failed: {}'.format(task.url, e))
+                    failed.append(task)
+    return failed
+
+
+def exit_on_failed_downloads(failed):
+    """Print the URLs of the failed DownloadTasks (returned by download_files) and exit with an error if there are
+    any."""
+    if len(failed) == 0:
+        return
+    print('Error: {} download(s) failed (run the script again to resume them):'.format(len(failed)))
+    for task in failed:
+        print('    {}'.format(task.url))
+    sys.exit(1)
@@ -0,0 +1,168 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Stand-in for the dmvio_dataset executable, used for testing and benchmarking run_dmvio.py, Slurm scripts and the
+evaluation without a DM-VIO build (run_dmvio.py --fake_dmvio).
+It accepts the same key=value arguments and writes result.txt, resultKFs.txt and scalesdso.txt computed from the
+groundtruth in this repository plus noise, drift and scale error. Additional arguments (which can be passed with
+--dmvio_args):
+    fake_time_factor: Fraction of the realtime duration of the sequence to sleep for (default 0.01).
+    fake_noise: Standard deviation of the position noise in meters (default 0.01).
+    fake_drift: Standard deviation of the random walk drift in meters per sqrt(second) (default 0.005).
+    fake_scale_error: Standard deviation of the relative scale error (default 0.01).
+    fake_crash_probability: Probability that the run crashes with a segmentation fault (default 0).
+    fake_crash_after: Fraction of the sequence after which it crashes (default 0.5).
+    fake_frame_ms: Mean of the per-frame processing times used for the printed summary (default 20).
+    fake_diverge_probability: Probability that the run diverges: the scale explodes and it prints resets while
+        running, which can be detected by run_dmvio.py --watchdog (default 0).
+    fake_seed: Seed for the random number generator (default: derived from the results folder).
+"""
+
+import hashlib
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.preflight import parse_dataset_args, SequencePaths, read_times
+import trajectory_evaluation.associate as associate
+
+GROUNDTRUTH_FOLDER = Path(__file__).resolve().parent.parent / 'groundtruth_files'
+
+
+def find_groundtruth(sequence_name):
+    """Return the groundtruth and times file in this repository for the sequence (e.g. mav_MH_01_easy)."""
+    for dataset_folder in GROUNDTRUTH_FOLDER.iterdir():
+        gt_file = dataset_folder / 'gtFiles' / '{}.txt'.format(sequence_name)
+        if gt_file.exists():
+            return gt_file, dataset_folder / 'timesFiles' / '{}.txt'.format(sequence_name)
+    return None, None
+
+
+def get_float_arg(args, name, default):
+    return float(args[name]) if name in args else default
+
+
+def write_trajectory(filename, times, positions):
+    with open(filename, 'w') as file:
+        for timestamp, position in zip(times, positions):
+            file.write('{:.9f} {:.9f} {:.9f} {:.9f} 0 0 0 1\n'.format(timestamp, *position))
+
+
+def main():
+    args = parse_dataset_args(' '.join(sys.argv[1:]))
+    results_folder = Path(args['resultsPrefix'])
+    # run_dmvio.py saves results to {res_prefix}{folder}_{iter}/
+    sequence_name = results_folder.name.rsplit('_', 1)[0]
+    seed = int(args['fake_seed']) if 'fake_seed' in args else int(
+        hashlib.sha1(str(results_folder).encode('utf-8')).hexdigest()[:8], 16)
+    random = np.random.default_rng(seed)
+
+    gt_file, gt_times_file = find_groundtruth(sequence_name)
+    if gt_file is None:
+        print('Error: No groundtruth for {}.'.format(sequence_name))
+        sys.exit(1)
+
+    # Use the times of the actual dataset if it's there (e.g. for mini datasets), otherwise the groundtruth times.
+    times_file = gt_times_file
+    if 'files' in args:
+        dataset_times_file = SequencePaths(Path.cwd(), args).times
+        if dataset_times_file.exists():
+            times_file = dataset_times_file
+    times = np.array(read_times(times_file))
+    start = int(args['start']) if 'start' in args else 0
+    end = int(args['end']) if 'end' in args else len(times) - 1
+    times = times[start:end + 1]
+    print('Loaded {} images (fake DM-VIO).'.format(len(times)))
+
+    crashes = random.random() < get_float_arg(args, 'fake_crash_probability', 0.0)
+    if crashes:
+        times = times[:int(len(times) * get_float_arg(args, 'fake_crash_after', 0.5))]
+
+    sleep_time = max(0.0, (times[-1] - times[0]) * get_float_arg(args, 'fake_time_factor', 0.01))
+    diverges = random.random() < get_float_arg(args, 'fake_diverge_probability', 0.0)
+    divergence_scale = 1.0
+    if diverges:
+        # The scale doubles and the system resets in each step, like a run which has lost track.
+        num_steps = 10
+        for step in range(num_steps):
+            time.sleep(sleep_time / num_steps)
+            divergence_scale *= 2.0
+            with open(results_folder / 'scalesdso.txt', 'a') as scale_file:
+                scale_file.write('{:.9f} {:.9f}\n'.format(times[len(times) * step // num_steps], divergence_scale))
+            print('RESETTING', flush=True)
+    else:
+        time.sleep(sleep_time)
+    if crashes:
+        print('Simulating crash.')
+        sys.stdout.flush()
+        os.kill(os.getpid(), signal.SIGSEGV)
+
+    # Groundtruth positions at the frame times, plus drift and noise, divided by the (wrongly) estimated scale.
+    groundtruth = associate.read_file_list(gt_file)
+    gt_times = np.array(sorted(groundtruth.keys()))
+    gt_positions = np.array([[float(value) for value in groundtruth[timestamp][0:3]] for timestamp in gt_times])
+    valid = np.all(np.isfinite(gt_positions), axis=1)
+    gt_times, gt_positions = gt_times[valid], gt_positions[valid]
+    times = times[np.logical_and(times >= gt_times[0], times <= gt_times[-1])]
+    positions = np.stack([np.interp(times, gt_times, gt_positions[:, i]) for i in range(3)], axis=1)
+
+    time_steps = np.diff(times, prepend=times[0])
+    drift = np.cumsum(random.normal(size=positions.shape) * get_float_arg(args, 'fake_drift', 0.005) * np.sqrt(
+        time_steps)[:, None], axis=0)
+    positions += drift + random.normal(size=positions.shape) * get_float_arg(args, 'fake_noise', 0.01)
+    scale = (1.0 + random.normal() * get_float_arg(args, 'fake_scale_error', 0.01)) * divergence_scale
+    positions /= scale
+
+    write_trajectory(results_folder / 'result.txt', times, positions)
+    write_trajectory(results_folder / 'resultKFs.txt', times[::5], positions[::5])
+    with open(results_folder / 'scalesdso.txt', 'w') as scale_file:
+        scale_file.write('{:.9f} {:.9f}\n'.format(times[-1], scale))
+
+    # The same summary as printed by DM-VIO (which does not print the time of each frame).
+    num_frames = len(times)
+    frame_ms = random.gamma(4.0, get_float_arg(args, 'fake_frame_ms', 20.0) / 4.0, size=num_frames)
+    print('Initialized')
+    milliseconds = frame_ms.sum()
+    print('\n======================'
+          '\n{} Frames ({:.1f} fps)'
+          '\n{:.2f}ms per frame (single core); '
+          '\n{:.2f}ms per frame (multi core); '
+          '\n{:.3f}x (single core); '
+          '\n{:.3f}x (multi core); '
+          '\n======================\n'.format(num_frames, num_frames / (times[-1] - times[0]),
+                                              milliseconds / num_frames, milliseconds / num_frames,
+                                              (times[-1] - times[0]) * 1000 / milliseconds,
+                                              (times[-1] - times[0]) * 1000 / milliseconds))
+
+
+if __name__ == '__main__':
+    main()
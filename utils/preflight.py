@@ -0,0 +1,169 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from ruamel.yaml import YAML
+
+from utils.config_utils import input_custom_variables
+
+# Arguments of dmvio_dataset which reference files (relative to the working directory).
+FILE_ARGUMENTS = ['calib', 'gamma', 'vignette', 'imuFile', 'gtFile', 'imuCalib']
+CACHE_FILENAME = '.preflight_cache.yaml'
+
+
+def parse_dataset_args(dataset_args: str):
+    """Convert a string of key=value pairs (as passed to DM-VIO) into a dict."""
+    return dict(argument.split('=', 1) for argument in dataset_args.split() if '=' in argument)
+
+
+class SequencePaths:
+    """Paths of all files DM-VIO reads for a sequence, resolved in the same way as dmvio_dataset does it."""
+
+    def __init__(self, working_dir: Path, dataset_args: dict):
+        self.working_dir = working_dir
+        self.images = working_dir / dataset_args['files']
+        # The times file and (if not specified otherwise) the IMU file are expected next to the image folder.
+        self.times = self.images.parent / 'times.txt'
+        self.imu = working_dir / dataset_args['imuFile'] if 'imuFile' in dataset_args else \
+            self.images.parent / 'imu.txt'
+        self.other_files = {key: working_dir / dataset_args[key] for key in FILE_ARGUMENTS if
+                            key in dataset_args and key != 'imuFile'}
+
+    def all_paths(self):
+        return [self.working_dir, self.images, self.times, self.imu] + list(self.other_files.values())
+
+
+def read_times(times_file):
+    with open(times_file) as file:
+        return [float(line.split()[1]) for line in file if not line.startswith('#') and line.strip() != '']
+
+
+def count_images(image_folder: Path):
+    if image_folder.suffix == '.zip':
+        with zipfile.ZipFile(image_folder) as zip_file:
+            return sum(1 for name in zip_file.namelist() if not name.endswith('/'))
+    with os.scandir(image_folder) as entries:
+        return sum(1 for entry in entries if entry.is_file())
+
+
+def read_first_and_last_timestamp(imu_file):
+    """Read only the first and last line of the IMU file and return their timestamps in seconds."""
+    with open(imu_file, 'rb') as file:
+        first_line = b'#'
+        while first_line.startswith(b'#'):
+            first_line = file.readline()
+        file.seek(max(0, os.path.getsize(imu_file) - 4096))
+        last_line = [line for line in file.read().splitlines() if line.strip() != b''][-1]
+    timestamps = [float(line.replace(b',', b' ').split()[0]) for line in [first_line, last_line]]
+    # IMU files store nanoseconds, the times files seconds.
+    return [timestamp * 1e-9 if timestamp > 1e12 else timestamp for timestamp in timestamps]
+
+
+def get_fingerprint(paths: SequencePaths, dataset_args, start, end, check_imu):
+    """Cheap fingerprint of everything that is checked: the arguments and the size and modification time of all
+    files (and the image folder, which changes its modification time when files are added or removed)."""
+    fingerprint = hashlib.sha1('{} {} {} {}'.format(dataset_args, start, end, check_imu).encode('utf-8'))
+    for path in paths.all_paths():
+        try:
+            stat = path.stat()
+            fingerprint.update('{} {} {}'.format(path, stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+        except OSError:
+            fingerprint.update('{} missing'.format(path).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def check_sequence(paths: SequencePaths, start, end, check_imu):
+    """Check a single sequence, returning a list of errors (empty if everything is fine)."""
+    missing = [str(path) for path in paths.all_paths() if not path.exists() and (check_imu or path != paths.imu)]
+    if len(missing) > 0:
+        return ['Missing: {}'.format(path) for path in missing]
+
+    errors = []
+    times = read_times(paths.times)
+    num_images = count_images(paths.images)
+    if num_images != len(times):
+        errors.append('{} images but {} lines in {}'.format(num_images, len(times), paths.times))
+    end_index = len(times) - 1 if end is None else end
+    start_index = 0 if start is None else start
+    if not 0 <= start_index < end_index < len(times):
+        errors.append('Frame window [{}, {}] is outside of the {} frames in {}'.format(start, end, len(times),
+                                                                                    paths.times))
+    elif check_imu:
+        imu_start, imu_end = read_first_and_last_timestamp(paths.imu)
+        if imu_start > times[start_index] or imu_end < times[end_index]:
+            errors.append('IMU data ({:.3f} - {:.3f}) does not cover the frame window ({:.3f} - {:.3f})'.format(
+                imu_start, imu_end, times[start_index], times[end_index]))
+    return errors
+
+
+def preflight_check(dataset_config, dmvio_folder, only_seq=None, check_imu=True, num_threads=8):
+    """Check that all sequences of the dataset can be run before actually running anything.
+    Results are cached in the dataset folder, so repeated checks of an unchanged dataset only need to stat the files.
+    :return: list of errors (empty if all sequences are fine).
+    """
+    dataset_args_string = input_custom_variables(dataset_config['dataset_args'], dmvio_folder)
+    if '${' in dataset_args_string:
+        return ['Unresolved variable in dataset_args: {}'.format(dataset_args_string)]
+    dataset_args = parse_dataset_args(dataset_args_string)
+
+    dataset_path = Path(dataset_config['dataset_path'])
+    folders = dataset_config['folder_names']
+    start_times = dataset_config['start_times'] if 'start_times' in dataset_config else [None] * len(folders)
+    end_times = dataset_config['end_times'] if 'end_times' in dataset_config else [None] * len(folders)
+    indices = range(len(folders)) if only_seq is None else [only_seq]
+
+    cache_file = dataset_path / CACHE_FILENAME
+    yaml = YAML(typ='safe')
+    cache = {}
+    if cache_file.exists():
+        with open(cache_file) as cache_file_handle:
+            cache = yaml.load(cache_file_handle) or {}
+
+    def check(i):
+        paths = SequencePaths(dataset_path / folders[i] / dataset_config['afterpath'], dataset_args)
+        fingerprint = get_fingerprint(paths, dataset_args_string, start_times[i], end_times[i], check_imu)
+        if cache.get(folders[i]) == fingerprint:
+            return []
+        errors = check_sequence(paths, start_times[i], end_times[i], check_imu)
+        if len(errors) == 0:
+            cache[folders[i]] = fingerprint
+        return ['{}: {}'.format(folders[i], error) for error in errors]
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        errors = [error for sequence_errors in executor.map(check, indices) for error in sequence_errors]
+
+    try:
+        with open(cache_file, 'w') as cache_file_handle:
+            yaml.dump(cache, cache_file_handle)
+    except OSError:
+        pass  # The dataset folder might be read-only, in which case we just don't cache.
+    return errors
@@ -0,0 +1,161 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Lightweight instrumentation: named stage timers and counters, optionally with cProfile and tracemalloc.
+
+Profiling is off by default, in which case stage() and count() cost only a function call. It is switched on either
+with the environment variable DMVIO_PROFILE (set to the file the JSON report is written to) or with --profile in the
+scripts which support it (which additionally records cProfile and tracemalloc data).
+
+Example:
+    with profiling.stage('load_groundtruth'):
+        ...
+    profiling.count('sequences')
+"""
+
+import atexit
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+ENVIRONMENT_VARIABLE = 'DMVIO_PROFILE'
+
+_enabled = False
+_report_file = None
+_profiler = None
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}  # name -> [total time, number of calls]
+_counters = {}
+_null_stage = contextlib.nullcontext()
+
+
+def enable(report_file, use_cprofile=False, use_tracemalloc=False):
+    """Switch on profiling. The report is written to report_file when the program exits.
+    :param use_cprofile: Also record a cProfile, which is saved next to the report (with suffix .prof).
+    :param use_tracemalloc: Also record the peak memory and the largest allocations with tracemalloc.
+    """
+    global _enabled, _report_file, _profiler
+    if not _enabled:
+        atexit.register(write_report)
+    _enabled = True
+    _report_file = report_file
+    if use_cprofile and _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if use_tracemalloc and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def is_enabled():
+    return _enabled
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if not hasattr(_local, 'stack'):
+            _local.stack = []
+        _local.stack.append(self.name)
+        # Nested stages are reported with their full path, e.g. evaluate_run/associate.
+        self.full_name = '/'.join(_local.stack)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        with _lock:
+            entry = _stages.setdefault(self.full_name, [0.0, 0])
+            entry[0] += duration
+            entry[1] += 1
+        return False
+
+
+def stage(name):
+    """Context manager measuring the time spent in the stage with the given name."""
+    if not _enabled:
+        return _null_stage
+    return _Stage(name)
+
+
+def count(name, value=1):
+    """Increase the counter with the given name."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get_report():
+    report = {
+        'stages': {name: {'time': total, 'calls': calls} for name, (total, calls) in
+                   sorted(_stages.items(), key=lambda item: -item[1][0])},
+        'counters': dict(_counters),
+    }
+    if tracemalloc.is_tracing():
+        report['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        report['largest_allocations'] = [str(statistic) for statistic in
+                                         tracemalloc.take_snapshot().statistics('lineno')[:20]]
+    return report
+
+
+def write_report():
+    if not _enabled or _report_file is None:
+        return
+    report = get_report()
+    if not _profiler is None:
+        _profiler.disable()
+        profile_file = '{}.prof'.format(os.path.splitext(_report_file)[0])
+        _profiler.dump_stats(profile_file)
+        report['cprofile'] = profile_file
+    with open(_report_file, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print('Profiling report written to {}'.format(_report_file))
+
+
+def add_profile_argument(parser):
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Write a profiling report (time per stage, counters, peak memory) to this JSON file and '
+                             'a cProfile next to it. Stage timings alone can also be enabled with the environment '
+                             'variable {}.'.format(ENVIRONMENT_VARIABLE))
+
+
+def enable_from_args(args):
+    if not args.profile is None:
+        enable(args.profile, use_cprofile=True, use_tracemalloc=True)
+
+
+if os.environ.get(ENVIRONMENT_VARIABLE):
+    enable(os.environ[ENVIRONMENT_VARIABLE])
@@ -0,0 +1,141 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import queue
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from ruamel.yaml import YAML
+
+MANIFEST_FILENAME = '.sync_manifest.yaml'
+
+
+class ResultSyncWorker:
+    """Pushes the results of finished runs to the central storage in the background, while the next runs are already
+    executing. Runs which finish while a transfer is in progress are pushed together with the next transfer.
+    """
+
+    def __init__(self, rsync_command, results_folder: Path, rsync_target):
+        """
+        :param rsync_command: rsync command to use (rsync_command in the config).
+        :param results_folder: Folder of the results which are pushed.
+        :param rsync_target: Folder on the central storage (rsync_command_target in the config), can also be a local
+        folder.
+        """
+        self.rsync_command = rsync_command
+        self.results_folder = Path(results_folder)
+        self.rsync_target = rsync_target
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def push_run(self, run_name):
+        """Push the results of one run (trajectories, run output, run folder) and the setup folder."""
+        paths = ['setup', run_name, 'results/{}.txt'.format(run_name), 'kfres/{}.txt'.format(run_name)]
+        runoutput_folder = self.results_folder / 'runoutputs'
+        if runoutput_folder.exists():
+            paths += ['runoutputs/{}'.format(file.name) for file in
+                      runoutput_folder.glob('{}_runoutput.txt*'.format(run_name))]
+        self.queue.put([path for path in paths if (self.results_folder / path).exists()])
+
+    def finish(self):
+        """Wait for all pending transfers and finally push the whole results folder (to also transfer everything
+        which is not part of a single run)."""
+        self.queue.put(None)
+        self.thread.join()
+        full_rsync_command = '{} {} {}/'.format(self.rsync_command, self.results_folder, self.rsync_target)
+        print(full_rsync_command)
+        subprocess.run(full_rsync_command, shell=True)
+
+    def _run(self):
+        while True:
+            paths = self.queue.get()
+            if paths is None:
+                return
+            # Also take all other pending runs.
+            finished = False
+            while not self.queue.empty():
+                more_paths = self.queue.get()
+                if more_paths is None:
+                    finished = True
+                    break
+                paths += more_paths
+            self._push(paths)
+            if finished:
+                return
+
+    def _push(self, paths):
+        # With --relative the paths after /./ are recreated in the target.
+        sources = ' '.join('{}/./{}/{}'.format(self.results_folder.parent, self.results_folder.name, path) for path
+                           in sorted(set(paths)))
+        subprocess.run('{} --relative {} {}/'.format(self.rsync_command, sources, self.rsync_target), shell=True,
+                       stdout=subprocess.DEVNULL)
+
+
+def list_remote_folders(rsync_command, rsync_target):
+    """List the results folders on the central storage."""
+    if not ':' in rsync_target:
+        return sorted(entry.name for entry in os.scandir(rsync_target) if entry.is_dir())
+    # Only list the top level folders.
+    output = subprocess.run('{} --list-only --no-recursive --dirs {}/'.format(rsync_command, rsync_target),
+                            shell=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
+    return sorted(line.split()[-1] for line in output.splitlines() if line.startswith('d') and
+                  line.split()[-1] != '.')
+
+
+def pull_results(rsync_command, rsync_target, local_folder: Path, num_parallel=4, full=False):
+    """Download all results from the central storage which have not been downloaded completely before.
+    Folders of finished runs are stored in a manifest, so that they are not transferred again.
+    :param full: Ignore the manifest and synchronize all folders.
+    """
+    local_folder = Path(local_folder)
+    manifest_file = local_folder / MANIFEST_FILENAME
+    yaml = YAML(typ='safe')
+    mirrored = []
+    if manifest_file.exists() and not full:
+        with open(manifest_file) as manifest_file_handle:
+            mirrored = yaml.load(manifest_file_handle) or []
+
+    folders = [folder for folder in list_remote_folders(rsync_command, rsync_target) if not folder in mirrored]
+    print('Downloading {} results folders.'.format(len(folders)))
+
+    def pull(folder):
+        subprocess.run('{} {}/{} {}/'.format(rsync_command, rsync_target, folder, local_folder), shell=True,
+                       stdout=subprocess.DEVNULL)
+        return folder
+
+    with ThreadPoolExecutor(max_workers=num_parallel) as executor:
+        for folder in executor.map(pull, folders):
+            # Unfinished runs can still change, so they are synchronized again next time.
+            if (local_folder / folder / 'setup' / 'Finished.txt').exists():
+                mirrored.append(folder)
+
+    with open(manifest_file, 'w') as manifest_file_handle:
+        yaml.dump(sorted(set(mirrored)), manifest_file_handle)
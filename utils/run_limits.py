@@ -0,0 +1,87 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Per-sequence time and memory limits derived from the runtime and peak memory of previous runs (run_dmvio.py
+--limits). These are read from the run_status.yaml files written by run_watchdog.py, so only runs executed with the
+watchdog or with limits contribute to the history."""
+
+from pathlib import Path
+from ruamel.yaml import YAML
+from utils.run_watchdog import RunLimits, RunStatus, read_run_status
+
+
+def get_sequence_name(run_name):
+    """mav_MH_01_easy_3 -> mav_MH_01_easy"""
+    return run_name.rsplit('_', 1)[0]
+
+
+def collect_run_history(results_path: Path, dataset_name, realtime, fake_dmvio=False, exclude_folder=None):
+    """Collect the runtime and peak memory of all finished runs on the dataset in the results path.
+    Only runs with the same realtime setting are used, as this changes the runtime completely (and runs of the fake
+    DM-VIO are only used for the fake DM-VIO).
+    :return: dict sequence name (with res_prefix) -> list of (duration in seconds, peak memory in MB).
+    """
+    yaml = YAML(typ='safe')
+    history = {}
+    for results_folder in Path(results_path).iterdir():
+        setup_file = results_folder / 'setup' / 'setup.yaml'
+        if results_folder == exclude_folder or not setup_file.exists():
+            continue
+        try:
+            with open(setup_file) as setup_file_handle:
+                setup = yaml.load(setup_file_handle)
+        except Exception as e:
+            print('WARNING: Could not read {}: {}'.format(setup_file, e))
+            continue
+        if setup.get('dataset') != dataset_name or setup.get('realtime') != realtime or \
+                setup.get('fake_dmvio', False) != fake_dmvio:
+            continue
+        for run_folder in results_folder.iterdir():
+            if not (run_folder / 'run_status.yaml').exists():
+                continue
+            run_status = read_run_status(run_folder)
+            if run_status is None or run_status.get('status') != RunStatus.finished or not 'duration' in run_status:
+                continue
+            history.setdefault(get_sequence_name(run_folder.name), []).append(
+                (run_status['duration'], run_status.get('max_rss_mb')))
+    return history
+
+
+def get_run_limits(history, time_margin=2.0, memory_margin=1.5, min_runs=3):
+    """Limits for each sequence: the maximum recorded runtime and peak memory, multiplied with the safety margin.
+    :param min_runs: Sequences with fewer recorded runs get no limits.
+    :return: dict sequence name -> RunLimits
+    """
+    limits = {}
+    for sequence_name, runs in history.items():
+        if len(runs) < min_runs:
+            continue
+        memory = [max_rss_mb for _, max_rss_mb in runs if not max_rss_mb is None]
+        limits[sequence_name] = RunLimits(max(duration for duration, _ in runs) * time_margin,
+                                          max(memory) * memory_margin if len(memory) > 0 else None)
+    return limits
@@ -0,0 +1,347 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Runs DM-VIO and terminates it early when it has clearly diverged (run_dmvio.py --watchdog) or exceeds its time or
+memory limit (run_dmvio.py --limits).
+The output of DM-VIO is passed through (so it can still be saved, filtered and compressed) and checked for resets and
+tracking failures, while scalesdso.txt and result.txt in the results folder of the run are checked for an exploding
+scale and a trajectory far away from the start. The outcome of the run is saved to run_status.yaml in the results
+folder together with the runtime and peak memory, which is used by the evaluation to report killed and crashed runs
+as failed and by run_limits.py to derive the limits of future runs.
+
+Usage: python3 utils/run_watchdog.py --run_folder=<resultsPrefix of the run> [criteria] -- <DM-VIO command>
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from ruamel.yaml import YAML
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from trajectory_evaluation.runoutput import DEFAULT_PATTERNS
+
+RUN_STATUS_FILENAME = 'run_status.yaml'
+
+
+class RunStatus:
+    """Outcome of a run, saved as run_status.yaml in the results folder of the run."""
+    finished = 'finished'
+    crashed = 'crashed'
+    diverged = 'diverged'
+    timeout = 'timeout'
+    memory_limit = 'memory_limit'
+
+
+def write_run_status(run_folder: Path, status, reason=None, **values):
+    run_status = {'status': status, 'reason': reason, 'time': datetime.now().isoformat(timespec='seconds')}
+    run_status.update(values)
+    tmp_file = run_folder / (RUN_STATUS_FILENAME + '.tmp')
+    with open(tmp_file, 'w') as status_file:
+        YAML(typ='safe').dump(run_status, status_file)
+    tmp_file.replace(run_folder / RUN_STATUS_FILENAME)
+
+
+def read_run_status(run_folder: Path):
+    """Return the saved run status (dict) or None if there is none (e.g. because the watchdog was not used)."""
+    status_file = run_folder / RUN_STATUS_FILENAME
+    if not status_file.exists():
+        return None
+    with open(status_file) as status_file_handle:
+        return YAML(typ='safe').load(status_file_handle)
+
+
+class FileTail:
+    """Reads the lines which have been appended to a file since the last call."""
+
+    def __init__(self, filename: Path):
+        self.filename = filename
+        self.position = 0
+        self.rest = b''
+
+    def read_lines(self):
+        try:
+            with open(self.filename, 'rb') as file:
+                if os.fstat(file.fileno()).st_size < self.position:
+                    self.position, self.rest = 0, b''  # File has been rewritten.
+                file.seek(self.position)
+                data = self.rest + file.read()
+                self.position = file.tell()
+        except FileNotFoundError:
+            return []
+        lines = data.split(b'\n')
+        # The last line might be incomplete.
+        self.rest = lines[-1]
+        return [line.decode('utf-8', errors='replace') for line in lines[:-1] if line.strip() != b'']
+
+
+class DivergenceCriteria:
+    """
+    :param max_scale_change: Maximum factor by which the estimated scale may change compared to its first value.
+    :param max_resets: Maximum number of resets and tracking failures reported in the output.
+    :param max_distance: Maximum distance (in meters, after applying the estimated scale) of the trajectory from its
+    start. Only has an effect if result.txt is written while running.
+    """
+
+    def __init__(self, max_scale_change=None, max_resets=None, max_distance=None):
+        self.max_scale_change = max_scale_change
+        self.max_resets = max_resets
+        self.max_distance = max_distance
+
+
+class RunLimits:
+    """
+    :param max_time: Maximum wall time of the run in seconds.
+    :param max_memory_mb: Maximum resident memory of the run in MB.
+    """
+
+    def __init__(self, max_time=None, max_memory_mb=None):
+        self.max_time = max_time
+        self.max_memory_mb = max_memory_mb
+
+
+class Watchdog:
+    def __init__(self, run_folder: Path, criteria: DivergenceCriteria):
+        self.criteria = criteria
+        self.scale_tail = FileTail(run_folder / 'scalesdso.txt')
+        self.result_tail = FileTail(run_folder / 'result.txt')
+        self.first_scale = None
+        self.scale = 1.0
+        self.first_position = None
+        self.num_resets = 0
+        self.reset_patterns = [DEFAULT_PATTERNS.events['reset'], DEFAULT_PATTERNS.events['tracking_lost']]
+
+    def check_output_line(self, line):
+        """Check a line of the output, returning the reason if the run has diverged (otherwise None)."""
+        if self.criteria.max_resets is None or not any(pattern.search(line) for pattern in self.reset_patterns):
+            return None
+        self.num_resets += 1
+        if self.num_resets > self.criteria.max_resets:
+            return '{} resets or tracking failures'.format(self.num_resets)
+        return None
+
+    def check_files(self):
+        """Check the files written by DM-VIO, returning the reason if the run has diverged (otherwise None)."""
+        for line in self.scale_tail.read_lines():
+            try:
+                self.scale = float(line.split(' ')[1])
+            except (IndexError, ValueError):
+                continue
+            if self.first_scale is None:
+                self.first_scale = self.scale
+            if not self.criteria.max_scale_change is None and self.first_scale > 0:
+                change = self.scale / self.first_scale
+                if not 1.0 / self.criteria.max_scale_change <= change <= self.criteria.max_scale_change:
+                    return 'scale changed from {:.3f} to {:.3f}'.format(self.first_scale, self.scale)
+        if not self.criteria.max_distance is None:
+            lines = self.result_tail.read_lines()
+            if len(lines) > 0:
+                positions = np.array([[float(value) for value in line.split()[1:4]] for line in lines])
+                if self.first_position is None:
+                    self.first_position = positions[0]
+                distance = np.linalg.norm(positions - self.first_position, axis=1).max() * self.scale
+                if distance > self.criteria.max_distance:
+                    return 'trajectory is {:.1f} m away from its start'.format(distance)
+        return None
+
+
+def get_watchdog_command(run_folder: Path, criteria: DivergenceCriteria = None, limits: RunLimits = None):
+    """Prefix for a DM-VIO command which runs it with the watchdog."""
+    command = '{} {} --run_folder={}'.format(sys.executable, Path(__file__).resolve(), run_folder)
+    if not criteria is None:
+        if not criteria.max_scale_change is None:
+            command += ' --max_scale_change={}'.format(criteria.max_scale_change)
+        if not criteria.max_resets is None:
+            command += ' --max_resets={}'.format(criteria.max_resets)
+        if not criteria.max_distance is None:
+            command += ' --max_distance={:.1f}'.format(criteria.max_distance)
+    if not limits is None:
+        if not limits.max_time is None:
+            command += ' --max_time={:.1f}'.format(limits.max_time)
+        if not limits.max_memory_mb is None:
+            command += ' --max_memory_mb={:.0f}'.format(limits.max_memory_mb)
+    return command + ' --'
+
+
+def get_groundtruth_extents(dataset_name, groundtruth_folder=None):
+    """Diagonal of the bounding box of the groundtruth trajectory for each sequence (with res_prefix), used to
+    detect trajectories which are far outside of the groundtruth."""
+    from trajectory_evaluation.evaluate import get_dataset, get_groundtruth_data
+    sequences, _ = get_groundtruth_data(get_dataset(dataset_name), groundtruth_folder)
+    extents = {}
+    for sequence in sequences:
+        positions = np.array([[float(value) for value in pose[0:3]] for pose in sequence.groundtruth_data.values()])
+        positions = positions[np.all(np.isfinite(positions), axis=1)]
+        extents[sequence.folder] = float(np.linalg.norm(positions.max(axis=0) - positions.min(axis=0)))
+    return extents
+
+
+def get_rss_mb(pid):
+    """Current resident memory of the process in MB (None if it cannot be read, e.g. not on Linux)."""
+    try:
+        with open('/proc/{}/status'.format(pid)) as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def get_session_rss_mb(session_id):
+    """Current resident memory in MB of all processes in the session, i.e. the command and everything it started
+    (e.g. the program run under gdb). None if it cannot be read, e.g. not on Linux."""
+    total = None
+    for entry in os.scandir('/proc') if os.path.isdir('/proc') else []:
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(entry.name)) as stat_file:
+                # The command name in parentheses can contain spaces, the session is the 4th field after it.
+                session = int(stat_file.read().rsplit(')', 1)[1].split()[3])
+        except (OSError, IndexError, ValueError):
+            continue
+        if session != session_id:
+            continue
+        rss_mb = get_rss_mb(entry.name)
+        if not rss_mb is None:
+            total = rss_mb if total is None else total + rss_mb
+    return total
+
+
+def run_with_watchdog(command, run_folder: Path, criteria: DivergenceCriteria = None, limits: RunLimits = None,
+                      poll_interval=1.0):
+    """Run the command (list of arguments), passing its output through and terminating it when it diverges or
+    exceeds the limits. The outcome, runtime and peak memory are saved to run_status.yaml.
+    :return: exit code of the command.
+    """
+    watchdog = Watchdog(run_folder, DivergenceCriteria() if criteria is None else criteria)
+    limits = RunLimits() if limits is None else limits
+    start_time = time.time()
+    # Own process group, so that all processes started by the command can be terminated together.
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+    termination = []  # (status, reason) once the run is terminated.
+    lock = threading.Lock()
+    finished = threading.Event()
+    peak_rss_mb = [0.0]  # Of all processes of the command, e.g. also of the program it runs under gdb.
+
+    def terminate(status, reason):
+        with lock:
+            if len(termination) > 0:
+                return
+            termination.append((status, reason))
+        print('Watchdog: Terminating run ({}): {}'.format(status, reason), flush=True)
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            if not finished.wait(10):
+                os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # Already finished.
+
+    def monitor():
+        while not finished.wait(poll_interval):
+            if not limits.max_time is None and time.time() - start_time > limits.max_time:
+                terminate(RunStatus.timeout, 'running for more than {:.1f} s'.format(limits.max_time))
+                return
+            rss_mb = get_session_rss_mb(process.pid)
+            if not rss_mb is None:
+                peak_rss_mb[0] = max(peak_rss_mb[0], rss_mb)
+            if not limits.max_memory_mb is None and not rss_mb is None and rss_mb > limits.max_memory_mb:
+                terminate(RunStatus.memory_limit, 'using {:.0f} MB (limit {:.0f} MB)'.format(
+                    rss_mb, limits.max_memory_mb))
+                return
+            reason = watchdog.check_files()
+            if not reason is None:
+                terminate(RunStatus.diverged, reason)
+                return
+
+    monitor_thread = threading.Thread(target=monitor, daemon=True)
+    monitor_thread.start()
+
+    output = sys.stdout.buffer
+    flush_lines = sys.stdout.isatty()
+    for line in process.stdout:
+        output.write(line)
+        if flush_lines:
+            output.flush()
+        if len(termination) == 0:
+            reason = watchdog.check_output_line(line.decode('utf-8', errors='replace'))
+            if not reason is None:
+                threading.Thread(target=terminate, args=(RunStatus.diverged, reason), daemon=True).start()
+    output.flush()
+    # wait4 also returns the resource usage, which is recorded to calibrate the limits of future runs.
+    _, wait_status, resource_usage = os.wait4(process.pid, 0)
+    exit_code = os.waitstatus_to_exitcode(wait_status)
+    process.returncode = exit_code
+    finished.set()
+    monitor_thread.join()
+
+    values = {'exit_code': exit_code, 'duration': time.time() - start_time,
+              # ru_maxrss (in KB on Linux) only covers the direct child, the sampled peak also the processes it started.
+              'max_rss_mb': max(resource_usage.ru_maxrss / 1024.0, peak_rss_mb[0])}
+    if len(termination) > 0:
+        write_run_status(run_folder, termination[0][0], termination[0][1], **values)
+    elif exit_code != 0:
+        write_run_status(run_folder, RunStatus.crashed, 'exit code {}'.format(exit_code), **values)
+    else:
+        write_run_status(run_folder, RunStatus.finished, **values)
+    # Like a shell: 128 + signal number if the command was killed by a signal.
+    return exit_code if exit_code >= 0 else 128 - exit_code
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run DM-VIO and terminate it early if it diverges or exceeds the time or memory limit.')
+    parser.add_argument('--run_folder', type=str, required=True,
+                        help='Folder where DM-VIO writes its results (resultsPrefix).')
+    parser.add_argument('--max_scale_change', type=float, default=None)
+    parser.add_argument('--max_resets', type=int, default=None)
+    parser.add_argument('--max_distance', type=float, default=None)
+    parser.add_argument('--max_time', type=float, default=None, help='Wall time limit in seconds.')
+    parser.add_argument('--max_memory_mb', type=float, default=None, help='Limit for the resident memory in MB.')
+    parser.add_argument('--poll_interval', type=float, default=1.0)
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='DM-VIO command (after --).')
+    args = parser.parse_args()
+
+    command = args.command[1:] if len(args.command) > 0 and args.command[0] == '--' else args.command
+    if len(command) == 0:
+        print('Error: No command given.')
+        sys.exit(1)
+    criteria = DivergenceCriteria(args.max_scale_change, args.max_resets, args.max_distance)
+    limits = RunLimits(args.max_time, args.max_memory_mb)
+    sys.exit(run_with_watchdog(command, Path(args.run_folder), criteria, limits, args.poll_interval))
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,7 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import shutil
 import subprocess
 from pathlib import Path
 from datetime import datetime
@@ -33,6 +34,11 @@ from ruamel.yaml import YAML
 import sys
 
 
+# Entries of setup.yaml which are determined by save_setup.
+AUTO_SETUP_KEYS = ['git_hash', 'commit_message', 'commit_time', 'diff_empty', 'eval_tool_command', 'eval_tools_git_hash',
+                   'eval_tools_commit_message', 'eval_tools_diff_empty']
+
+
 def get_git_log_and_diff(repository_path, git_diff_save_path):
     # Get Git log
     git_hash = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=repository_path).strip().decode('ascii')
@@ -76,19 +82,9 @@ def save_setup(setup, setup_save_folder, dmvio_folder, config, commands):
         'eval_tools_diff_empty': diff_is_empty_eval_tools,
     }
     setup.update(auto_setup)
-
-    # Save commands which will be run.
-    for i, command in enumerate(commands):
-        setup['command_{}'.format(i)] = command.command
-        setup['cwd{}'.format(i)] = str(command.working_dir)
-
+    write_setup_file(setup, setup_file, commands)
     print(setup)
 
-    yaml = YAML()
-    with open(setup_file, 'w') as setup_file_handle:
-        # yaml.dump(setup, setup_file_handle, sort_keys=False)
-        yaml.dump(setup, setup_file_handle)
-
     # Save PC Config
     # Copy manual config:
     config_path = setup_save_folder / 'pcconfig.txt'
@@ -99,3 +95,43 @@ def save_setup(setup, setup_save_folder, dmvio_folder, config, commands):
     if not pc_config_command is None:
         # This runs apt list >> pcconfig.txt on Linux
         subprocess.run('{} >> {}'.format(pc_config_command, config_path), shell=True)
+
+
+def write_setup_file(setup, setup_file, commands):
+    # Save commands which will be run.
+    for i, command in enumerate(commands):
+        setup['command_{}'.format(i)] = command.command
+        setup['cwd{}'.format(i)] = str(command.working_dir)
+
+    yaml = YAML()
+    with open(setup_file, 'w') as setup_file_handle:
+        # yaml.dump(setup, setup_file_handle, sort_keys=False)
+        yaml.dump(setup, setup_file_handle)
+
+
+def save_setup_from_snapshot(setup, setup_save_folder, snapshot_folder, commands):
+    """Like save_setup, but the code versions and PC config are taken from a setup folder already saved with
+    save_setup (e.g. for all configurations of a sweep, which are run with the same build)."""
+    yaml = YAML(typ='safe')
+    with open(snapshot_folder / 'setup.yaml') as snapshot_file:
+        snapshot = yaml.load(snapshot_file)
+    for key in AUTO_SETUP_KEYS:
+        setup[key] = snapshot[key]
+    for filename in ['git_diff.txt', 'eval_tools_git_diff.txt', 'pcconfig.txt']:
+        if (snapshot_folder / filename).exists():
+            shutil.copy2(snapshot_folder / filename, setup_save_folder / filename)
+    write_setup_file(setup, setup_save_folder / 'setup.yaml', commands)
+
+
+def update_setup(setup_save_folder, values):
+    """Update entries of an already saved setup.yaml (e.g. with information only known after running)."""
+    setup_file = setup_save_folder / 'setup.yaml'
+    yaml = YAML()
+    with open(setup_file) as setup_file_handle:
+        setup = yaml.load(setup_file_handle)
+    setup.update(values)
+    tmp_file = setup_save_folder / 'setup.yaml.tmp'
+    with open(tmp_file, 'w') as setup_file_handle:
+        yaml.dump(setup, setup_file_handle)
+    # Replace atomically, as the setup might be read at the same time (e.g. by evaluation_daemon.py).
+    tmp_file.replace(setup_file)
@@ -0,0 +1,103 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import os
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files of a folder like SimpleHTTPRequestHandler, but also supports (single) HTTP range requests, which
+    are needed for resuming downloads.
+    If drop_after is set, each response is cut off after this number of bytes, which can be used to test that
+    interrupted downloads are resumed correctly."""
+
+    drop_after = None
+
+    def send_head(self):
+        range_header = self.headers.get('Range')
+        path = self.translate_path(self.path)
+        if range_header is None or not range_header.startswith('bytes=') or not os.path.isfile(path):
+            self.range = None
+            return super().send_head()
+
+        file_size = os.path.getsize(path)
+        start, end = range_header[len('bytes='):].split('-')
+        start = int(start)
+        end = file_size - 1 if end == '' else min(int(end), file_size - 1)
+        if start >= file_size:
+            self.send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            return None
+        file = open(path, 'rb')
+        file.seek(start)
+        self.range = (start, end)
+        self.send_response(HTTPStatus.PARTIAL_CONTENT)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, file_size))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return file
+
+    def copyfile(self, source, outputfile):
+        remaining = None if self.range is None else self.range[1] - self.range[0] + 1
+        if self.drop_after is not None:
+            remaining = self.drop_after if remaining is None else min(remaining, self.drop_after)
+        while remaining is None or remaining > 0:
+            chunk = source.read(64 * 1024 if remaining is None else min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+
+def serve_mirror(folder, port, drop_after=None):
+    RangeRequestHandler.drop_after = drop_after
+    handler = partial(RangeRequestHandler, directory=str(folder))
+    server = ThreadingHTTPServer(('', port), handler)
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve a local copy of the dataset archives over HTTP (with support for range requests). Pass '
+                    'the printed URL as --base_url to the download scripts to download from it, e.g. for testing '
+                    'or to download from a machine in the local network.')
+    parser.add_argument('--folder', type=str, required=True,
+                        help='Folder to serve, with the same layout as the original download server.')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on.')
+    parser.add_argument('--drop_after', type=int, default=None,
+                        help='Only for testing: interrupt each response after this number of bytes.')
+    args = parser.parse_args()
+
+    server = serve_mirror(args.folder, args.port, args.drop_after)
+    print('Serving {} at http://localhost:{}'.format(args.folder, args.port))
+    server.serve_forever()
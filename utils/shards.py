@@ -0,0 +1,68 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Splitting the runs of a result into shards (run_dmvio.py --shard i/n), which can be run on different machines and
+combined again with merge_shards.py."""
+
+import hashlib
+from pathlib import Path
+
+# Settings which have to be equal for results to be merged into one.
+FINGERPRINT_KEYS = ['dataset', 'build_type', 'num_iter', 'realtime', 'noimu', 'quiet', 'custom_dmvio_args',
+                    'dmvio_settings', 'git_hash', 'diff_empty', 'fake_dmvio', 'groundtruth_folder', 'watchdog',
+                    'adaptive', 'adaptive_ci_width']
+
+
+def parse_shard(shard_string):
+    """'1/4' -> (1, 4). Shard indices start at 0.
+    :return: shard index and number of shards, or None if the string is invalid.
+    """
+    try:
+        shard_index, num_shards = [int(part) for part in shard_string.split('/')]
+    except ValueError:
+        return None
+    if num_shards < 1 or shard_index < 0 or shard_index >= num_shards:
+        return None
+    return shard_index, num_shards
+
+
+def get_shard_runs(sequence_names, num_iter, shard_index, num_shards):
+    """Runs of the shard as list of (sequence name, iteration).
+    The runs are distributed round-robin, so each shard gets a similar share of every sequence.
+    """
+    all_runs = [(sequence_name, iter) for sequence_name in sequence_names for iter in range(num_iter)]
+    return all_runs[shard_index::num_shards]
+
+
+def get_fingerprint(setup, setup_folder: Path):
+    """Fingerprint of the settings of a result, results with the same fingerprint can be merged."""
+    fingerprint = {key: setup.get(key) for key in FINGERPRINT_KEYS}
+    # With a non-empty diff the same git hash doesn't imply the same code.
+    git_diff_file = setup_folder / 'git_diff.txt'
+    fingerprint['git_diff'] = hashlib.sha1(git_diff_file.read_bytes()).hexdigest() if git_diff_file.exists() else None
+    return fingerprint
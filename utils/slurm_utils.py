@@ -30,7 +30,51 @@ import math
 import subprocess
 
 
-def execute_commands_slurm(commands, setup_folder, memory, time, mail_type, num_tasks, num_nodes_passed):
+# The requests are a bit larger than the limits, so that the watchdog terminates the run (and reports the reason)
+# before Slurm kills it.
+def get_time_request_minutes(max_time):
+    return math.ceil((max_time + 60) / 60.0)
+
+
+def get_memory_request_mb(max_memory_mb):
+    return math.ceil(max_memory_mb * 1.1 + 100)
+
+
+def get_limit_arguments(limits, use_memory=True):
+    """srun arguments requesting the time and memory of the RunLimits."""
+    if limits is None:
+        return ''
+    arguments = ''
+    if not limits.max_time is None:
+        arguments += ' --time={}'.format(get_time_request_minutes(limits.max_time))
+    if use_memory and not limits.max_memory_mb is None:
+        arguments += ' --mem={}M'.format(get_memory_request_mb(limits.max_memory_mb))
+    return arguments
+
+
+def get_job_requests(commands, memory, time, num_tasks):
+    """Memory per CPU and time for the whole job. If all commands have limits, these are derived from them instead of
+    using the static slurm_mem and slurm_time of the config.
+    :return: memory, time and whether the memory was derived from the limits.
+    """
+    all_limits = [command.limits for command in commands]
+    memory_derived = len(commands) > 0 and all(
+        not limits is None and not limits.max_memory_mb is None for limits in all_limits)
+    if memory_derived:
+        # Each task has one CPU, so each of them needs the memory of the largest run.
+        memory = '{}M'.format(max(get_memory_request_mb(limits.max_memory_mb) for limits in all_limits))
+    if len(commands) > 0 and all(not limits is None and not limits.max_time is None for limits in all_limits):
+        minutes = [get_time_request_minutes(limits.max_time) for limits in all_limits]
+        # The runs are distributed on num_tasks parallel tasks, which in the worst case finish with the longest run.
+        total_minutes = min(sum(minutes), math.ceil(sum(minutes) / float(num_tasks)) + max(minutes))
+        time = '{}'.format(total_minutes)
+    return memory, time, memory_derived
+
+
+def execute_commands_slurm(commands, setup_folder, memory, time, mail_type, num_tasks, num_nodes_passed,
+                           other_setup_folders=()):
+    """:param other_setup_folders: Setup folders of further results run by the commands (e.g. the configurations of a
+    sweep), which are marked as finished as well."""
     sbatch_filename = setup_folder / 'runscript.sbatch'
     num_commands = len(commands)
     if not num_tasks is None:
@@ -39,6 +83,7 @@ def execute_commands_slurm(commands, setup_folder, memory, time, mail_type, num_
     num_nodes = math.ceil(float(num_commands) / float(tasks_per_node))
     if not num_nodes_passed is None:
         num_nodes = num_nodes_passed
+    memory, time, memory_derived = get_job_requests(commands, memory, time, num_commands)
     with open(sbatch_filename, 'w') as sbatch:
         init_lines = [
             '#!/bin/bash',
@@ -61,7 +106,8 @@ def execute_commands_slurm(commands, setup_folder, memory, time, mail_type, num_
         command_lines = []
         for command in commands:
             command_lines.append('cd {}'.format(command.working_dir))
-            full_comm = '{} {} &'.format(command_prefix, command.command)
+            full_comm = '{}{} {} &'.format(command_prefix, get_limit_arguments(command.limits, memory_derived),
+                                          command.command)
             command_lines.append("echo Executing '{}'".format(full_comm))
             command_lines.append(full_comm)
 
@@ -76,6 +122,7 @@ def execute_commands_slurm(commands, setup_folder, memory, time, mail_type, num_
             move_lines.extend([move_command for move_command in command.post_run_commands])
         move_lines = map(add_newlines, move_lines)
         sbatch.writelines(move_lines)
-        sbatch.write('echo Finished > {}\n'.format(setup_folder / 'Finished.txt'))
+        for folder in [setup_folder] + list(other_setup_folders):
+            sbatch.write('echo Finished > {}\n'.format(folder / 'Finished.txt'))
     print('Starting sbatch file {}'.format(sbatch_filename))
     subprocess.run('sbatch {}'.format(sbatch_filename), shell=True)
@@ -0,0 +1,135 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+
+
+class StageMode(Enum):
+    none = 0
+    shm = 1  # Copy the sequence to a RAM disk (or any other fast folder) and run from there.
+    pagecache = 2  # Read all files once so that they are in the page cache of the OS.
+
+
+def get_files(path: Path):
+    if path.is_dir():
+        return [Path(root) / file for root, _, files in os.walk(path) for file in files]
+    return [path]
+
+
+def get_size(paths):
+    return sum(file.stat().st_size for path in paths for file in get_files(path))
+
+
+def read_into_page_cache(paths):
+    for path in paths:
+        for file in get_files(path):
+            with open(file, 'rb') as file_handle:
+                while file_handle.read(1024 * 1024):
+                    pass
+
+
+def evict_from_page_cache(paths):
+    for path in paths:
+        for file in get_files(path):
+            with open(file, 'rb') as file_handle:
+                os.posix_fadvise(file_handle.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+class StagingCache:
+    """Stages the input files of runs before they are executed, so that DM-VIO does not have to wait for slow reads
+    from a network filesystem or HDD (which matters especially in realtime mode).
+    Staged sequences are kept in a size-bounded LRU cache, so that multiple iterations on the same sequence only stage
+    it once.
+    """
+
+    def __init__(self, mode: StageMode, stage_folder: Path, max_bytes):
+        self.mode = mode
+        self.stage_folder = Path(stage_folder)
+        self.max_bytes = max_bytes
+        self.staged = OrderedDict()  # sequence_folder -> (staged_folder, input_paths, size)
+        self.used_bytes = 0
+
+    def stage(self, sequence_folder: Path, input_paths, working_dir: Path):
+        """Stage the input files of a run.
+        :param sequence_folder: Folder of the sequence, all input_paths inside it are staged.
+        :param input_paths: files and folders read by the run.
+        :param working_dir: working directory of the run.
+        :return: working directory to use for the run.
+        """
+        sequence_folder = Path(os.path.normpath(sequence_folder))
+        if sequence_folder in self.staged:
+            self.staged.move_to_end(sequence_folder)
+            staged_folder = self.staged[sequence_folder][0]
+            return staged_folder / Path(os.path.normpath(working_dir)).relative_to(sequence_folder)
+
+        # Only files inside the sequence folder are staged (calibration files are small anyway).
+        paths = [Path(os.path.normpath(path)) for path in input_paths]
+        paths = [path for path in paths if sequence_folder in path.parents and path.exists()]
+        size = get_size(paths)
+        if size > self.max_bytes:
+            print('WARNING: Not staging {} as it is larger than the staging limit.'.format(sequence_folder))
+            return working_dir
+        while self.used_bytes + size > self.max_bytes:
+            self.evict(next(iter(self.staged)))
+
+        print('Staging {}'.format(sequence_folder))
+        staged_folder = sequence_folder
+        if self.mode == StageMode.shm:
+            staged_folder = self.stage_folder / sequence_folder.name
+            if staged_folder.exists():
+                shutil.rmtree(staged_folder)  # Leftover of an interrupted run.
+            for path in paths:
+                target = staged_folder / path.relative_to(sequence_folder)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if path.is_dir():
+                    shutil.copytree(path, target)
+                else:
+                    shutil.copy2(path, target)
+            (staged_folder / Path(os.path.normpath(working_dir)).relative_to(sequence_folder)).mkdir(parents=True,
+                                                                                                   exist_ok=True)
+        elif self.mode == StageMode.pagecache:
+            read_into_page_cache(paths)
+        self.staged[sequence_folder] = (staged_folder, paths, size)
+        self.used_bytes += size
+        return staged_folder / Path(os.path.normpath(working_dir)).relative_to(sequence_folder)
+
+    def evict(self, sequence_folder):
+        staged_folder, paths, size = self.staged.pop(sequence_folder)
+        if self.mode == StageMode.shm:
+            shutil.rmtree(staged_folder)
+        elif self.mode == StageMode.pagecache:
+            evict_from_page_cache(paths)
+        self.used_bytes -= size
+
+    def evict_all(self):
+        while len(self.staged) > 0:
+            self.evict(next(iter(self.staged)))
@@ -0,0 +1,220 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Parameter sweeps (run_dmvio.py --sweep): a grid or random specification over DM-VIO arguments and settings files is
+expanded into configurations, which are run as separate results with one build and one executor.
+
+Example specification (YAML):
+    mode: grid  # or random, then num_samples (and optionally seed) has to be given.
+    dmvio_args:
+        setting_maxOptIterations: [4, 6, 8]
+        setting_desiredPointDensity: [1000, 1500]
+        # Only with mode random: sampled uniformly (log: true samples the logarithm uniformly).
+        init_requestFullResetNormalizedErrorThreshold: {min: 0.1, max: 1.0, log: false}
+    dmvio_settings: [euroc.yaml, euroc_fast.yaml]  # Optional, relative to DM-VIO-Source-Folder/configs.
+"""
+
+import argparse
+import itertools
+import math
+import sys
+import numpy as np
+from pathlib import Path
+from ruamel.yaml import YAML
+from tabulate import tabulate
+
+SWEEP_INDEX_FILENAME = 'sweep_index.yaml'
+
+
+class SweepConfiguration:
+    """One configuration of a sweep.
+    :param params: dict parameter name -> value (including dmvio_settings if it is swept).
+    """
+
+    def __init__(self, index, params):
+        self.index = index
+        self.params = params
+
+    def get_dmvio_args(self):
+        return ' '.join('{}={}'.format(name, value) for name, value in self.params.items() if name != 'dmvio_settings')
+
+    def get_dmvio_settings(self):
+        return self.params.get('dmvio_settings')
+
+
+def load_sweep_spec(filename):
+    """Load and check a sweep specification. Raises ValueError if it is invalid."""
+    with open(filename) as spec_file:
+        spec = YAML(typ='safe').load(spec_file)
+    if not isinstance(spec, dict):
+        raise ValueError('The specification has to be a dict.')
+    mode = spec.get('mode', 'grid')
+    if not mode in ['grid', 'random']:
+        raise ValueError('Unknown mode {}, expected grid or random.'.format(mode))
+    if mode == 'random' and not isinstance(spec.get('num_samples'), int):
+        raise ValueError('Mode random needs num_samples.')
+    dmvio_args = spec.get('dmvio_args', {})
+    if not isinstance(dmvio_args, dict):
+        raise ValueError('dmvio_args has to map argument names to values.')
+    for name, values in dmvio_args.items():
+        if isinstance(values, dict):
+            if mode == 'grid':
+                raise ValueError('Ranges ({}) are only supported with mode random.'.format(name))
+            if not 'min' in values or not 'max' in values:
+                raise ValueError('The range of {} needs min and max.'.format(name))
+        elif not isinstance(values, list) or len(values) == 0:
+            raise ValueError('The values of {} have to be a non-empty list or a range.'.format(name))
+    if 'dmvio_settings' in spec and (not isinstance(spec['dmvio_settings'], list) or len(spec['dmvio_settings']) == 0):
+        raise ValueError('dmvio_settings has to be a non-empty list.')
+    if len(dmvio_args) == 0 and not 'dmvio_settings' in spec:
+        raise ValueError('Nothing to sweep over.')
+    spec['mode'] = mode
+    return spec
+
+
+def get_sweep_configurations(spec):
+    """Expand the specification (see load_sweep_spec) into a list of SweepConfiguration."""
+    values = dict(spec.get('dmvio_args', {}))
+    if 'dmvio_settings' in spec:
+        values['dmvio_settings'] = spec['dmvio_settings']
+    names = list(values.keys())
+
+    if spec['mode'] == 'grid':
+        all_params = [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+    else:
+        rng = np.random.default_rng(spec.get('seed'))
+
+        def sample(parameter_values):
+            if isinstance(parameter_values, list):
+                return parameter_values[rng.integers(len(parameter_values))]
+            low, high = parameter_values['min'], parameter_values['max']
+            if parameter_values.get('log', False):
+                value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                value = float(rng.uniform(low, high))
+            # Integer ranges stay integers.
+            return int(round(value)) if isinstance(low, int) and isinstance(high, int) else value
+
+        all_params = [{name: sample(values[name]) for name in names} for _ in range(spec['num_samples'])]
+    return [SweepConfiguration(index, params) for index, params in enumerate(all_params)]
+
+
+def get_expected_durations(history, dataset_config, sequence_names):
+    """Expected runtime of a run on each sequence, used to schedule the longest runs first.
+    Uses the median of previous runs (see run_limits.collect_run_history). Sequences without history are estimated
+    from their number of frames, scaled with the average time per frame of the other sequences if available.
+    :return: dict sequence name -> expected duration (relative if no history is available at all).
+    """
+    folders = dataset_config['folder_names']
+    num_frames = {}
+    if 'start_times' in dataset_config and 'end_times' in dataset_config:
+        for folder, start, end in zip(folders, dataset_config['start_times'], dataset_config['end_times']):
+            num_frames[dataset_config['res_prefix'] + folder] = end - start
+    durations = {name: float(np.median([duration for duration, _ in history[name]])) for name in sequence_names if
+                 name in history and len(history[name]) > 0}
+    time_per_frame = [durations[name] / num_frames[name] for name in durations if num_frames.get(name, 0) > 0]
+    time_per_frame = np.mean(time_per_frame) if len(time_per_frame) > 0 else 1.0
+    for name in sequence_names:
+        if not name in durations:
+            durations[name] = num_frames.get(name, 0) * time_per_frame
+    return durations
+
+
+def write_sweep_index(sweep_folder: Path, index):
+    tmp_file = sweep_folder / (SWEEP_INDEX_FILENAME + '.tmp')
+    with open(tmp_file, 'w') as index_file:
+        YAML().dump(index, index_file)
+    tmp_file.replace(sweep_folder / SWEEP_INDEX_FILENAME)
+
+
+def read_sweep_index(sweep_folder: Path):
+    with open(sweep_folder / SWEEP_INDEX_FILENAME) as index_file:
+        return YAML(typ='safe').load(index_file)
+
+
+def evaluate_sweep(sweep_folder: Path, always_reevaluate=False):
+    """Evaluate all finished configurations of the sweep, link their evaluation in the sweep index and print them
+    sorted by error.
+    :return: list of (SweepConfiguration, EvalResults) of the evaluated configurations.
+    """
+    from trajectory_evaluation.evaluate import evaluate_with_config
+    from trajectory_evaluation.results_collection import ResultsCollection, is_normalized
+
+    index = read_sweep_index(sweep_folder)
+    evaluated = []
+    yaml = YAML(typ='safe')
+    for entry in index['configurations']:
+        results_folder = sweep_folder.parent / entry['results_name']
+        if not (results_folder / 'setup' / 'Finished.txt').exists():
+            print('WARNING: Configuration {} has not finished yet.'.format(entry['index']))
+            continue
+        with open(results_folder / 'setup' / 'setup.yaml') as setup_file:
+            setup = yaml.load(setup_file)
+        result, _ = evaluate_with_config((results_folder, setup), always_reevaluate)
+        result.name = 'configuration {}: {}'.format(entry['index'], entry['params'])
+        evaluated.append((SweepConfiguration(entry['index'], entry['params']), result, entry))
+    if len(evaluated) == 0:
+        return []
+
+    collection = ResultsCollection([result for _, result, _ in evaluated])
+    # Like in results_table: rmse for EuRoC, drift otherwise.
+    mean_median_errors = collection.median_errors(is_normalized(collection.dataset)).mean(axis=1)
+    for (_, result, entry), mean_median_error in zip(evaluated, mean_median_errors):
+        entry['evaluation'] = {
+            'file': '{}/setup/evaluation_results.txt'.format(entry['results_name']),
+            'mean_median_error': float(mean_median_error) if math.isfinite(mean_median_error) else None,
+            'num_failed_runs': int(np.count_nonzero(result.errors == np.inf)),
+        }
+    write_sweep_index(sweep_folder, index)
+
+    names = sorted(set(name for configuration, _, _ in evaluated for name in configuration.params))
+    all_data = [['configuration'] + names + ['mean', 'failed runs', 'results']]
+    for i in np.argsort(mean_median_errors, kind='stable'):
+        configuration, _, entry = evaluated[i]
+        all_data.append([configuration.index] + [configuration.params.get(name, '') for name in names] + [
+            round(mean_median_errors[i], 3), entry['evaluation']['num_failed_runs'], entry['results_name']])
+    print(tabulate(all_data, headers='firstrow'))
+    return [(configuration, result) for configuration, result, _ in evaluated]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate all configurations of a sweep (run_dmvio.py --sweep).')
+    parser.add_argument('sweep_folder', type=str, help='Folder of the sweep (containing sweep_index.yaml).')
+    parser.add_argument('--reevaluate', default=False, action='store_true',
+                        help='Evaluate again even if the results have been evaluated already.')
+    args = parser.parse_args()
+    sweep_folder = Path(args.sweep_folder)
+    if not (sweep_folder / SWEEP_INDEX_FILENAME).exists():
+        print('Error: {} does not contain a sweep index.'.format(sweep_folder))
+        sys.exit(1)
+    evaluate_sweep(sweep_folder, args.reevaluate)
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    main()
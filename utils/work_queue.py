@@ -0,0 +1,206 @@
+# BSD 3-Clause License
+#
+# This file is part of the DM-VIO-Python-Tools.
+# https://github.com/lukasvst/dm-vio-python-tools
+#
+# Copyright (c) 2022, Lukas von Stumberg, TUM
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+# following disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Work queue on a shared filesystem for running on several machines without Slurm (run_dmvio.py --queue and
+queue_worker.py).
+Each run is a task file (YAML) in the folder pending/ of the queue. Machine-specific paths in the commands are replaced
+with placeholders (${DATASET_PATH}, ${DMVIO_PATH}, ${EVALPATH}, ${RESULTS_PATH} and ${PYTHON}), which each worker
+resolves with its own config. A worker claims a task by renaming it into running/, which succeeds for exactly one
+worker, and moves it to done/ afterwards. While the task runs, the worker regularly touches the claimed file, so claims
+of crashed workers can be detected by their old modification time and moved back to pending/.
+"""
+
+import os
+import socket
+import time
+from datetime import datetime
+from pathlib import Path
+from ruamel.yaml import YAML
+
+PENDING_FOLDER = 'pending'
+RUNNING_FOLDER = 'running'
+DONE_FOLDER = 'done'
+# Seconds between updates of the modification time of claimed tasks.
+HEARTBEAT_INTERVAL = 60.0
+
+PLACEHOLDERS = ['${DATASET_PATH}', '${DMVIO_PATH}', '${EVALPATH}', '${RESULTS_PATH}', '${PYTHON}']
+
+
+def replace_paths(string, paths):
+    """Replace each path in the string with its placeholder.
+    :param paths: dict placeholder -> path.
+    """
+    # Longer paths first, so that a path inside another one (e.g. the results inside the dataset folder) is replaced
+    # with the more specific placeholder.
+    for placeholder, path in sorted(paths.items(), key=lambda item: len(str(item[1])), reverse=True):
+        string = string.replace(str(path), placeholder)
+    return string
+
+
+def resolve_placeholders(string, paths):
+    """Replace the placeholders in the string with the paths (dict placeholder -> path) of this machine."""
+    for placeholder, path in paths.items():
+        string = string.replace(placeholder, str(path))
+    return string
+
+
+def get_dataset_config(config, general_config, dataset_name):
+    dataset_config = dict(general_config[dataset_name])
+    dataset_config.update(config[dataset_name])
+    return dataset_config
+
+
+def get_machine_paths(config, dataset_config, python_executable):
+    """Paths of this machine for all placeholders."""
+    return {
+        '${DATASET_PATH}': dataset_config['dataset_path'],
+        '${DMVIO_PATH}': config['dmvio_folder'],
+        '${EVALPATH}': Path(__file__).parent.parent.resolve(),
+        '${RESULTS_PATH}': dataset_config['results_path'],
+        '${PYTHON}': python_executable,
+    }
+
+
+def get_task_name(queue_name, index, results_name):
+    # Sorting the task names gives the order in which they were published.
+    return '{}__{:05d}__{}.yaml'.format(queue_name, index, results_name)
+
+
+class WorkQueue:
+    def __init__(self, queue_folder: Path):
+        self.queue_folder = Path(queue_folder)
+        self.pending_folder = self.queue_folder / PENDING_FOLDER
+        self.running_folder = self.queue_folder / RUNNING_FOLDER
+        self.done_folder = self.queue_folder / DONE_FOLDER
+        for folder in [self.pending_folder, self.running_folder, self.done_folder]:
+            folder.mkdir(parents=True, exist_ok=True)
+        self.worker_name = '{}-{}'.format(socket.gethostname(), os.getpid())
+
+    def publish(self, commands, queue_name, dataset_name, paths):
+        """Add a task for each RunCommand, the tasks are claimed in this order.
+        :param queue_name: Prefix for the task files (e.g. the results name, or the name of the sweep).
+        :param paths: dict placeholder -> path on this machine, used to make the tasks machine-independent.
+        """
+        yaml = YAML(typ='safe')
+        for index, command in enumerate(commands):
+            results_name = command.results_folder.name
+            task = {
+                'results_name': results_name,
+                'dataset': dataset_name,
+                'run_name': command.run_name,
+                'command': replace_paths(command.command, paths),
+                'working_dir': replace_paths(str(command.working_dir), paths),
+                'post_run_commands': [replace_paths(move_command, paths) for move_command in
+                                      command.post_run_commands],
+            }
+            task_name = get_task_name(queue_name, index, results_name)
+            # Written under a different name first, so that workers never see incomplete tasks.
+            tmp_file = self.pending_folder / ('.' + task_name + '.tmp')
+            with open(tmp_file, 'w') as task_file:
+                yaml.dump(task, task_file)
+            tmp_file.replace(self.pending_folder / task_name)
+        print('Published {} tasks to {}.'.format(len(commands), self.pending_folder))
+
+    def claim(self, datasets=None):
+        """Claim the oldest pending task.
+        :param datasets: If not None only tasks on these datasets are claimed (e.g. the ones in the config of this
+        machine).
+        :return: (claimed file, task dict) or None if there are no pending tasks.
+        """
+        yaml = YAML(typ='safe')
+        for task_name in sorted(name for name in os.listdir(self.pending_folder) if name.endswith('.yaml') and
+                                not name.startswith('.')):
+            claimed_file = self.running_folder / '{}.{}'.format(task_name, self.worker_name)
+            try:
+                if not datasets is None:
+                    with open(self.pending_folder / task_name) as task_file:
+                        if not yaml.load(task_file)['dataset'] in datasets:
+                            continue
+                # Rename is atomic, so if several workers try to claim the same task, only one succeeds.
+                os.rename(self.pending_folder / task_name, claimed_file)
+            except FileNotFoundError:
+                continue  # Claimed by another worker.
+            # The rename keeps the modification time of the pending file, so set it to the time the task was claimed.
+            self.heartbeat(claimed_file)
+            with open(claimed_file) as task_file:
+                return claimed_file, yaml.load(task_file)
+        return None
+
+    def heartbeat(self, claimed_file: Path):
+        """Mark the claimed task as still running (see requeue_stale)."""
+        try:
+            os.utime(claimed_file)
+        except FileNotFoundError:
+            pass  # Has been requeued in the meantime.
+
+    def requeue_stale(self, max_age):
+        """Move claimed tasks whose worker has not sent a heartbeat for max_age seconds (e.g. because its machine
+        crashed) back to pending/.
+        :return: number of requeued tasks.
+        """
+        now = time.time()
+        num_requeued = 0
+        for name in os.listdir(self.running_folder):
+            if name.startswith('.') or not '.yaml.' in name:
+                continue
+            claimed_file = self.running_folder / name
+            task_name = name[:name.index('.yaml.') + len('.yaml')]
+            try:
+                if now - claimed_file.stat().st_mtime < max_age:
+                    continue
+                # Atomic like claiming, so each stale claim is only requeued once.
+                os.rename(claimed_file, self.pending_folder / task_name)
+            except FileNotFoundError:
+                continue  # Finished or requeued by another worker.
+            print('WARNING: Requeued stale task {} (claimed by {}).'.format(task_name, name[len(task_name) + 1:]))
+            num_requeued += 1
+        return num_requeued
+
+    def finish(self, claimed_file: Path, task, exit_code, start_time):
+        """Move the claimed task to done/, recording which worker ran it.
+        :return: True if this was the last task of its results folder.
+        """
+        task.update({'worker': self.worker_name, 'exit_code': exit_code, 'started': start_time.isoformat(
+            timespec='seconds'), 'finished': datetime.now().isoformat(timespec='seconds')})
+        task_name = claimed_file.name[:-len(self.worker_name) - 1]
+        tmp_file = self.done_folder / ('.' + task_name + '.tmp')
+        with open(tmp_file, 'w') as task_file:
+            YAML(typ='safe').dump(task, task_file)
+        tmp_file.replace(self.done_folder / task_name)
+        try:
+            claimed_file.unlink()
+        except FileNotFoundError:
+            print('WARNING: Task {} has been requeued as stale while it was running.'.format(task_name))
+        return self.num_open_tasks(task['results_name']) == 0
+
+    def num_open_tasks(self, results_name):
+        """Number of pending and running tasks of the results folder."""
+        suffix = '__{}.yaml'.format(results_name)
+        # Running tasks have the name of the worker appended.
+        return sum(1 for folder in [self.pending_folder, self.running_folder] for name in os.listdir(folder) if
+                   not name.startswith('.') and (name.endswith(suffix) or suffix + '.' in name))